@@ -5,27 +5,182 @@ This module provides the application factory pattern for creating Flask app inst
 Routes are organized in separate blueprint modules in the routes package.
 """
 
+import uuid
+from typing import Dict, Optional
 from flask import Flask
-from database import init_database, add_sample_data
+import database
+from database import init_database, add_sample_data, set_group_commit_writer
 from routes import register_blueprints
+from services.response_cache import ResponseCache
+from services.group_commit import GroupCommitWriter
+from services.reminders import ReminderScheduler
+from services.holds import HoldExpiryTimer
+from services.request_profiler import RequestProfiler
+from services.memory_diagnostics import MemoryDiagnostics
+from services.availability_bus import AvailabilityBus
+from services.backup import BackupScheduler
+from services.maintenance import MaintenanceScheduler
+from services.catalog_snapshot import CatalogSnapshot, snapshot_path
+from services.suggest import SuggestIndex
 
 
-def create_app():
+def create_app(config: Optional[Dict] = None):
     """
     Application factory function to create and configure Flask app.
-    
+
+    Args:
+        config: Optional configuration overrides applied on top of the defaults
+
     Returns:
         Flask: Configured Flask application instance
     """
     app = Flask(__name__)
     app.secret_key = "super secret key"
-    
-    # Initialize the database
-    init_database()
-    
-    # Add sample data for testing and demonstration
-    add_sample_data()
-    
+
+    # Default configuration
+    app.config.update(
+        RESPONSE_CACHE_ENABLED=True,
+        RESPONSE_CACHE_MAX_ENTRIES=256,
+        RESPONSE_CACHE_MAX_BYTES=16 * 1024 * 1024,
+        RESPONSE_CACHE_GZIP=True,
+        GROUP_COMMIT_ENABLED=False,
+        GROUP_COMMIT_MAX_BATCH=64,
+        GROUP_COMMIT_MAX_LATENCY_MS=2,
+        # Patron shard files for this app's borrow records (None keeps database.SHARD_COUNT)
+        LOAN_SHARD_COUNT=None,
+        DATABASE=None,
+        DATABASE_POOL_MAX_IDLE=8,
+        REMINDER_SCHEDULER_ENABLED=False,
+        REMINDER_DUE_SOON_DAYS=2,
+        REMINDER_TICK_SECONDS=60,
+        HOLD_EXPIRY_ENABLED=False,
+        PROFILING_ENABLED=False,
+        PROFILE_SAMPLE_RATE=0.01,
+        PROFILE_HEADER='X-Profile',
+        PROFILE_OUTPUT_DIR=None,
+        MEMORY_DIAGNOSTICS_ENABLED=False,
+        AVAILABILITY_STREAM_ENABLED=False,
+        AVAILABILITY_REPLAY_SIZE=1000,
+        AVAILABILITY_HEARTBEAT_SECONDS=15,
+        AVAILABILITY_STREAM_MAX_SECONDS=300,
+        BACKUP_ENABLED=False,
+        BACKUP_DIR='backups',
+        BACKUP_INTERVAL_SECONDS=24 * 60 * 60,
+        BACKUP_KEEP=7,
+        BACKUP_PAGES_PER_STEP=256,
+        BACKUP_STEP_SLEEP_MS=10,
+        MAINTENANCE_ENABLED=False,
+        MAINTENANCE_WINDOW='02:00-05:00',
+        MAINTENANCE_BUDGET_SECONDS=60,
+        MAINTENANCE_MAX_REQUESTS_PER_MINUTE=30,
+        SEARCH_BACKEND='sqlite',
+        CATALOG_SNAPSHOT_PATH=None,
+        SUGGEST_RANK_WINDOW='year',
+        SUGGEST_REFRESH_SECONDS=5,
+        SUGGEST_RANK_REFRESH_SECONDS=300,
+    )
+    if config:
+        app.config.update(config)
+
+    # Rendered-page cache for the catalog and search views
+    if app.config['RESPONSE_CACHE_ENABLED']:
+        app.extensions['response_cache'] = ResponseCache(
+            max_entries=app.config['RESPONSE_CACHE_MAX_ENTRIES'],
+            max_bytes=app.config['RESPONSE_CACHE_MAX_BYTES'],
+            gzip_enabled=app.config['RESPONSE_CACHE_GZIP'],
+        )
+
+    # Give this app (tenant) its own database and connection pool; without a
+    # DATABASE setting it uses the module-level database.DATABASE
+    if app.config['DATABASE']:
+        app.config['DATABASE'] = database.resolve_database_uri(app.config['DATABASE'], f'library-{uuid.uuid4().hex}')
+        app.extensions['db_pool'] = database.ConnectionPool(
+            app.config['DATABASE'],
+            max_idle=app.config['DATABASE_POOL_MAX_IDLE'],
+        )
+
+    if app.config['SEARCH_BACKEND'] not in ('sqlite', 'snapshot'):
+        raise ValueError(f"Unknown SEARCH_BACKEND '{app.config['SEARCH_BACKEND']}'; use 'sqlite' or 'snapshot'.")
+
+    with app.app_context():
+        read_only = database.is_read_only(database.current_database())
+
+        if not read_only:
+            # Initialize the database
+            init_database()
+
+            # Add sample data for testing and demonstration
+            add_sample_data()
+
+        # Optionally funnel all write transactions through one group-commit writer
+        if app.config['GROUP_COMMIT_ENABLED'] and not read_only:
+            writer = GroupCommitWriter(
+                max_batch=app.config['GROUP_COMMIT_MAX_BATCH'],
+                max_latency=app.config['GROUP_COMMIT_MAX_LATENCY_MS'] / 1000,
+            ).start()
+            set_group_commit_writer(writer)
+            app.extensions['group_commit_writer'] = writer
+
+        # Optionally scan for due-soon and overdue loans and queue reminders in the outbox
+        if app.config['REMINDER_SCHEDULER_ENABLED'] and not read_only:
+            app.extensions['reminder_scheduler'] = ReminderScheduler(
+                due_soon_days=app.config['REMINDER_DUE_SOON_DAYS'],
+                tick_seconds=app.config['REMINDER_TICK_SECONDS'],
+            ).start()
+
+        # Optionally expire held copies that were not picked up in time
+        if app.config['HOLD_EXPIRY_ENABLED'] and not read_only:
+            app.extensions['hold_expiry_timer'] = HoldExpiryTimer().start()
+
+        # Optionally push availability changes to /api/availability/stream subscribers
+        if app.config['AVAILABILITY_STREAM_ENABLED']:
+            app.extensions['availability_bus'] = AvailabilityBus(
+                replay_size=app.config['AVAILABILITY_REPLAY_SIZE'],
+            ).start()
+
+        # Optionally take throttled online snapshots on an interval, with rotation
+        if app.config['BACKUP_ENABLED']:
+            BackupScheduler(
+                backup_dir=app.config['BACKUP_DIR'],
+                interval=app.config['BACKUP_INTERVAL_SECONDS'],
+                keep=app.config['BACKUP_KEEP'],
+                pages=app.config['BACKUP_PAGES_PER_STEP'],
+                step_sleep=app.config['BACKUP_STEP_SLEEP_MS'] / 1000,
+            ).init_app(app).start()
+
+        # Optionally ANALYZE, vacuum, checkpoint and check the database in quiet windows
+        if app.config['MAINTENANCE_ENABLED'] and not read_only:
+            MaintenanceScheduler(
+                window=app.config['MAINTENANCE_WINDOW'],
+                budget=app.config['MAINTENANCE_BUDGET_SECONDS'],
+                max_requests_per_minute=app.config['MAINTENANCE_MAX_REQUESTS_PER_MINUTE'],
+            ).init_app(app).start()
+
+        # Optionally search a memory-mapped catalog snapshot shared by all workers
+        if app.config['SEARCH_BACKEND'] == 'snapshot':
+            app.extensions['catalog_snapshot'] = CatalogSnapshot(
+                app.config['CATALOG_SNAPSHOT_PATH'] or snapshot_path(database.current_database())
+            )
+
+    # Typeahead index behind /api/suggest, built from the catalog on first use
+    app.extensions['suggest_index'] = SuggestIndex(
+        rank_window=app.config['SUGGEST_RANK_WINDOW'],
+        refresh_seconds=app.config['SUGGEST_REFRESH_SECONDS'],
+        rank_refresh_seconds=app.config['SUGGEST_RANK_REFRESH_SECONDS'],
+    )
+
+    # Optionally profile sampled (or explicitly requested) requests with cProfile
+    if app.config['PROFILING_ENABLED']:
+        RequestProfiler(
+            sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+            header=app.config['PROFILE_HEADER'],
+            output_dir=app.config['PROFILE_OUTPUT_DIR'],
+        ).init_app(app)
+
+    # Optionally expose tracemalloc controls, snapshots and per-request peaks
+    if app.config['MEMORY_DIAGNOSTICS_ENABLED']:
+        MemoryDiagnostics().init_app(app)
+
     # Register all route blueprints
     register_blueprints(app)
     
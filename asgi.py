@@ -0,0 +1,16 @@
+"""
+ASGI entry point for the Library Management System.
+
+The async API (/api/async/...) is served natively on the ASGI server's event
+loop by AsyncApi, so requests waiting on the payment gateway hold no thread;
+everything else goes to the Flask application through an ASGI adapter. Serve
+with an ASGI server, e.g.:
+    uvicorn asgi:asgi_app --workers 4
+"""
+
+from asgiref.wsgi import WsgiToAsgi
+from app import create_app
+from routes.async_routes import AsyncApi
+
+app = create_app()
+asgi_app = AsyncApi(app, WsgiToAsgi(app))
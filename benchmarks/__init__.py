@@ -0,0 +1,3 @@
+"""
+Benchmarks Package - Performance measurements for the Library Management System
+"""
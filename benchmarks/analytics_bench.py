@@ -0,0 +1,109 @@
+"""
+Analytics Benchmark - Top-N ranking latency over the daily circulation aggregates
+Seeds a scratch database with the daily and rolling-window aggregates that a
+given number of loans spread over a number of days and books would produce,
+then times the top-books and top-authors rankings for each rolling window
+against a latency target.
+
+Usage:
+    python -m benchmarks.analytics_bench --loans 10000000 --books 20000 --days 365
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import database
+from database import CIRCULATION_WINDOWS, init_database, rebuild_circulation_windows
+from services.analytics import get_top_books, get_top_authors
+from benchmarks.group_commit_bench import percentile
+
+
+def seed(loans: int, books: int, days: int, authors: int, seed_value: int) -> int:
+    """Insert books and the aggregates of loans borrowed over the last days; returns daily aggregate rows."""
+    rng = random.Random(seed_value)
+    conn = database.get_db_connection()
+    conn.executemany(
+        'INSERT INTO books (id, title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, ?, 1, 1)',
+        [(i, f"Title {i}", f"Author {i % authors}", f"{i:013d}") for i in range(1, books + 1)]
+    )
+
+    # Skewed popularity: a few titles account for most loans
+    weights = [1 / rank for rank in range(1, books + 1)]
+    today = datetime.now().date()
+    rows = 0
+    per_day = loans // days
+    for offset in range(days):
+        day = (today - timedelta(days=offset)).isoformat()
+        counts = {}
+        for book_id in rng.choices(range(1, books + 1), weights=weights, k=min(per_day, books * 4)):
+            counts[book_id] = counts.get(book_id, 0) + 1
+        scale = per_day / max(1, sum(counts.values()))
+        conn.executemany(
+            'INSERT INTO daily_circulation (day, book_id, author, borrows, returns) VALUES (?, ?, ?, ?, ?)',
+            [
+                (day, book_id, f"Author {book_id % authors}", max(1, round(count * scale)), max(1, round(count * scale)))
+                for book_id, count in counts.items()
+            ]
+        )
+        rows += len(counts)
+    rebuild_circulation_windows(conn, datetime.now())
+    conn.commit()
+    conn.close()
+    return rows
+
+
+def time_ranking(function, window: str, n: int, repeats: int) -> Dict:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(window, n)
+        samples.append(time.perf_counter() - start)
+    return {
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--loans', type=int, default=10_000_000, help='loans represented by the aggregates')
+    parser.add_argument('--books', type=int, default=20_000)
+    parser.add_argument('--authors', type=int, default=5_000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--n', type=int, default=10, help='ranking size')
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--target-ms', type=float, default=10.0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    database.DATABASE = db_path
+    try:
+        init_database()
+        aggregate_rows = seed(args.loans, args.books, args.days, args.authors, args.seed)
+        results = []
+        for window in CIRCULATION_WINDOWS:
+            for name, function in (('top_books', get_top_books), ('top_authors', get_top_authors)):
+                result = time_ranking(function, window, args.n, args.repeats)
+                result.update(ranking=name, window=window, within_target=result['p50_ms'] <= args.target_ms)
+                results.append(result)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+    print(json.dumps({'loans': args.loans, 'aggregate_rows': aggregate_rows, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Async Gateway Benchmark - Concurrent payment connections over the ASGI path
+Opens N simultaneous POST /api/async/pay_late_fee connections against the
+simulated payment gateway (0.5 s round trip) and serves them two ways: the
+Flask async views behind asgiref's WsgiToAsgi adapter, which hold a thread
+for each request for the whole gateway call, and AsyncApi, which serves the
+same endpoints natively on the event loop (as asgi.py does).
+
+Connections are driven in-process through the ASGI interface on one event
+loop, without sockets, so the numbers show how many gateway calls each path
+keeps in flight rather than network overhead.
+
+Usage:
+    python -m benchmarks.async_gateway_bench --connections 40
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from asgiref.wsgi import WsgiToAsgi
+import database
+from database import init_database, insert_book, insert_borrow_record
+from app import create_app
+from routes.async_routes import ASYNC_PREFIX, AsyncApi
+from services.async_library_service import shutdown_db_executor
+from benchmarks.group_commit_bench import percentile
+
+
+def seed(connections: int) -> List[str]:
+    """Create one overdue loan per simulated patron and return the patron IDs."""
+    insert_book("Overdue Title", "Author", "9999999999999", connections, connections)
+    borrow_date = datetime.now() - timedelta(days=20)
+    patron_ids = [f"{300000 + i}" for i in range(connections)]
+    for patron_id in patron_ids:
+        insert_borrow_record(patron_id, 1, borrow_date, borrow_date + timedelta(days=14))
+    return patron_ids
+
+
+async def post(asgi_app, path: str) -> int:
+    """Send one bodiless POST through an ASGI app; returns the response status."""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'localhost')], 'server': ('localhost', 80), 'client': ('127.0.0.1', 50000)
+    }
+    await asgi_app(scope, receive, send)
+    return messages[0]['status']
+
+
+def run_mode(mode: str, asgi_app, patron_ids: List[str]) -> Dict:
+    latencies = []
+
+    async def connection(patron_id):
+        started = time.perf_counter()
+        status = await post(asgi_app, f'{ASYNC_PREFIX}/pay_late_fee/{patron_id}/1')
+        latencies.append(time.perf_counter() - started)
+        return status
+
+    async def connect_all():
+        return await asyncio.gather(*(connection(patron_id) for patron_id in patron_ids))
+
+    start = time.perf_counter()
+    statuses = asyncio.run(connect_all())
+    elapsed = time.perf_counter() - start
+    shutdown_db_executor()
+    return {
+        'mode': mode,
+        'connections': len(statuses),
+        'succeeded': statuses.count(200),
+        'elapsed_seconds': round(elapsed, 3),
+        'requests_per_second': round(len(statuses) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--connections', type=int, default=40, help='simultaneous payment requests')
+    args = parser.parse_args()
+
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    database.DATABASE = db_path
+    try:
+        init_database()
+        patron_ids = seed(args.connections)
+        app = create_app({'DATABASE': db_path, 'RESPONSE_CACHE_ENABLED': False})
+        flask_app = WsgiToAsgi(app)
+        results = [
+            run_mode('flask-async-views', flask_app, patron_ids),
+            run_mode('native-asgi', AsyncApi(app, flask_app), patron_ids)
+        ]
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Benchmark Data Generator - Seeded synthetic library at a chosen scale
+Fills a database with books, patrons and loan histories drawn from a fixed
+random seed, so every run at the same scale and seed produces the same
+catalog and the same loans (dates are laid out relative to the day of the
+run, so overdue counts do not drift as the calendar moves on).
+
+Loan histories follow a simple model of real circulation: title popularity
+and patron activity are Zipf-skewed, most loans come back within the
+14-day loan period, a minority come back late with an exponentially
+distributed delay, and a small share are never returned and sit overdue.
+
+Usage:
+    python -m benchmarks.datagen --scale 100k --database bench.db
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Dict, Iterator, NamedTuple, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import database
+from database import init_database, rebuild_circulation_windows, rebuild_daily_circulation
+
+
+class Scale(NamedTuple):
+    books: int
+    patrons: int
+    loans: int
+
+
+# Named dataset sizes, by number of loans
+SCALES = {
+    '10k': Scale(books=1_000, patrons=1_000, loans=10_000),
+    '100k': Scale(books=10_000, patrons=10_000, loans=100_000),
+    '1m': Scale(books=100_000, patrons=100_000, loans=1_000_000),
+}
+
+# Days of history the loans are spread over, ending today
+HISTORY_DAYS = 365
+
+LOAN_DAYS = 14
+
+# Borrowing limit enforced by borrow_book_by_patron
+MAX_OPEN_LOANS = 5
+
+# Share of loans returned late, mean lateness in days, and share never returned
+LATE_RETURN_RATE = 0.15
+MEAN_DAYS_LATE = 5.0
+UNRETURNED_RATE = 0.02
+
+_ADJECTIVES = ('Silent', 'Hidden', 'Golden', 'Broken', 'Distant', 'Crimson', 'Quiet', 'Lost',
+               'Endless', 'Burning', 'Secret', 'Frozen', 'Wild', 'Last', 'Shadow', 'Iron')
+_NOUNS = ('River', 'Garden', 'Empire', 'Kingdom', 'Voyage', 'Mirror', 'Harbor', 'Orchard',
+          'Tower', 'Storm', 'Letter', 'Forest', 'Winter', 'Machine', 'Island', 'Promise')
+_FIRST_NAMES = ('Ada', 'James', 'Maya', 'Oscar', 'Lena', 'Victor', 'Nora', 'Samuel',
+                'Iris', 'Hugo', 'Clara', 'Felix', 'Ruth', 'Arthur', 'Zadie', 'Tomas')
+_LAST_NAMES = ('Okafor', 'Lindqvist', 'Moreau', 'Tanaka', 'Reyes', 'Novak', 'Brennan', 'Haddad',
+               'Kowalski', 'Achebe', 'Larsen', 'Ferreira', 'Ishida', 'Mbeki', 'Quinn', 'Varga')
+
+
+def patron_id(index: int) -> str:
+    """Library card ID of the index-th generated patron."""
+    return f"{100000 + index:06d}"
+
+
+def book_row(book_id: int, rng: random.Random) -> Tuple[int, str, str, str]:
+    """(id, title, author, isbn) of a generated book."""
+    title = f"The {rng.choice(_ADJECTIVES)} {rng.choice(_NOUNS)} {book_id}"
+    author = f"{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}"
+    return book_id, title, author, f"{9780000000000 + book_id:013d}"
+
+
+def generate_loans(rng: random.Random, scale: Scale, today: datetime) -> Iterator[Tuple[str, int, str, str, str]]:
+    """Yield (patron_id, book_id, borrow_date, due_date, return_date or None) in borrow order."""
+    book_weights = list(accumulate(1 / rank for rank in range(1, scale.books + 1)))
+    patron_weights = list(accumulate(1 / rank ** 0.5 for rank in range(1, scale.patrons + 1)))
+    books = range(1, scale.books + 1)
+    patrons = range(scale.patrons)
+    start = today - timedelta(days=HISTORY_DAYS)
+    step = HISTORY_DAYS * 86400 / scale.loans
+    open_loans = {}
+
+    for offset in range(scale.loans):
+        patron = patron_id(rng.choices(patrons, cum_weights=patron_weights)[0])
+        borrowed = start + timedelta(seconds=offset * step + rng.random() * step)
+        due = borrowed + timedelta(days=LOAN_DAYS)
+        outcome = rng.random()
+        if outcome < UNRETURNED_RATE:
+            returned = None
+        elif outcome < UNRETURNED_RATE + LATE_RETURN_RATE:
+            returned = due + timedelta(days=rng.expovariate(1 / MEAN_DAYS_LATE))
+        else:
+            returned = borrowed + timedelta(days=rng.uniform(1, LOAN_DAYS))
+        if returned is not None and returned > today:
+            returned = None
+        # Patrons never hold more than MAX_OPEN_LOANS books at once
+        if returned is None:
+            if open_loans.get(patron, 0) >= MAX_OPEN_LOANS:
+                returned = min(today, borrowed + timedelta(days=rng.uniform(1, LOAN_DAYS)))
+            else:
+                open_loans[patron] = open_loans.get(patron, 0) + 1
+        yield (
+            patron,
+            rng.choices(books, cum_weights=book_weights)[0],
+            borrowed.isoformat(),
+            due.isoformat(),
+            returned.isoformat() if returned else None
+        )
+
+
+def generate(scale: Scale, seed: int, today: datetime = None) -> Dict:
+    """
+    Fill the current (freshly initialized) database with a generated library.
+
+    Books get enough copies for their open loans plus a few on the shelf, and
+    the circulation aggregates are rebuilt from the loans afterwards.
+
+    Returns:
+        dict: Row counts of the generated dataset and the seconds taken
+    """
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    today = today or datetime.combine(datetime.now().date(), datetime.min.time())
+    books = [book_row(book_id, rng) for book_id in range(1, scale.books + 1)]
+    loans = list(generate_loans(rng, scale, today))
+
+    out = {}
+    for _, book_id, _, _, returned in loans:
+        if returned is None:
+            out[book_id] = out.get(book_id, 0) + 1
+    shelf = [rng.randint(0, 3) for _ in books]
+
+    conn = database.get_db_connection()
+    conn.executemany(
+        'INSERT INTO books (id, title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, ?, ?, ?)',
+        [
+            (*book, out.get(book[0], 0) + max(1, on_shelf), max(1, on_shelf))
+            for book, on_shelf in zip(books, shelf)
+        ]
+    )
+    conn.executemany(
+        'INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date) VALUES (?, ?, ?, ?, ?)',
+        loans
+    )
+    rebuild_daily_circulation(conn)
+    rebuild_circulation_windows(conn, today)
+    conn.commit()
+    conn.close()
+
+    now = today.isoformat()
+    open_loans = [loan for loan in loans if loan[4] is None]
+    return {
+        'books': scale.books,
+        'patrons': scale.patrons,
+        'loans': scale.loans,
+        'open_loans': len(open_loans),
+        'overdue_loans': sum(1 for loan in open_loans if loan[3] < now),
+        'seed': seed,
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='10k')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database', required=True, help='Database file to create (must not exist)')
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        parser.error(f"{args.database} already exists")
+    database.DATABASE = args.database
+    init_database()
+    print(json.dumps(generate(SCALES[args.scale], args.seed), indent=2))
+
+
+if __name__ == '__main__':
+    main()
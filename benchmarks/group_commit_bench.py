@@ -0,0 +1,117 @@
+"""
+Group Commit Benchmark - Direct writes vs the single-writer group-commit queue
+Runs concurrent borrow/return traffic through services.library_service against
+a scratch database and reports committed operations per second and latency
+percentiles for each mode.
+
+Usage:
+    python -m benchmarks.group_commit_bench --threads 16 --operations 200
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import database
+from database import init_database, insert_book, set_group_commit_writer
+from services.group_commit import GroupCommitWriter
+from services.library_service import borrow_book_by_patron, return_book_by_patron
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_workload(threads: int, operations: int) -> Dict:
+    """Each thread alternately borrows and returns one copy of a shared title."""
+    latencies = []
+    latencies_lock = threading.Lock()
+    failures = []
+    barrier = threading.Barrier(threads)
+
+    def worker(patron_id: str):
+        local = []
+        barrier.wait()
+        for i in range(operations):
+            operation = borrow_book_by_patron if i % 2 == 0 else return_book_by_patron
+            start = time.perf_counter()
+            success, message = operation(patron_id, 1)
+            local.append(time.perf_counter() - start)
+            if not success:
+                failures.append(message)
+        with latencies_lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(f"{200000 + i}",)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'operations': len(latencies),
+        'failures': len(failures),
+        'elapsed_seconds': round(elapsed, 4),
+        'operations_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3)
+    }
+
+
+def benchmark(mode: str, threads: int, operations: int, max_latency_ms: float) -> Dict:
+    """Run the workload against a fresh database in the given mode."""
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    database.DATABASE = db_path
+    init_database()
+    insert_book("Benchmark Title", "Author", "9999999999999", threads, threads)
+
+    writer = None
+    if mode == 'group':
+        writer = GroupCommitWriter(max_latency=max_latency_ms / 1000).start()
+        set_group_commit_writer(writer)
+    try:
+        result = run_workload(threads, operations)
+    finally:
+        set_group_commit_writer(None)
+        if writer is not None:
+            writer.stop()
+            result['writer'] = writer.stats()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+    result['mode'] = mode
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--operations', type=int, default=200, help='borrow/return calls per thread')
+    parser.add_argument('--max-latency-ms', type=float, default=2.0, help='group-commit batching window')
+    args = parser.parse_args()
+
+    results = [
+        benchmark(mode, args.threads, args.operations, args.max_latency_ms)
+        for mode in ('direct', 'group')
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""
+HTTP Load Test - Concurrent clients replaying a request mix against the app
+Starts create_app() on a local threaded server over a generated library (see
+benchmarks.datagen), or targets an already running server with --url, then
+has many client threads send a weighted mix of catalog, search, borrow,
+return and late-fee requests over keep-alive connections. Reports
+throughput, latency percentiles, status codes and error rates per endpoint.
+
+Each client draws its requests from the seed, so runs with the same options
+send the same traffic; --baseline compares the results with a saved run and
+exits non-zero if an endpoint's latency or error rate regressed beyond the
+thresholds.
+
+Usage:
+    python -m benchmarks.load_test --clients 16 --requests 200 --output load.json
+    python -m benchmarks.load_test --mix catalog=1,api_search=3,borrow=1,return=1 --baseline load.json
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from werkzeug.serving import make_server
+import database
+from app import create_app
+from benchmarks.datagen import SCALES, generate, patron_id
+from benchmarks.group_commit_bench import percentile
+from benchmarks.service_bench import compare_results, environment
+
+# Format version of the JSON results; bump when fields change meaning
+RESULTS_VERSION = 1
+
+# Default share of each endpoint in the request mix
+DEFAULT_MIX = {'catalog': 10, 'search': 15, 'api_search': 30, 'borrow': 15, 'return': 15, 'late_fee': 15}
+
+_SEARCH_TERMS = (('silent', 'title'), ('river', 'title'), ('golden garden', 'title'),
+                 ('ada', 'author'), ('tanaka', 'author'), ('nora reyes', 'author'))
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse "endpoint=weight,..." into a weight per endpoint."""
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in DEFAULT_MIX:
+            raise ValueError(f"Unknown endpoint '{name.strip()}'; choose from {', '.join(DEFAULT_MIX)}.")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class Client:
+    """One simulated user: a keep-alive connection and the books it has out."""
+
+    def __init__(self, host: str, port: int, index: int, seed: int, scale):
+        self.host, self.port = host, port
+        self.rng = random.Random(seed * 100003 + index)
+        self.scale = scale
+        # A card of its own past the generated patrons, so borrows stay under the limit
+        self.patron_id = patron_id(scale.patrons + index)
+        self.borrowed = []
+        self.conn = None
+
+    def request(self, endpoint: str) -> Tuple[str, str, str, Optional[Dict]]:
+        """
+        (endpoint, method, path, form fields or None) of the next request to an
+        endpoint; a borrow by a client already at the borrowing limit becomes a return.
+        """
+        book_id = self.rng.randint(1, self.scale.books)
+        if endpoint == 'catalog':
+            return endpoint, 'GET', '/catalog', None
+        if endpoint in ('search', 'api_search'):
+            term, search_type = self.rng.choice(_SEARCH_TERMS)
+            prefix = '/search' if endpoint == 'search' else '/api/search'
+            return endpoint, 'GET', f"{prefix}?{urlencode({'q': term, 'type': search_type})}", None
+        if endpoint == 'borrow':
+            if len(self.borrowed) >= 5:
+                endpoint = 'return'
+            else:
+                self.borrowed.append(book_id)
+                return endpoint, 'POST', '/borrow', {'patron_id': self.patron_id, 'book_id': book_id}
+        if endpoint == 'return':
+            if self.borrowed:
+                book_id = self.borrowed.pop(self.rng.randrange(len(self.borrowed)))
+            return endpoint, 'POST', '/return', {'patron_id': self.patron_id, 'book_id': book_id}
+        patron = patron_id(self.rng.randrange(self.scale.patrons))
+        return endpoint, 'GET', f'/api/late_fee/{patron}/{book_id}', None
+
+    def send(self, method: str, path: str, form: Optional[Dict]) -> int:
+        """Send one request and read the whole response; returns the status code."""
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        body = urlencode(form) if form else None
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'} if form else {}
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            raise
+        if response.getheader('Connection', '').lower() == 'close':
+            self.conn.close()
+            self.conn = None
+        return response.status
+
+
+def run_load(host: str, port: int, mix: Dict[str, float], clients: int, requests: int,
+             seed: int, scale) -> Tuple[Dict[str, List], float]:
+    """Run every client to completion; returns (samples per endpoint, elapsed seconds)."""
+    samples = {endpoint: [] for endpoint in DEFAULT_MIX}
+    samples_lock = threading.Lock()
+    barrier = threading.Barrier(clients)
+    names, weights = list(mix), list(mix.values())
+
+    def worker(index: int):
+        client = Client(host, port, index, seed, scale)
+        local = {endpoint: [] for endpoint in DEFAULT_MIX}
+        barrier.wait()
+        for endpoint in client.rng.choices(names, weights, k=requests):
+            endpoint, method, path, form = client.request(endpoint)
+            started = time.perf_counter()
+            try:
+                status = client.send(method, path, form)
+            except (OSError, http.client.HTTPException):
+                status = None
+            local[endpoint].append((time.perf_counter() - started, status))
+        if client.conn is not None:
+            client.conn.close()
+        with samples_lock:
+            for endpoint, results in local.items():
+                samples[endpoint].extend(results)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples: List[Tuple[float, Optional[int]]], elapsed: float) -> Dict:
+    """Throughput, latency percentiles (ms), status codes and error rate of one endpoint."""
+    latencies = [latency for latency, _ in samples]
+    statuses = {}
+    for _, status in samples:
+        key = str(status) if status is not None else 'connection_error'
+        statuses[key] = statuses.get(key, 0) + 1
+    # Server errors and failed connections; 4xx answers are valid responses to replayed traffic
+    errors = sum(1 for _, status in samples if status is None or status >= 500)
+    return {
+        'requests': len(samples),
+        'requests_per_second': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'status_codes': statuses
+    }
+
+
+def start_local_server(scale_name: str, seed: int, response_cache: bool):
+    """Serve create_app() over a freshly generated library; returns (server, database path)."""
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    database.DATABASE = db_path
+    database.init_database()
+    generate(SCALES[scale_name], seed)
+    app = create_app({'RESPONSE_CACHE_ENABLED': response_cache})
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='load-test-server', daemon=True).start()
+    return server, db_path
+
+
+def check_regressions(baseline: Dict, current: Dict, tolerance: float, metric: str,
+                      max_error_rate_increase: float) -> List[Dict]:
+    """Latency comparison per endpoint (see compare_results), also flagging error-rate increases."""
+    comparison = compare_results(baseline, current, tolerance, metric)
+    for entry in comparison:
+        before = baseline['benchmarks'][entry['benchmark']]['error_rate']
+        after = current['benchmarks'][entry['benchmark']]['error_rate']
+        entry['error_rate_change'] = round(after - before, 4)
+        entry['regressed'] = entry['regressed'] or after - before > max_error_rate_increase
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='Target an already running server instead of starting one '
+                                      '(it should serve a library generated at --scale/--seed)')
+    parser.add_argument('--scale', choices=SCALES, default='10k')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help='endpoint=weight,... (default: %(default)s)')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200, help='requests per client')
+    parser.add_argument('--no-response-cache', action='store_true', help='Disable the rendered-page cache')
+    parser.add_argument('--output', help='Also write the results to this file')
+    parser.add_argument('--baseline', help='Results file of an earlier run to compare against')
+    parser.add_argument('--metric', choices=('p50_ms', 'p95_ms', 'p99_ms'), default='p95_ms')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed latency increase, as a fraction')
+    parser.add_argument('--max-error-rate-increase', type=float, default=0.01)
+    args = parser.parse_args()
+
+    server = db_path = None
+    if args.url:
+        target = urlsplit(args.url)
+        host, port = target.hostname, target.port or 80
+    else:
+        server, db_path = start_local_server(args.scale, args.seed, not args.no_response_cache)
+        host, port = '127.0.0.1', server.server_port
+    try:
+        samples, elapsed = run_load(host, port, args.mix, args.clients, args.requests, args.seed, SCALES[args.scale])
+    finally:
+        if server is not None:
+            server.shutdown()
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(db_path + suffix):
+                    os.unlink(db_path + suffix)
+
+    all_samples = [sample for results in samples.values() for sample in results]
+    results = {
+        'suite': 'http_load',
+        'version': RESULTS_VERSION,
+        'scale': args.scale,
+        'seed': args.seed,
+        'clients': args.clients,
+        'requests_per_client': args.requests,
+        'mix': args.mix,
+        'environment': environment(),
+        'elapsed_seconds': round(elapsed, 3),
+        'overall': summarize(all_samples, elapsed),
+        'benchmarks': {endpoint: summarize(results, elapsed) for endpoint, results in samples.items() if results}
+    }
+
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        run_options = ('scale', 'seed', 'clients', 'requests_per_client', 'mix')
+        if any(baseline.get(option) != results[option] for option in run_options):
+            parser.error("The baseline was run with different scale, seed, clients, requests or mix.")
+        results['comparison'] = check_regressions(baseline, results, args.tolerance, args.metric,
+                                                  args.max_error_rate_increase)
+        regressed = any(entry['regressed'] for entry in results['comparison'])
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
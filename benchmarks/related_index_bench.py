@@ -0,0 +1,120 @@
+"""
+Related Index Benchmark - Build and refresh time of the co-borrow index
+Fills a scratch database with synthetic borrowing histories (patrons mostly
+borrow within one of a number of topic clusters, with skewed title
+popularity), then times a full build of the co-borrow index, an incremental
+refresh after a further batch of loans, and related-book lookups.
+
+Usage:
+    python -m benchmarks.related_index_bench --loans 10000000 --patrons 1000000 --books 50000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import database
+from database import init_database
+from services.recommendations import build_related_index, refresh_related_index, get_related
+from benchmarks.group_commit_bench import percentile
+
+
+def generate_loans(rng: random.Random, count: int, patrons: int, books: int, clusters: int, start_id: int):
+    """Yield (id, patron_id, book_id, borrow_date) rows of synthetic loans."""
+    cluster_size = books // clusters
+    cum_weights = list(accumulate(1 / rank for rank in range(1, cluster_size + 1)))
+    titles = range(cluster_size)
+    base = datetime(2020, 1, 1)
+    for offset in range(count):
+        patron = rng.randrange(patrons)
+        # 80% of a patron's loans come from their own cluster
+        cluster = patron % clusters if rng.random() < 0.8 else rng.randrange(clusters)
+        book_id = cluster * cluster_size + rng.choices(titles, cum_weights=cum_weights)[0] + 1
+        yield (start_id + offset, f"{100000 + patron:06d}", book_id,
+               (base + timedelta(minutes=start_id + offset)).isoformat())
+
+
+def seed(args, rng: random.Random) -> float:
+    """Insert the books and the synthetic history; returns seconds taken."""
+    started = time.perf_counter()
+    conn = database.get_db_connection()
+    conn.executemany(
+        'INSERT INTO books (id, title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, ?, 1, 1)',
+        [(i, f"Title {i}", f"Author {i % 1000}", f"{i:013d}") for i in range(1, args.books + 1)]
+    )
+    conn.executemany(
+        '''INSERT INTO borrow_history (id, patron_id, book_id, borrow_date, due_date, return_date)
+           VALUES (?, ?, ?, ?, ?4, ?4)''',
+        generate_loans(rng, args.loans, args.patrons, args.books, args.clusters, 1)
+    )
+    conn.commit()
+    conn.close()
+    return time.perf_counter() - started
+
+
+def add_recent_loans(args, rng: random.Random) -> None:
+    """Record a further batch of open loans after the history."""
+    conn = database.get_db_connection()
+    conn.execute("INSERT OR REPLACE INTO sqlite_sequence (name, seq) VALUES ('borrow_records', ?)", (args.loans,))
+    conn.executemany(
+        '''INSERT INTO borrow_records (id, patron_id, book_id, borrow_date, due_date)
+           VALUES (?, ?, ?, ?, ?4)''',
+        generate_loans(rng, args.refresh_loans, args.patrons, args.books, args.clusters, args.loans + 1)
+    )
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--loans', type=int, default=10_000_000)
+    parser.add_argument('--patrons', type=int, default=1_000_000)
+    parser.add_argument('--books', type=int, default=50_000)
+    parser.add_argument('--clusters', type=int, default=50)
+    parser.add_argument('--refresh-loans', type=int, default=10_000, help='loans added before the incremental refresh')
+    parser.add_argument('--lookups', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    database.DATABASE = db_path
+    try:
+        init_database()
+        seed_seconds = seed(args, rng)
+        build = build_related_index()
+        add_recent_loans(args, rng)
+        refresh = refresh_related_index()
+
+        samples = []
+        for _ in range(args.lookups):
+            book_id = rng.randint(1, args.books)
+            started = time.perf_counter()
+            get_related(book_id)
+            samples.append(time.perf_counter() - started)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+    print(json.dumps({
+        'loans': args.loans,
+        'seed_seconds': round(seed_seconds, 3),
+        'build': build,
+        'refresh': refresh,
+        'lookup_p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'lookup_p99_ms': round(percentile(samples, 99) * 1000, 3)
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""
+Service Benchmark Suite - Timed service-layer calls over a generated library
+Generates a seeded dataset (see benchmarks.datagen) at the chosen scale, then
+times each service function on its own (micro-benchmarks) and a mixed
+catalog/patron/circulation workload (macro-benchmark). Arguments for every
+call are drawn from the same seed, so two runs at one scale and seed do the
+same work and their JSON results can be compared; --baseline does that and
+exits non-zero if any benchmark's median got slower than the tolerance.
+
+Usage:
+    python -m benchmarks.service_bench --scale 100k --output results.json
+    python -m benchmarks.service_bench --scale 100k --baseline results.json --tolerance 0.25
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import database
+from database import init_database
+from services.library_service import (
+    borrow_book_by_patron, calculate_late_fee_for_book, get_availability_batch,
+    get_patron_status_report, return_book_by_patron, search_books_in_catalog
+)
+from benchmarks.datagen import SCALES, generate, patron_id
+from benchmarks.group_commit_bench import percentile
+
+# Format version of the JSON results; bump when fields change meaning
+RESULTS_VERSION = 1
+
+# Share of each operation in the macro-benchmark's mixed workload
+WORKLOAD_MIX = (('search', 0.55), ('status_report', 0.15), ('late_fee', 0.1),
+                ('availability', 0.1), ('borrow_return', 0.1))
+
+
+def summarize(samples: List[float]) -> Dict:
+    """Latency percentiles (ms) and throughput of a list of call durations in seconds."""
+    total = sum(samples)
+    return {
+        'iterations': len(samples),
+        'mean_ms': round(total / len(samples) * 1000, 3),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'ops_per_second': round(len(samples) / total, 1) if total else 0.0
+    }
+
+
+def time_calls(function: Callable, arguments: Sequence[Tuple], warmup: int = 3) -> Dict:
+    """Call function(*args) for each argument tuple and summarize the durations."""
+    for args in arguments[:warmup]:
+        function(*args)
+    samples = []
+    for args in arguments:
+        started = time.perf_counter()
+        function(*args)
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def borrow_then_return(patron: str, book_id: int) -> None:
+    borrow_book_by_patron(patron, book_id)
+    return_book_by_patron(patron, book_id)
+
+
+class Workload:
+    """Seeded call arguments for each benchmarked service function."""
+
+    def __init__(self, rng: random.Random, scale, iterations: int):
+        book_ids = [rng.randint(1, scale.books) for _ in range(iterations)]
+        patrons = [patron_id(rng.randrange(scale.patrons)) for _ in range(iterations)]
+        # Patrons past the generated ones, so borrows never hit the borrowing limit
+        self.bench_patrons = [patron_id(scale.patrons + i % 1000) for i in range(iterations)]
+        self.search_title = [(rng.choice(('silent', 'river', 'golden garden', 'storm 1')), 'title')
+                             for _ in range(iterations)]
+        self.search_author = [(rng.choice(('ada', 'tanaka', 'nora reyes', 'quinn')), 'author')
+                              for _ in range(iterations)]
+        self.search_isbn = [(f"{9780000000000 + book_id:013d}", 'isbn') for book_id in book_ids]
+        self.status_report = [(patron,) for patron in patrons]
+        self.late_fee = list(zip(patrons, book_ids))
+        self.availability = [([rng.randint(1, scale.books) for _ in range(50)],) for _ in range(iterations)]
+        self.borrow_return = list(zip(self.bench_patrons, book_ids))
+        self.mix = rng.choices([name for name, _ in WORKLOAD_MIX], [share for _, share in WORKLOAD_MIX],
+                               k=iterations * 4)
+
+
+def run_micro(workload: Workload) -> Dict:
+    return {
+        'search_title': time_calls(search_books_in_catalog, workload.search_title),
+        'search_author': time_calls(search_books_in_catalog, workload.search_author),
+        'search_isbn': time_calls(search_books_in_catalog, workload.search_isbn),
+        'patron_status_report': time_calls(get_patron_status_report, workload.status_report),
+        'late_fee': time_calls(calculate_late_fee_for_book, workload.late_fee),
+        'availability_batch_50': time_calls(get_availability_batch, workload.availability),
+        'borrow_and_return': time_calls(borrow_then_return, workload.borrow_return),
+    }
+
+
+def run_macro(workload: Workload) -> Dict:
+    """Run the mixed workload in its seeded order; report overall and per-operation latency."""
+    operations = {
+        'search': (search_books_in_catalog, workload.search_title + workload.search_author + workload.search_isbn),
+        'status_report': (get_patron_status_report, workload.status_report),
+        'late_fee': (calculate_late_fee_for_book, workload.late_fee),
+        'availability': (get_availability_batch, workload.availability),
+        'borrow_return': (borrow_then_return, workload.borrow_return),
+    }
+    samples = {name: [] for name in operations}
+    for position, name in enumerate(workload.mix):
+        function, arguments = operations[name]
+        args = arguments[position % len(arguments)]
+        started = time.perf_counter()
+        function(*args)
+        samples[name].append(time.perf_counter() - started)
+
+    result = {'mixed_workload': summarize([sample for durations in samples.values() for sample in durations])}
+    for name, durations in samples.items():
+        if durations:
+            result[f'mixed_workload.{name}'] = summarize(durations)
+    return result
+
+
+def compare_results(baseline: Dict, current: Dict, tolerance: float, metric: str = 'p50_ms') -> List[Dict]:
+    """
+    Compare the benchmarks of two result documents.
+
+    Returns:
+        list: One entry per benchmark present in both, with the metric from
+              each run, the relative change and whether it regressed by more
+              than tolerance (a fraction, e.g. 0.2 for 20% slower)
+    """
+    if baseline.get('version') != current.get('version'):
+        raise ValueError("Results were written by different versions of the benchmark.")
+    comparison = []
+    for name, result in current['benchmarks'].items():
+        before = baseline['benchmarks'].get(name)
+        if before is None or not before[metric]:
+            continue
+        change = (result[metric] - before[metric]) / before[metric]
+        comparison.append({
+            'benchmark': name,
+            'baseline': before[metric],
+            'current': result[metric],
+            'change': round(change, 3),
+            'regressed': change > tolerance
+        })
+    return comparison
+
+
+def environment() -> Dict:
+    return {
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'processor': platform.machine()
+    }
+
+
+def run_suite(scale_name: str, seed: int, iterations: int) -> Dict:
+    """Generate the dataset into a scratch database and run every benchmark against it."""
+    scale = SCALES[scale_name]
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    database.DATABASE = db_path
+    try:
+        init_database()
+        dataset = generate(scale, seed)
+        workload = Workload(random.Random(seed), scale, iterations)
+        benchmarks = run_micro(workload)
+        benchmarks.update(run_macro(workload))
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+    return {
+        'suite': 'service',
+        'version': RESULTS_VERSION,
+        'scale': scale_name,
+        'seed': seed,
+        'iterations': iterations,
+        'environment': environment(),
+        'dataset': dataset,
+        'benchmarks': benchmarks
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='10k')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=200, help='calls per micro-benchmark')
+    parser.add_argument('--output', help='Also write the results to this file')
+    parser.add_argument('--baseline', help='Results file of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed median slowdown, as a fraction')
+    args = parser.parse_args()
+
+    results = run_suite(args.scale, args.seed, args.iterations)
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline.get('scale'), baseline.get('seed')) != (args.scale, args.seed):
+            parser.error("The baseline was run at a different scale or seed.")
+        results['comparison'] = compare_results(baseline, results, args.tolerance)
+        regressed = any(entry['regressed'] for entry in results['comparison'])
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
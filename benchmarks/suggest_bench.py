@@ -0,0 +1,119 @@
+"""
+Suggest Benchmark - Typeahead latency of the prefix index on a large catalog
+Fills a scratch database with synthetic titles made of common words (so short
+prefixes match large parts of the catalog) and Zipf-skewed yearly borrow
+totals, then times the index build and title/author completions of prefixes
+typed one keystroke at a time against a p99 latency target.
+
+Usage:
+    python -m benchmarks.suggest_bench --books 1000000 --borrowed 200000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import database
+from database import init_database
+from services.suggest import SuggestIndex
+from benchmarks.group_commit_bench import percentile
+
+WORDS = (
+    'the', 'a', 'of', 'night', 'house', 'river', 'shadow', 'garden', 'silent', 'last', 'winter', 'stone',
+    'city', 'secret', 'history', 'love', 'war', 'star', 'little', 'lost', 'empire', 'sea', 'fire', 'light',
+    'dark', 'queen', 'journey', 'letters', 'mountain', 'island', 'daughter', 'glass', 'iron', 'paper',
+    'whisper', 'kingdom', 'storm', 'summer', 'forest', 'memory', 'road', 'tale', 'book', 'song', 'world'
+)
+
+
+def seed(args, rng: random.Random) -> None:
+    """Insert the books and the yearly borrow totals of a skewed subset of them."""
+    conn = database.get_db_connection()
+
+    def books():
+        for book_id in range(1, args.books + 1):
+            title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).title()
+            yield book_id, f"{title} {book_id}", f"Author {book_id % args.authors}", f"{book_id:013d}"
+
+    conn.executemany(
+        'INSERT INTO books (id, title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, ?, 1, 1)',
+        books()
+    )
+    borrowed = rng.sample(range(1, args.books + 1), args.borrowed)
+    conn.executemany(
+        "INSERT INTO circulation_window_totals (period, book_id, borrows) VALUES ('year', ?, ?)",
+        [(book_id, max(1, int(1000 / rank))) for rank, book_id in enumerate(borrowed, start=1)]
+    )
+    conn.executemany(
+        "INSERT INTO circulation_author_totals (period, author, borrows) VALUES ('year', ?, ?)",
+        [(f"Author {n}", rng.randint(1, 500)) for n in range(args.authors)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def keystrokes(rng: random.Random, count: int, books: int):
+    """Yield (type, prefix) lookups: the first 1-12 characters of random titles and authors."""
+    conn = database.get_db_connection()
+    for _ in range(count):
+        row = conn.execute('SELECT title, author FROM books WHERE id = ?', (rng.randint(1, books),)).fetchone()
+        suggest_type = 'author' if rng.random() < 0.2 else 'title'
+        text = row[suggest_type]
+        yield suggest_type, text[:rng.randint(1, min(12, len(text)))]
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--books', type=int, default=1_000_000)
+    parser.add_argument('--authors', type=int, default=50_000)
+    parser.add_argument('--borrowed', type=int, default=200_000, help='books with borrows in the ranking window')
+    parser.add_argument('--lookups', type=int, default=20_000)
+    parser.add_argument('--target-ms', type=float, default=2.0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    database.DATABASE = db_path
+    try:
+        init_database()
+        seed(args, rng)
+        lookups = list(keystrokes(rng, args.lookups, args.books))
+
+        index = SuggestIndex(refresh_seconds=float('inf'), rank_refresh_seconds=float('inf'))
+        started = time.perf_counter()
+        index.suggest('a')
+        build_seconds = time.perf_counter() - started
+
+        samples = []
+        for suggest_type, prefix in lookups:
+            started = time.perf_counter()
+            index.suggest(prefix, suggest_type)
+            samples.append(time.perf_counter() - started)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+    p99_ms = percentile(samples, 99) * 1000
+    print(json.dumps({
+        'books': args.books,
+        'build_seconds': round(build_seconds, 3),
+        'lookups': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p99_ms': round(p99_ms, 3),
+        'max_ms': round(max(samples) * 1000, 3),
+        'within_target': p99_ms <= args.target_ms
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,22 +3,415 @@ Database module for Library Management System
 Handles all database operations and connections
 """
 
+import contextvars
+import heapq
+import json
+import os
+import random
 import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from flask import current_app, has_app_context
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar('T')
 
 # Database configuration
 DATABASE = 'library.db'
 
+# Maximum number of values bound into a single IN (...) list
+SQL_IN_CHUNK_SIZE = 500
+
+# Seconds a connection waits on a locked database before raising
+BUSY_TIMEOUT_SECONDS = 2.0
+
+# Lock-error retry policy for write transactions (see retry_on_lock)
+WRITE_RETRY_DEADLINE_SECONDS = 10.0
+RETRY_BASE_DELAY_SECONDS = 0.01
+RETRY_MAX_DELAY_SECONDS = 0.5
+
+# Seconds run_write waits for a group-commit writer to run a queued operation
+# (well past WRITE_RETRY_DEADLINE_SECONDS, so only a stuck writer hits it)
+GROUP_COMMIT_TIMEOUT_SECONDS = 30.0
+
+# Number of patron shard files holding borrow_records (0 keeps loans in
+# DATABASE); an app's LOAN_SHARD_COUNT setting overrides it (see shard_count)
+SHARD_COUNT = 0
+
+# Rolling circulation windows in days, ending today (see record_circulation)
+CIRCULATION_WINDOWS = {'day': 1, 'week': 7, 'month': 30, 'year': 365}
+
+# Days a patron has to pick up a copy held for them (see release_copy)
+HOLD_PICKUP_DAYS = 3
+
+# Columns of the books table, in schema order
+BOOK_COLUMNS = ('id', 'title', 'author', 'isbn', 'total_copies', 'available_copies')
+
+# Columns of each table recorded in change_log by the change-data triggers
+CHANGE_LOG_TABLES = {
+    'books': BOOK_COLUMNS,
+    'borrow_records': ('id', 'patron_id', 'book_id', 'borrow_date', 'due_date', 'return_date'),
+}
+
 def get_db_connection():
-    """Get a database connection."""
-    conn = sqlite3.connect(DATABASE)
+    """Get a database connection (from the current app's pool when it has one)."""
+    if has_app_context():
+        pool = current_app.extensions.get('db_pool')
+        if pool is not None:
+            return pool.acquire()
+    return connect(current_database())
+
+def current_database() -> str:
+    """
+    Get the database URI helpers should use.
+
+    Inside an app context this is the app's DATABASE setting, so several apps
+    (tenants) can serve different libraries from one process; otherwise it is
+    the module-level DATABASE.
+    """
+    if has_app_context():
+        database = current_app.config.get('DATABASE')
+        if database:
+            return database
+    return DATABASE
+
+def resolve_database_uri(database: str, name: str) -> str:
+    """
+    Turn a configured database into the URI used to open it.
+
+    ':memory:' becomes a named shared-cache in-memory database, so every
+    connection of one tenant sees the same data while other tenants get their
+    own. File paths and 'file:' URIs (e.g. 'file:library.db?mode=ro') are
+    returned unchanged.
+    """
+    if database == ':memory:':
+        return f'file:{name}?mode=memory&cache=shared'
+    return database
+
+def is_read_only(database: str) -> bool:
+    """Whether a database URI opens the database read-only."""
+    return database.startswith('file:') and 'mode=ro' in database.partition('?')[2].split('&')
+
+def connect(database: str, check_same_thread: bool = True, factory=sqlite3.Connection) -> sqlite3.Connection:
+    """Open a connection to a specific database file or 'file:' URI with the standard settings."""
+    conn = sqlite3.connect(database, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=check_same_thread,
+                           factory=factory, uri=database.startswith('file:'))
     conn.row_factory = sqlite3.Row  # This enables column access by name
     return conn
 
+class PooledConnection(sqlite3.Connection):
+    """Connection handed out by a ConnectionPool; close() gives it back to the pool."""
+
+    pool = None
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+class ConnectionPool:
+    """
+    Reusable connections to one tenant's database.
+
+    Connections may be used by any thread, but only by one caller at a time
+    (between get_db_connection() and close()). An extra anchor connection is
+    held open for the life of the pool so that in-memory databases are not
+    discarded when the last borrowed connection is returned.
+    """
+
+    def __init__(self, database: str, max_idle: int = 8):
+        """
+        Args:
+            database: Database file path or 'file:' URI
+            max_idle: Most idle connections kept for reuse; extras are closed
+        """
+        self.database = database
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._anchor = connect(database, check_same_thread=False)
+
+    def acquire(self) -> PooledConnection:
+        """Get an idle connection, or open a new one."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        conn = connect(self.database, check_same_thread=False, factory=PooledConnection)
+        conn.pool = self
+        return conn
+
+    def release(self, conn: PooledConnection) -> None:
+        """Return a connection, discarding any transaction it left open."""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if self._anchor is not None and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        sqlite3.Connection.close(conn)
+
+    def close(self) -> None:
+        """Close every idle connection and the anchor; borrowed ones close on release."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            anchor, self._anchor = self._anchor, None
+        for conn in idle:
+            sqlite3.Connection.close(conn)
+        if anchor is not None:
+            anchor.close()
+
+# Patron Sharding
+#
+# With shard_count() > 0, borrow_records live in that many extra database files
+# chosen by a stable hash of patron_id, while books stay in the shared catalog
+# (current_database()). Read connections to a shard attach the catalog as
+# "catalog" so joins against books keep working unchanged.
+#
+# Availability is coordinated by reserve-then-record: a borrow first takes a
+# copy in its own short catalog transaction and only then writes the loan to
+# the patron's shard; if the shard transaction rolls back, the copy is put
+# back. A return closes the loan in the shard and releases the copy once the
+# shard has committed. The catalog write lock is therefore only held for a
+# single UPDATE, and borrows for patrons on different shards commit in
+# parallel. Locks are always taken shard first, catalog second.
+
+class ShardConnection(sqlite3.Connection):
+    """Connection to one loan shard, tracking catalog copies moved by its transaction."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reserved_copies = []  # book IDs taken from the catalog (undo on rollback)
+        self.released_copies = []  # book IDs to give back to the catalog after commit
+        self.claimed_holds = []    # ready holds picked up from the catalog (undo on rollback)
+
+def shard_count() -> int:
+    """
+    Get the number of loan shard files: the app's LOAN_SHARD_COUNT setting
+    inside an app context, so apps in one process keep their own layout,
+    otherwise the module-level SHARD_COUNT.
+    """
+    if has_app_context():
+        count = current_app.config.get('LOAN_SHARD_COUNT')
+        if count is not None:
+            return count
+    return SHARD_COUNT
+
+def sharding_enabled() -> bool:
+    """Whether borrow_records are split across patron shard files."""
+    return shard_count() > 0
+
+def shard_for_patron(patron_id: str) -> int:
+    """Get the shard index holding a patron's loans (stable across processes)."""
+    return zlib.crc32(patron_id.encode('utf-8')) % shard_count()
+
+def shard_path(index: int) -> str:
+    """Get the file path of a loan shard, derived from the catalog path."""
+    database = current_database()
+    if database.startswith('file:'):
+        raise ValueError("Loan sharding requires the catalog to be a plain database file path.")
+    root, ext = os.path.splitext(database)
+    return f'{root}.shard{index}{ext or ".db"}'
+
+def connect_shard(index: int, attach_catalog: bool = True) -> ShardConnection:
+    """
+    Open a connection to a loan shard.
+
+    Write transactions should use attach_catalog=False: BEGIN IMMEDIATE locks
+    every attached database, and shard writes must not hold the catalog lock.
+    """
+    conn = connect(shard_path(index), factory=ShardConnection)
+    if attach_catalog:
+        conn.execute('ATTACH DATABASE ? AS catalog', (current_database(),))
+    return conn
+
+def library_databases() -> List[Tuple[Optional[int], str]]:
+    """Get (shard index, or None for the catalog, and URI) of every database of the library."""
+    return [(None, current_database())] + [(index, shard_path(index)) for index in range(shard_count())]
+
+def get_loan_connection(patron_id: str) -> sqlite3.Connection:
+    """Get a read connection to the database holding a patron's borrow records."""
+    if not sharding_enabled():
+        return get_db_connection()
+    return connect_shard(shard_for_patron(patron_id))
+
+_shard_reader_pool = None
+_shard_reader_pool_size = 0
+_shard_reader_lock = threading.Lock()
+
+def scatter_gather(query: str, params: Sequence = ()) -> List[List[sqlite3.Row]]:
+    """
+    Run a read query against every database holding borrow records.
+
+    Shards are queried in parallel on a shared thread pool (each with the
+    catalog attached). Returns one row list per shard, in shard order, so
+    callers can merge per-shard ordered results.
+    """
+    if not sharding_enabled():
+        conn = get_db_connection()
+        rows = conn.execute(query, params).fetchall()
+        conn.close()
+        return [rows]
+
+    global _shard_reader_pool, _shard_reader_pool_size
+    count = shard_count()
+    with _shard_reader_lock:
+        if _shard_reader_pool_size < count:
+            # Grow to the widest layout seen; queries already submitted to the
+            # old pool finish before its threads exit
+            if _shard_reader_pool is not None:
+                _shard_reader_pool.shutdown(wait=False)
+            _shard_reader_pool = ThreadPoolExecutor(max_workers=count, thread_name_prefix='shard-reader')
+            _shard_reader_pool_size = count
+        pool = _shard_reader_pool
+
+    def query_shard(index):
+        conn = connect_shard(index)
+        try:
+            return conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+    futures = [
+        pool.submit(contextvars.copy_context().run, query_shard, index)
+        for index in range(count)
+    ]
+    return [future.result() for future in futures]
+
+# Write Contention Handling
+
+class ContentionCounters:
+    """Thread-safe counters describing lock contention seen by write operations."""
+
+    FIELDS = ('lock_errors', 'retries', 'recovered', 'exhausted', 'deferred_releases')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def increment(self, field: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counts[field] += amount
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts = dict.fromkeys(self.FIELDS, 0)
+
+contention_counters = ContentionCounters()
+
+# Optional single-writer queue used by run_write (see set_group_commit_writer)
+_group_commit_writer = None
+
+def is_lock_error(error: BaseException) -> bool:
+    """Whether an exception means another connection holds the database lock."""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return 'database is locked' in message or 'database table is locked' in message or 'database is busy' in message
+
+def retry_on_lock(operation: Callable[[], T], deadline: Optional[float] = None) -> T:
+    """
+    Call operation(), retrying lock errors with bounded, jittered exponential backoff.
+
+    Args:
+        operation: Zero-argument callable; it must be safe to re-run from scratch
+        deadline: Seconds to keep retrying for (defaults to WRITE_RETRY_DEADLINE_SECONDS)
+
+    Returns:
+        The operation's result
+
+    Raises:
+        sqlite3.OperationalError: The last lock error once the deadline has passed
+    """
+    if deadline is None:
+        deadline = WRITE_RETRY_DEADLINE_SECONDS
+    give_up_at = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        try:
+            result = operation()
+        except sqlite3.OperationalError as e:
+            if not is_lock_error(e):
+                raise
+            contention_counters.increment('lock_errors')
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                contention_counters.increment('exhausted')
+                raise
+            # Full jitter: sleep a random slice of the capped exponential backoff
+            backoff = min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * (2 ** attempt))
+            time.sleep(min(remaining, random.uniform(0, backoff)))
+            contention_counters.increment('retries')
+            attempt += 1
+            continue
+        if attempt:
+            contention_counters.increment('recovered')
+        return result
+
+def run_write(operation: Callable[[sqlite3.Connection], T], patron_id: Optional[str] = None) -> T:
+    """
+    Run operation(conn) in its own write transaction, retrying on lock errors.
+
+    The whole transaction is re-run on each retry, so operation must not have
+    side effects outside the database. When a group-commit writer is installed
+    for the current database (the app's own writer first, then the one set by
+    set_group_commit_writer), the operation is queued to it instead and may
+    share its transaction with other callers' operations; if the writer has not
+    started it within GROUP_COMMIT_TIMEOUT_SECONDS it is cancelled and
+    TimeoutError is raised.
+
+    Pass patron_id for operations on that patron's borrow records; with
+    sharding enabled they run directly against the patron's shard.
+    """
+    sharded = patron_id is not None and sharding_enabled()
+    writer = current_app.extensions.get('group_commit_writer') if has_app_context() else None
+    if writer is None:
+        writer = _group_commit_writer
+    if writer is not None and writer.database == current_database() and not sharded:
+        future = writer.submit(operation)
+        try:
+            return future.result(timeout=GROUP_COMMIT_TIMEOUT_SECONDS)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise TimeoutError("The group-commit writer did not run the write in time.")
+            # Already in a batch being committed; its outcome is on the way
+            return future.result()
+
+    def attempt():
+        with transaction(patron_id if sharded else None) as conn:
+            return operation(conn)
+    return retry_on_lock(attempt)
+
+def set_group_commit_writer(writer) -> None:
+    """
+    Route run_write through a group-commit writer (or back to direct writes with None).
+
+    The writer must expose a database attribute (the file it writes to) and a
+    submit(operation) method returning a concurrent.futures.Future.
+    """
+    global _group_commit_writer
+    _group_commit_writer = writer
+
 def init_database():
     """Initialize the database with required tables."""
     conn = get_db_connection()
+
+    # Freed pages are kept on the freelist for services.maintenance to hand
+    # back in small incremental_vacuum steps. This only takes effect on a
+    # database without tables yet; older files are converted by a full VACUUM
+    # (see services.maintenance)
+    conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+
+    # Write-ahead logging lets readers carry on while a writer holds the lock
+    conn.execute('PRAGMA journal_mode=WAL')
     
     # Create books table
     conn.execute('''
@@ -33,6 +426,135 @@ def init_database():
     ''')
     
     # Create borrow_records table
+    _create_loan_schema(conn)
+
+    # Create library_meta table (named integer counters such as the catalog version)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS library_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO library_meta (key, value) VALUES ('catalog_version', 0)")
+    conn.execute("INSERT OR IGNORE INTO library_meta (key, value) VALUES ('catalog_search_version', 0)")
+
+    # Reminder outbox: messages waiting for the delivery worker, and the
+    # (loan database, loan, kind) reminders already queued so none is sent twice
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reminder_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patron_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            delivered_at TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reminder_outbox_pending
+        ON reminder_outbox (id)
+        WHERE delivered_at IS NULL
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reminder_log (
+            loan_database INTEGER NOT NULL,
+            loan_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            PRIMARY KEY (loan_database, loan_id, kind)
+        ) WITHOUT ROWID
+    ''')
+
+    # Holds: one FIFO queue of waiting patrons per book (ordered by id), and
+    # the copies set aside for patrons to pick up, by pickup deadline
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS holds (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL,
+            patron_id TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'waiting',
+            placed_at TEXT NOT NULL,
+            ready_at TEXT,
+            expires_at TEXT,
+            closed_at TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_holds_queue
+        ON holds (book_id, id)
+        WHERE status = 'waiting'
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_holds_ready_expiry
+        ON holds (expires_at)
+        WHERE status = 'ready'
+    ''')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_holds_patron_open
+        ON holds (patron_id, book_id)
+        WHERE status IN ('waiting', 'ready')
+    ''')
+
+    # Co-borrow index: the top related books of each book, by the number of
+    # patrons who borrowed both (built by services.recommendations)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS book_related (
+            book_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            related_book_id INTEGER NOT NULL,
+            score INTEGER NOT NULL,
+            PRIMARY KEY (book_id, rank)
+        ) WITHOUT ROWID
+    ''')
+
+    # Bump the catalog version on every change to books so that caches keyed
+    # by it are invalidated by insert_book, borrows and returns alike
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS books_catalog_version_{event.lower()}
+            AFTER {event} ON books
+            BEGIN
+                UPDATE library_meta SET value = value + 1 WHERE key = 'catalog_version';
+            END
+        ''')
+    _create_change_triggers(conn, 'books')
+
+    # The search version only moves when searchable text changes (books added
+    # or removed, titles, authors or ISBNs edited), not on borrows and returns;
+    # services.catalog_snapshot rebuilds its snapshot file when it does
+    for event in ('INSERT', 'UPDATE OF title, author, isbn', 'DELETE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS books_catalog_search_version_{event.split()[0].lower()}
+            AFTER {event} ON books
+            BEGIN
+                UPDATE library_meta SET value = value + 1 WHERE key = 'catalog_search_version';
+            END
+        ''')
+
+    conn.commit()
+    conn.close()
+
+    # Each patron shard gets its own borrow_records table
+    for index in range(shard_count()):
+        shard = connect_shard(index, attach_catalog=False)
+        shard.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        shard.execute('PRAGMA journal_mode=WAL')
+        _create_loan_schema(shard)
+        # Copies freed by committed returns that are still to be given back to
+        # the catalog (see release_pending_copies)
+        shard.execute('''
+            CREATE TABLE IF NOT EXISTS pending_copy_releases (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                book_id INTEGER NOT NULL,
+                released_at TEXT NOT NULL
+            )
+        ''')
+        shard.commit()
+        shard.close()
+        release_pending_copies(index)
+
+def _create_loan_schema(conn: sqlite3.Connection) -> None:
+    """Create the borrow_records table and its indexes on a connection."""
     conn.execute('''
         CREATE TABLE IF NOT EXISTS borrow_records (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -44,17 +566,163 @@ def init_database():
             FOREIGN KEY (book_id) REFERENCES books (id)
         )
     ''')
-    
-    conn.commit()
-    conn.close()
+
+    # Open-loan lookups by patron (and book) only ever touch rows that have not
+    # been returned, so index just those
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_open_loan
+        ON borrow_records (patron_id, book_id, borrow_date)
+        WHERE return_date IS NULL
+    ''')
+
+    # Overdue and due-soon scans are range reads over the due dates of open loans
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_open_due
+        ON borrow_records (due_date)
+        WHERE return_date IS NULL
+    ''')
+
+    # Returned loans are found by return date when they are archived
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_returned
+        ON borrow_records (return_date)
+        WHERE return_date IS NOT NULL
+    ''')
+
+    # Cold storage for loans returned long ago (see archive_returned_loan_batch);
+    # rows keep their borrow_records id
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS borrow_history (
+            id INTEGER PRIMARY KEY,
+            patron_id TEXT NOT NULL,
+            book_id INTEGER NOT NULL,
+            borrow_date TEXT NOT NULL,
+            due_date TEXT NOT NULL,
+            return_date TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_borrow_history_patron
+        ON borrow_history (patron_id, borrow_date)
+    ''')
+
+    # Per-day, per-book circulation counts kept up to date by the borrow and
+    # return helpers, so analytics never scan the loan tables
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_circulation (
+            day TEXT NOT NULL,
+            book_id INTEGER NOT NULL,
+            author TEXT,
+            borrows INTEGER NOT NULL DEFAULT 0,
+            returns INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, book_id)
+        ) WITHOUT ROWID
+    ''')
+
+    # Running borrow totals per rolling window, by book and by author, so
+    # rankings are an index read.
+    # circulation_window_start holds the first day each window still counts;
+    # advance_circulation_windows moves it forward and subtracts expired days
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS circulation_window_totals (
+            period TEXT NOT NULL,
+            book_id INTEGER NOT NULL,
+            borrows INTEGER NOT NULL,
+            PRIMARY KEY (period, book_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_circulation_window_rank
+        ON circulation_window_totals (period, borrows DESC, book_id)
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS circulation_author_totals (
+            period TEXT NOT NULL,
+            author TEXT NOT NULL,
+            borrows INTEGER NOT NULL,
+            PRIMARY KEY (period, author)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_circulation_author_rank
+        ON circulation_author_totals (period, borrows DESC, author)
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS circulation_window_start (
+            period TEXT PRIMARY KEY,
+            start_day TEXT NOT NULL
+        )
+    ''')
+    today = datetime.now().date()
+    conn.executemany(
+        'INSERT OR IGNORE INTO circulation_window_start (period, start_day) VALUES (?, ?)',
+        [(period, (today - timedelta(days=days - 1)).isoformat()) for period, days in CIRCULATION_WINDOWS.items()]
+    )
+
+    # Change-data feed: every insert, update and delete of books and borrow
+    # records, in commit order. AUTOINCREMENT keeps sequence numbers from
+    # being reused after compaction empties the tail, and paging reads the
+    # seq primary key directly
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            row_data TEXT,
+            changed_at TEXT NOT NULL
+        )
+    ''')
+    _create_change_triggers(conn, 'borrow_records')
+
+def _create_change_triggers(conn: sqlite3.Connection, table: str) -> None:
+    """Create the triggers recording a table's changes in change_log (see CHANGE_LOG_TABLES)."""
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        row = 'OLD' if event == 'DELETE' else 'NEW'
+        row_data = 'NULL' if event == 'DELETE' else 'json_object({})'.format(
+            ', '.join(f"'{column}', NEW.{column}" for column in CHANGE_LOG_TABLES[table])
+        )
+        # Loans moved to borrow_history by the archiver have not been deleted
+        when = 'WHEN NOT EXISTS (SELECT 1 FROM borrow_history WHERE id = OLD.id)' \
+            if table == 'borrow_records' and event == 'DELETE' else ''
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_change_log_{event.lower()}
+            AFTER {event} ON {table}
+            {when}
+            BEGIN
+                INSERT INTO change_log (table_name, row_id, op, row_data, changed_at)
+                VALUES ('{table}', {row}.id, '{event.lower()}', {row_data},
+                        strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'));
+            END
+        ''')
 
 def clear_database():
     """Clear all data from the database tables."""
     conn = get_db_connection()
     conn.execute('DELETE FROM books')
+    conn.execute('DELETE FROM book_related')
+    conn.execute('DELETE FROM holds')
+    conn.execute('DELETE FROM reminder_outbox')
+    conn.execute('DELETE FROM reminder_log')
     conn.execute('DELETE FROM borrow_records')
+    conn.execute('DELETE FROM borrow_history')
+    conn.execute('DELETE FROM daily_circulation')
+    conn.execute('DELETE FROM circulation_window_totals')
+    conn.execute('DELETE FROM circulation_author_totals')
+    conn.execute('DELETE FROM change_log')
     conn.commit()
     conn.close()
+    for index in range(shard_count()):
+        shard = connect_shard(index, attach_catalog=False)
+        shard.execute('DELETE FROM borrow_records')
+        shard.execute('DELETE FROM borrow_history')
+        shard.execute('DELETE FROM daily_circulation')
+        shard.execute('DELETE FROM circulation_window_totals')
+        shard.execute('DELETE FROM circulation_author_totals')
+        shard.execute('DELETE FROM change_log')
+        shard.execute('DELETE FROM pending_copy_releases')
+        shard.commit()
+        shard.close()
 
 def add_sample_data():
     """Add sample data to the database if it's empty."""
@@ -76,12 +744,16 @@ def add_sample_data():
             ''', (title, author, isbn, copies, copies))
         
         # Make 1984 unavailable by adding a borrow record
-        conn.execute('''
+        loan_conn = connect_shard(shard_for_patron('123456'), attach_catalog=False) if sharding_enabled() else conn
+        loan_conn.execute('''
             INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
             VALUES (?, ?, ?, ?)
         ''', ('123456', 3, 
               (datetime.now() - timedelta(days=5)).isoformat(),
               (datetime.now() + timedelta(days=9)).isoformat()))
+        if loan_conn is not conn:
+            loan_conn.commit()
+            loan_conn.close()
         
         # Update available copies for 1984
         conn.execute('UPDATE books SET available_copies = 0 WHERE id = 3')
@@ -92,6 +764,39 @@ def add_sample_data():
 
 # Helper Functions for Database Operations
 
+def get_catalog_version() -> int:
+    """Get the catalog data version (incremented on every change to the books table)."""
+    conn = get_db_connection()
+    row = conn.execute("SELECT value FROM library_meta WHERE key = 'catalog_version'").fetchone()
+    conn.close()
+    return row['value'] if row else 0
+
+def get_catalog_search_rows() -> Tuple[int, List[sqlite3.Row]]:
+    """
+    Get the catalog search version and the (id, title, author, isbn) of every
+    book in title order, read in one transaction so they agree.
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN')
+        version = conn.execute("SELECT value FROM library_meta WHERE key = 'catalog_search_version'").fetchone()
+        rows = conn.execute('SELECT id, title, author, isbn FROM books ORDER BY title, id').fetchall()
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+    return version['value'] if version else 0, rows
+
+def get_meta_value(key: str, default: int = 0) -> int:
+    """Get a named integer from library_meta."""
+    conn = get_db_connection()
+    row = conn.execute('SELECT value FROM library_meta WHERE key = ?', (key,)).fetchone()
+    conn.close()
+    return row['value'] if row else default
+
+def set_meta_value(conn: sqlite3.Connection, key: str, value: int) -> None:
+    """Set a named integer in library_meta, within a transaction."""
+    conn.execute('INSERT OR REPLACE INTO library_meta (key, value) VALUES (?, ?)', (key, value))
+
 def get_all_books() -> List[Dict]:
     """Get all books from the database."""
     conn = get_db_connection()
@@ -99,6 +804,33 @@ def get_all_books() -> List[Dict]:
     conn.close()
     return [dict(book) for book in books]
 
+def iter_books(fields: Sequence[str] = BOOK_COLUMNS, since_id: int = 0, batch_size: int = 500) -> Iterator[Tuple]:
+    """
+    Stream books in ID order as tuples of the requested fields.
+
+    Rows are pulled from the cursor with fetchmany so memory use stays bounded
+    by batch_size regardless of catalog size. Only books with id > since_id
+    are returned, which lets callers resume an export from the last ID seen.
+    """
+    unknown = [field for field in fields if field not in BOOK_COLUMNS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown book fields: {', '.join(unknown)}")
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(
+            f'SELECT {", ".join(fields)} FROM books WHERE id > ? ORDER BY id',
+            (since_id,)
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield tuple(row)
+    finally:
+        conn.close()
+
 def get_book_by_id(book_id: int) -> Optional[Dict]:
     """Get a specific book by ID."""
     conn = get_db_connection()
@@ -115,7 +847,7 @@ def get_book_by_isbn(isbn: str) -> Optional[Dict]:
 
 def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
     """Get currently borrowed books for a patron."""
-    conn = get_db_connection()
+    conn = get_loan_connection(patron_id)
     records = conn.execute('''
         SELECT br.*, b.title, b.author 
         FROM borrow_records br 
@@ -138,9 +870,69 @@ def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
     
     return borrowed_books
 
+def get_patron_loan_history(patron_id: str, limit: Optional[int] = None,
+                            before: Optional[Tuple[datetime, int]] = None) -> List[Dict]:
+    """
+    Get a patron's returned loans, most recent first, including archived ones.
+
+    Args:
+        patron_id: 6-digit library card ID
+        limit: Most loans returned (None for all)
+        before: (borrow_date, id) of the last loan of the previous page, to
+                continue after it (archived loans keep their id)
+    """
+    after_cursor = 'WHERE (loans.borrow_date, loans.id) < (?, ?)' if before else ''
+    cursor_params = (before[0].isoformat(), before[1]) if before else ()
+    conn = get_loan_connection(patron_id)
+    records = conn.execute(f'''
+        SELECT loans.id, loans.book_id, b.title, b.author, loans.borrow_date, loans.due_date, loans.return_date
+        FROM (
+            SELECT id, book_id, borrow_date, due_date, return_date FROM borrow_records
+            WHERE patron_id = ? AND return_date IS NOT NULL
+            UNION ALL
+            SELECT id, book_id, borrow_date, due_date, return_date FROM borrow_history
+            WHERE patron_id = ?
+        ) loans
+        JOIN books b ON loans.book_id = b.id
+        {after_cursor}
+        ORDER BY loans.borrow_date DESC, loans.id DESC
+        LIMIT ?
+    ''', (patron_id, patron_id, *cursor_params, -1 if limit is None else limit)).fetchall()
+    conn.close()
+
+    return [
+        {
+            'id': record['id'],
+            'book_id': record['book_id'],
+            'title': record['title'],
+            'author': record['author'],
+            'borrow_date': datetime.fromisoformat(record['borrow_date']),
+            'due_date': datetime.fromisoformat(record['due_date']),
+            'return_date': datetime.fromisoformat(record['return_date'])
+        }
+        for record in records
+    ]
+
+def get_open_loan(patron_id: str, book_id: int) -> Optional[Dict]:
+    """Get a patron's open borrow record for one book (id, borrow_date, due_date)."""
+    conn = get_loan_connection(patron_id)
+    record = conn.execute('''
+        SELECT id, borrow_date, due_date FROM borrow_records
+        WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+        ORDER BY borrow_date LIMIT 1
+    ''', (patron_id, book_id)).fetchone()
+    conn.close()
+    if not record:
+        return None
+    return {
+        'id': record['id'],
+        'borrow_date': datetime.fromisoformat(record['borrow_date']),
+        'due_date': datetime.fromisoformat(record['due_date'])
+    }
+
 def get_patron_borrow_count(patron_id: str) -> int:
     """Get the number of books currently borrowed by a patron."""
-    conn = get_db_connection()
+    conn = get_loan_connection(patron_id)
     count = conn.execute('''
         SELECT COUNT(*) as count FROM borrow_records 
         WHERE patron_id = ? AND return_date IS NULL
@@ -148,62 +940,1069 @@ def get_patron_borrow_count(patron_id: str) -> int:
     conn.close()
     return count
 
+def _chunks(items: Sequence, size: int) -> Iterator[Sequence]:
+    """Split items into consecutive slices of at most size elements."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def get_books_by_ids(book_ids: Sequence[int]) -> Dict[int, Dict]:
+    """Get many books by ID with one query per chunk, keyed by book ID."""
+    unique_ids = list(dict.fromkeys(book_ids))
+    books = {}
+    conn = get_db_connection()
+    for chunk in _chunks(unique_ids, SQL_IN_CHUNK_SIZE):
+        placeholders = ', '.join('?' * len(chunk))
+        rows = conn.execute(f'SELECT * FROM books WHERE id IN ({placeholders})', tuple(chunk)).fetchall()
+        for row in rows:
+            books[row['id']] = dict(row)
+    conn.close()
+    return books
+
+def get_copy_counts(book_ids: Sequence[int]) -> Dict[int, Tuple[int, int]]:
+    """Get (total_copies, available_copies) of many books by ID, keyed by book ID."""
+    counts = {}
+    conn = get_db_connection()
+    for chunk in _chunks(list(dict.fromkeys(book_ids)), SQL_IN_CHUNK_SIZE):
+        placeholders = ', '.join('?' * len(chunk))
+        query = f'SELECT id, total_copies, available_copies FROM books WHERE id IN ({placeholders})'
+        for row in conn.execute(query, tuple(chunk)):
+            counts[row['id']] = (row['total_copies'], row['available_copies'])
+    conn.close()
+    return counts
+
+def get_open_loans_for_pairs(pairs: Sequence[Tuple[str, int]]) -> Dict[Tuple[str, int], Dict]:
+    """
+    Get the open borrow records for many (patron_id, book_id) pairs.
+
+    Runs one query per chunk of pairs and returns a dict keyed by
+    (patron_id, book_id) with the parsed borrow and due dates.
+    """
+    unique_pairs = list(dict.fromkeys(pairs))
+    if not sharding_enabled():
+        conn = get_db_connection()
+        loans = _select_open_loans_for_pairs(conn, unique_pairs)
+        conn.close()
+        return loans
+
+    # Query each shard for just the pairs whose patrons it holds
+    by_shard = {}
+    for pair in unique_pairs:
+        by_shard.setdefault(shard_for_patron(pair[0]), []).append(pair)
+    loans = {}
+    for index, shard_pairs in by_shard.items():
+        conn = connect_shard(index, attach_catalog=False)
+        loans.update(_select_open_loans_for_pairs(conn, shard_pairs))
+        conn.close()
+    return loans
+
+def _select_open_loans_for_pairs(conn: sqlite3.Connection, pairs: Sequence[Tuple[str, int]]) -> Dict[Tuple[str, int], Dict]:
+    """Run the chunked open-loan pair lookup on one connection."""
+    loans = {}
+    for chunk in _chunks(pairs, SQL_IN_CHUNK_SIZE // 2):
+        placeholders = ', '.join(['(?, ?)'] * len(chunk))
+        params = tuple(value for pair in chunk for value in pair)
+        rows = conn.execute(f'''
+            WITH wanted (patron_id, book_id) AS (VALUES {placeholders})
+            SELECT br.patron_id, br.book_id, br.borrow_date, br.due_date
+            FROM wanted
+            JOIN borrow_records br ON br.patron_id = wanted.patron_id AND br.book_id = wanted.book_id
+            WHERE br.return_date IS NULL
+        ''', params).fetchall()
+        for row in rows:
+            loans[(row['patron_id'], row['book_id'])] = {
+                'borrow_date': datetime.fromisoformat(row['borrow_date']),
+                'due_date': datetime.fromisoformat(row['due_date'])
+            }
+    return loans
+
 def insert_book(title: str, author: str, isbn: str, total_copies: int, available_copies: int) -> bool:
     """Insert a new book into the database."""
-    conn = get_db_connection()
-    try:
+    def write(conn):
         conn.execute('''
             INSERT INTO books (title, author, isbn, total_copies, available_copies)
             VALUES (?, ?, ?, ?, ?)
         ''', (title, author, isbn, total_copies, available_copies))
-        conn.commit()
-        conn.close()
+    try:
+        run_write(write)
         return True
     except Exception as e:
-        conn.close()
         return False
 
 def insert_borrow_record(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime) -> bool:
     """Insert a new borrow record into the database."""
-    conn = get_db_connection()
-    try:
+    def write(conn):
         conn.execute('''
             INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
             VALUES (?, ?, ?, ?)
         ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
-        conn.commit()
-        conn.close()
+        record_circulation(conn, book_id, borrow_date, borrows=1)
+    try:
+        run_write(write, patron_id=patron_id)
         return True
     except Exception as e:
-        conn.close()
         return False
 
 def update_book_availability(book_id: int, change: int) -> bool:
     """Update the available copies of a book by a given amount (+1 for return, -1 for borrow)."""
-    conn = get_db_connection()
-    try:
+    def write(conn):
         conn.execute('''
             UPDATE books SET available_copies = available_copies + ? WHERE id = ?
         ''', (change, book_id))
-        conn.commit()
-        conn.close()
+    try:
+        run_write(write)
         return True
     except Exception as e:
-        conn.close()
         return False
 
 def update_borrow_record_return_date(patron_id: str, book_id: int, return_date: datetime) -> bool:
     """Update the return date for a borrow record."""
-    conn = get_db_connection()
-    try:
-        conn.execute('''
+    def write(conn):
+        cursor = conn.execute('''
             UPDATE borrow_records 
             SET return_date = ? 
             WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
         ''', (return_date.isoformat(), patron_id, book_id))
-        conn.commit()
-        conn.close()
+        if cursor.rowcount:
+            record_circulation(conn, book_id, return_date, returns=cursor.rowcount)
+    try:
+        run_write(write, patron_id=patron_id)
         return True
     except Exception as e:
+        return False
+
+# Transactional Helpers (operate on a connection from transaction())
+
+@contextmanager
+def transaction(patron_id: Optional[str] = None, shard: Optional[int] = None) -> Iterator[sqlite3.Connection]:
+    """
+    Run the enclosed statements as a single write transaction.
+
+    The write lock is taken up front (BEGIN IMMEDIATE) so read-then-write
+    sequences inside the block cannot interleave with other writers. The
+    transaction is committed on normal exit and rolled back on any exception.
+
+    With sharding enabled and a patron_id given, the transaction runs on the
+    patron's shard; catalog copies and holds taken during it are put back on
+    rollback and copies released by it are queued on the shard with the
+    loan and returned to the catalog (or to the next hold in line) after
+    commit; copies the catalog is too busy to take stay queued for the next
+    release on that shard.
+    A shard index may be given instead for work that is not tied to a patron.
+    """
+    if patron_id is not None and sharding_enabled():
+        shard = shard_for_patron(patron_id)
+    if shard is not None and sharding_enabled():
+        conn = connect_shard(shard, attach_catalog=False)
+    else:
+        conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        yield conn
+        if isinstance(conn, ShardConnection) and conn.released_copies:
+            _queue_copy_releases(conn, conn.released_copies, datetime.now())
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        if isinstance(conn, ShardConnection) and (conn.reserved_copies or conn.claimed_holds):
+            _release_catalog_copies(conn.reserved_copies, datetime.now(), restore_holds=conn.claimed_holds)
+        raise
+    finally:
+        conn.close()
+    if isinstance(conn, ShardConnection) and conn.released_copies:
+        # The loan is already closed: a catalog that stays locked leaves the
+        # copies queued on the shard for the next drain instead of failing it
+        try:
+            release_pending_copies(shard)
+        except sqlite3.Error:
+            contention_counters.increment('deferred_releases')
+
+def _reserve_catalog_copy(book_id: int, patron_id: str, when: datetime) -> Optional[Tuple[str, Optional[int]]]:
+    """
+    Take the copy held for the patron, or else one available copy, in its
+    own short catalog transaction.
+
+    Returns:
+        tuple: (author, ID of the hold picked up or None), or None if no copy was available
+    """
+    def reserve():
+        with transaction() as conn:
+            return _take_copy(conn, book_id, patron_id, when)
+    return retry_on_lock(reserve)
+
+def _take_copy(conn: sqlite3.Connection, book_id: int, patron_id: str,
+               when: datetime) -> Optional[Tuple[str, Optional[int]]]:
+    """Pick up the patron's ready hold or take an available copy, on a catalog connection."""
+    hold_id = claim_ready_hold(conn, patron_id, book_id, when)
+    if hold_id is not None:
+        return _book_author(conn, book_id), hold_id
+    rows = conn.execute('''
+        UPDATE books SET available_copies = available_copies - 1
+        WHERE id = ? AND available_copies > 0
+        RETURNING author
+    ''', (book_id,)).fetchall()
+    return (rows[0]['author'], None) if rows else None
+
+def _release_catalog_copies(book_ids: Sequence[int], when: datetime, restore_holds: Sequence[int] = ()) -> None:
+    """
+    Release copies to the catalog (or the next holds in line) and put picked-up
+    holds back to ready, in one catalog transaction.
+    """
+    def release():
+        with transaction() as conn:
+            conn.executemany(
+                "UPDATE holds SET status = 'ready', closed_at = NULL WHERE id = ?",
+                [(hold_id,) for hold_id in restore_holds]
+            )
+            for book_id in book_ids:
+                release_copy(conn, book_id, when)
+    retry_on_lock(release)
+
+def _queue_copy_releases(conn: sqlite3.Connection, book_ids: Sequence[int], when: datetime) -> None:
+    """Queue copies freed by a shard transaction for release to the catalog once it commits."""
+    conn.executemany(
+        'INSERT INTO pending_copy_releases (book_id, released_at) VALUES (?, ?)',
+        [(book_id, when.isoformat()) for book_id in book_ids]
+    )
+
+def release_pending_copies(shard: int) -> int:
+    """
+    Release the copies queued on a shard to the catalog (or the next holds in
+    line) and clear them from the queue, in one transaction over the shard
+    and the attached catalog, so a copy is released exactly once.
+
+    Returns:
+        int: Number of copies released
+
+    Raises:
+        sqlite3.OperationalError: The catalog stayed locked past the retry deadline
+    """
+    def release():
+        conn = connect_shard(shard)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(
+                'SELECT id, book_id, released_at FROM pending_copy_releases ORDER BY id'
+            ).fetchall()
+            for row in rows:
+                release_copy(conn, row['book_id'], datetime.fromisoformat(row['released_at']))
+            if rows:
+                conn.execute('DELETE FROM pending_copy_releases WHERE id <= ?', (rows[-1]['id'],))
+            conn.commit()
+            return len(rows)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    return retry_on_lock(release)
+
+def count_open_loans(conn: sqlite3.Connection, patron_id: str) -> int:
+    """Get the number of books currently borrowed by a patron, within a transaction."""
+    return conn.execute('''
+        SELECT COUNT(*) as count FROM borrow_records
+        WHERE patron_id = ? AND return_date IS NULL
+    ''', (patron_id,)).fetchone()['count']
+
+def checkout_copy(conn: sqlite3.Connection, patron_id: str, book_id: int,
+                  borrow_date: datetime, due_date: datetime) -> bool:
+    """
+    Take the copy held for the patron (if their hold is ready) or one
+    available copy of a book and record the loan, within a transaction.
+
+    Returns:
+        bool: False if no copy was available (nothing is written in that case)
+    """
+    if isinstance(conn, ShardConnection):
+        taken = _reserve_catalog_copy(book_id, patron_id, borrow_date)
+    else:
+        taken = _take_copy(conn, book_id, patron_id, borrow_date)
+    if taken is None:
+        return False
+    author, hold_id = taken
+    if isinstance(conn, ShardConnection):
+        if hold_id is None:
+            conn.reserved_copies.append(book_id)
+        else:
+            conn.claimed_holds.append(hold_id)
+    conn.execute('''
+        INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+        VALUES (?, ?, ?, ?)
+    ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
+    record_circulation(conn, book_id, borrow_date, borrows=1, author=author)
+    return True
+
+def checkin_copy(conn: sqlite3.Connection, patron_id: str, book_id: int, return_date: datetime) -> bool:
+    """
+    Close the patron's oldest open loan of a book and release the copy to the
+    next hold in line or the catalog, within a transaction.
+
+    Returns:
+        bool: False if the patron has no open loan of the book (nothing is written in that case)
+    """
+    cursor = conn.execute('''
+        UPDATE borrow_records SET return_date = ?
+        WHERE id = (
+            SELECT id FROM borrow_records
+            WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+            ORDER BY borrow_date LIMIT 1
+        )
+    ''', (return_date.isoformat(), patron_id, book_id))
+    if cursor.rowcount == 0:
+        return False
+    if isinstance(conn, ShardConnection):
+        conn.released_copies.append(book_id)
+    else:
+        release_copy(conn, book_id, return_date)
+    record_circulation(conn, book_id, return_date, returns=1)
+    return True
+
+def record_circulation(conn: sqlite3.Connection, book_id: int, when: datetime,
+                       borrows: int = 0, returns: int = 0, author: Optional[str] = None) -> None:
+    """
+    Add borrows/returns to a book's daily circulation counts, and its borrows
+    to every rolling window (per book and per author) that still covers that
+    day, within a transaction. The author is looked up if not given.
+    """
+    if borrows and author is None:
+        author = _book_author(conn, book_id)
+    day = when.date().isoformat()
+    conn.execute('''
+        INSERT INTO daily_circulation (day, book_id, author, borrows, returns)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (day, book_id) DO UPDATE SET
+            author = COALESCE(excluded.author, author),
+            borrows = borrows + excluded.borrows,
+            returns = returns + excluded.returns
+    ''', (day, book_id, author, borrows, returns))
+    if not borrows:
+        return
+    conn.execute('''
+        INSERT INTO circulation_window_totals (period, book_id, borrows)
+        SELECT period, ?, ? FROM circulation_window_start WHERE start_day <= ?
+        ON CONFLICT (period, book_id) DO UPDATE SET borrows = borrows + excluded.borrows
+    ''', (book_id, borrows, day))
+    if author is not None:
+        conn.execute('''
+            INSERT INTO circulation_author_totals (period, author, borrows)
+            SELECT period, ?, ? FROM circulation_window_start WHERE start_day <= ?
+            ON CONFLICT (period, author) DO UPDATE SET borrows = borrows + excluded.borrows
+        ''', (author, borrows, day))
+
+def _book_author(conn: sqlite3.Connection, book_id: int) -> Optional[str]:
+    """Get a book's author from the catalog (shard connections have no books table)."""
+    if isinstance(conn, ShardConnection):
+        book = get_book_by_id(book_id)
+        return book['author'] if book else None
+    row = conn.execute('SELECT author FROM books WHERE id = ?', (book_id,)).fetchone()
+    return row['author'] if row else None
+
+# Loan Archive
+
+def run_write_on_loan_databases(operation: Callable[[sqlite3.Connection], T]) -> List[T]:
+    """
+    Run operation(conn) in its own write transaction on every database holding
+    borrow records (each shard in turn, or just the main database).
+
+    Returns:
+        list: The operation's result for each database
+    """
+    if not sharding_enabled():
+        return [run_write(operation)]
+
+    results = []
+    for index in range(shard_count()):
+        def attempt():
+            with transaction(shard=index) as conn:
+                return operation(conn)
+        results.append(retry_on_lock(attempt))
+    return results
+
+def archive_returned_loan_batch(conn: sqlite3.Connection, returned_before: datetime, batch_size: int) -> int:
+    """
+    Move up to batch_size loans returned before a cutoff from borrow_records
+    to borrow_history, within a transaction.
+
+    Returns:
+        int: Number of loans moved
+    """
+    ids = [row['id'] for row in conn.execute('''
+        SELECT id FROM borrow_records
+        WHERE return_date IS NOT NULL AND return_date < ?
+        ORDER BY return_date
+        LIMIT ?
+    ''', (returned_before.isoformat(), min(batch_size, SQL_IN_CHUNK_SIZE)))]
+    if not ids:
+        return 0
+
+    placeholders = ','.join('?' * len(ids))
+    conn.execute(f'''
+        INSERT INTO borrow_history (id, patron_id, book_id, borrow_date, due_date, return_date)
+        SELECT id, patron_id, book_id, borrow_date, due_date, return_date
+        FROM borrow_records WHERE id IN ({placeholders})
+    ''', ids)
+    conn.execute(f'DELETE FROM borrow_records WHERE id IN ({placeholders})', ids)
+    return len(ids)
+
+def get_loan_table_stats() -> Dict:
+    """
+    Get row counts of the hot (borrow_records) and archive (borrow_history)
+    tables, summed over every loan database.
+
+    hot_bytes is the on-disk size of borrow_records and its indexes, or None
+    when SQLite was built without the dbstat table.
+    """
+    counts = scatter_gather('''
+        SELECT (SELECT COUNT(*) FROM borrow_records) AS hot_rows,
+               (SELECT COUNT(*) FROM borrow_history) AS history_rows
+    ''')
+    stats = {
+        'hot_rows': sum(rows[0]['hot_rows'] for rows in counts),
+        'history_rows': sum(rows[0]['history_rows'] for rows in counts),
+        'hot_bytes': None
+    }
+    try:
+        sizes = scatter_gather('''
+            SELECT COALESCE(SUM(pgsize), 0) AS size FROM dbstat('main')
+            WHERE name IN (SELECT name FROM main.sqlite_master WHERE tbl_name = 'borrow_records')
+        ''')
+    except sqlite3.OperationalError:
+        return stats
+    stats['hot_bytes'] = sum(rows[0]['size'] for rows in sizes)
+    return stats
+
+# Circulation Aggregates
+
+def advance_circulation_windows(conn: sqlite3.Connection, today: datetime) -> int:
+    """
+    Move every rolling window forward to end on today, subtracting the daily
+    counts of days that fell out of it, within a transaction.
+
+    Returns:
+        int: Number of windows that moved
+    """
+    moved = 0
+    for period, days in CIRCULATION_WINDOWS.items():
+        new_start = (today.date() - timedelta(days=days - 1)).isoformat()
+        row = conn.execute('SELECT start_day FROM circulation_window_start WHERE period = ?', (period,)).fetchone()
+        if row is not None and row['start_day'] >= new_start:
+            continue
+        old_start = row['start_day'] if row is not None else new_start
+        conn.execute('''
+            UPDATE circulation_window_totals AS totals
+            SET borrows = totals.borrows - expired.borrows
+            FROM (
+                SELECT book_id, SUM(borrows) AS borrows FROM daily_circulation
+                WHERE day >= ? AND day < ?
+                GROUP BY book_id
+            ) AS expired
+            WHERE totals.period = ? AND totals.book_id = expired.book_id
+        ''', (old_start, new_start, period))
+        conn.execute('''
+            UPDATE circulation_author_totals AS totals
+            SET borrows = totals.borrows - expired.borrows
+            FROM (
+                SELECT author, SUM(borrows) AS borrows FROM daily_circulation
+                WHERE day >= ? AND day < ? AND author IS NOT NULL
+                GROUP BY author
+            ) AS expired
+            WHERE totals.period = ? AND totals.author = expired.author
+        ''', (old_start, new_start, period))
+        conn.execute('DELETE FROM circulation_window_totals WHERE period = ? AND borrows <= 0', (period,))
+        conn.execute('DELETE FROM circulation_author_totals WHERE period = ? AND borrows <= 0', (period,))
+        conn.execute('INSERT OR REPLACE INTO circulation_window_start (period, start_day) VALUES (?, ?)',
+                     (period, new_start))
+        moved += 1
+    return moved
+
+def rebuild_daily_circulation(conn: sqlite3.Connection) -> None:
+    """
+    Recompute daily_circulation from the loan and archive tables, within a
+    transaction (for loans recorded before the aggregates existed).
+    """
+    conn.execute('DELETE FROM daily_circulation')
+    conn.execute('''
+        INSERT INTO daily_circulation (day, book_id, borrows, returns)
+        SELECT day, book_id, SUM(borrows), SUM(returns) FROM (
+            SELECT substr(borrow_date, 1, 10) AS day, book_id, 1 AS borrows, 0 AS returns
+            FROM borrow_records
+            UNION ALL
+            SELECT substr(borrow_date, 1, 10), book_id, 1, 0 FROM borrow_history
+            UNION ALL
+            SELECT substr(return_date, 1, 10), book_id, 0, 1
+            FROM borrow_records WHERE return_date IS NOT NULL
+            UNION ALL
+            SELECT substr(return_date, 1, 10), book_id, 0, 1 FROM borrow_history
+        )
+        GROUP BY day, book_id
+    ''')
+    conn.executemany('UPDATE daily_circulation SET author = ? WHERE book_id = ?',
+                     ((author, book_id) for book_id, author in iter_books(('id', 'author'))))
+
+def rebuild_circulation_windows(conn: sqlite3.Connection, today: datetime) -> None:
+    """Recompute the rolling window totals ending on today from daily_circulation, within a transaction."""
+    conn.execute('DELETE FROM circulation_window_totals')
+    conn.execute('DELETE FROM circulation_author_totals')
+    for period, days in CIRCULATION_WINDOWS.items():
+        start_day = (today.date() - timedelta(days=days - 1)).isoformat()
+        conn.execute('''
+            INSERT INTO circulation_window_totals (period, book_id, borrows)
+            SELECT ?, book_id, SUM(borrows) FROM daily_circulation
+            WHERE day >= ?
+            GROUP BY book_id
+            HAVING SUM(borrows) > 0
+        ''', (period, start_day))
+        conn.execute('''
+            INSERT INTO circulation_author_totals (period, author, borrows)
+            SELECT ?, author, SUM(borrows) FROM daily_circulation
+            WHERE day >= ? AND author IS NOT NULL
+            GROUP BY author
+            HAVING SUM(borrows) > 0
+        ''', (period, start_day))
+        conn.execute('INSERT OR REPLACE INTO circulation_window_start (period, start_day) VALUES (?, ?)',
+                     (period, start_day))
+
+def get_top_books_by_borrows(period: str, n: int) -> List[Tuple[int, int]]:
+    """Get the n (book_id, borrows) pairs with the most borrows in a rolling window, ties by book ID."""
+    return _top_by_borrows('circulation_window_totals', 'book_id', period, n)
+
+def get_top_authors_by_borrows(period: str, n: int) -> List[Tuple[str, int]]:
+    """Get the n (author, borrows) pairs with the most borrows in a rolling window, ties by name."""
+    return _top_by_borrows('circulation_author_totals', 'author', period, n)
+
+def _top_by_borrows(table: str, key: str, period: str, n: int) -> List[Tuple]:
+    """
+    Rank one of the rolling window total tables.
+
+    Without sharding this is a single index range read. With sharding each
+    key's borrows are spread over the shards, so the full window totals are
+    summed before picking the top n.
+    """
+    if not sharding_enabled():
+        conn = get_db_connection()
+        rows = conn.execute(f'''
+            SELECT {key}, borrows FROM {table}
+            WHERE period = ?
+            ORDER BY borrows DESC, {key}
+            LIMIT ?
+        ''', (period, n)).fetchall()
+        conn.close()
+        return [(row[key], row['borrows']) for row in rows]
+
+    totals = _borrow_totals(table, key, period)
+    return heapq.nsmallest(n, totals.items(), key=lambda item: (-item[1], item[0]))
+
+def get_book_borrow_totals(period: str) -> Dict[int, int]:
+    """Get the borrows of every book borrowed in a rolling window, by book ID."""
+    return _borrow_totals('circulation_window_totals', 'book_id', period)
+
+def get_author_borrow_totals(period: str) -> Dict[str, int]:
+    """Get the borrows of every author borrowed in a rolling window, by author."""
+    return _borrow_totals('circulation_author_totals', 'author', period)
+
+def _borrow_totals(table: str, key: str, period: str) -> Dict:
+    """Sum one of the rolling window total tables by key (over every shard with sharding)."""
+    query = f'SELECT {key}, borrows FROM {table} WHERE period = ?'
+    if not sharding_enabled():
+        conn = get_db_connection()
+        rows = conn.execute(query, (period,)).fetchall()
+        conn.close()
+        return {row[key]: row['borrows'] for row in rows}
+
+    totals = {}
+    for rows in scatter_gather(query, (period,)):
+        for row in rows:
+            totals[row[key]] = totals.get(row[key], 0) + row['borrows']
+    return totals
+
+# Related Books (co-borrow index)
+
+def loan_database_count() -> int:
+    """Number of databases holding borrow records (the shards, or just the main database)."""
+    return shard_count() if sharding_enabled() else 1
+
+def connect_loan_database(index: int) -> sqlite3.Connection:
+    """Open a read connection to one database holding borrow records (see loan_database_count)."""
+    return connect_shard(index) if sharding_enabled() else get_db_connection()
+
+def iter_loan_baskets(index: int, max_books: int, up_to_loan_id: int,
+                      batch_size: int = 5000) -> Iterator[Tuple[str, List[int]]]:
+    """
+    Stream (patron_id, book_ids) for every patron in one loan database.
+
+    book_ids are the distinct books the patron borrowed in loans up to a loan
+    ID (open, returned and archived), most recent first, capped at max_books.
+    Rows are pulled with fetchmany so memory stays bounded by one patron's
+    loans.
+    """
+    conn = connect_loan_database(index)
+    try:
+        cursor = conn.execute('''
+            SELECT patron_id, book_id FROM (
+                SELECT patron_id, book_id, borrow_date FROM borrow_records WHERE id <= ?
+                UNION ALL
+                SELECT patron_id, book_id, borrow_date FROM borrow_history WHERE id <= ?
+            )
+            ORDER BY patron_id, borrow_date DESC
+        ''', (up_to_loan_id, up_to_loan_id))
+        patron_id, basket = None, []
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row_patron, book_id in rows:
+                if row_patron != patron_id:
+                    if basket:
+                        yield patron_id, basket
+                    patron_id, basket = row_patron, []
+                if len(basket) < max_books and book_id not in basket:
+                    basket.append(book_id)
+        if basket:
+            yield patron_id, basket
+    finally:
+        conn.close()
+
+def get_loans_after(index: int, last_loan_id: int) -> List[Tuple[int, str, int]]:
+    """
+    Get (id, patron_id, book_id) of loans recorded in one loan database after
+    a loan ID, including ones already moved to the archive (which keep their ID).
+    """
+    conn = connect_loan_database(index)
+    rows = conn.execute('''
+        SELECT id, patron_id, book_id FROM borrow_records WHERE id > ?
+        UNION ALL
+        SELECT id, patron_id, book_id FROM borrow_history WHERE id > ?
+        ORDER BY id
+    ''', (last_loan_id, last_loan_id)).fetchall()
+    conn.close()
+    return [(row['id'], row['patron_id'], row['book_id']) for row in rows]
+
+def get_last_loan_id(index: int) -> int:
+    """Get the newest loan ID in one loan database (0 if it has none)."""
+    conn = connect_loan_database(index)
+    row = conn.execute('''
+        SELECT MAX(id) AS id FROM (
+            SELECT MAX(id) AS id FROM borrow_records
+            UNION ALL
+            SELECT MAX(id) FROM borrow_history
+        )
+    ''').fetchone()
+    conn.close()
+    return row['id'] or 0
+
+def get_patron_baskets(index: int, patron_ids: Sequence[str], up_to_loan_id: int,
+                       max_books: int) -> Dict[str, List[int]]:
+    """
+    Get the distinct books each patron borrowed in loans up to a loan ID,
+    most recent first, capped at max_books.
+    """
+    baskets = {}
+    conn = connect_loan_database(index)
+    try:
+        for chunk in _chunks(list(patron_ids), SQL_IN_CHUNK_SIZE):
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(f'''
+                SELECT patron_id, book_id FROM (
+                    SELECT patron_id, book_id, borrow_date FROM borrow_records
+                    WHERE id <= ? AND patron_id IN ({placeholders})
+                    UNION ALL
+                    SELECT patron_id, book_id, borrow_date FROM borrow_history
+                    WHERE id <= ? AND patron_id IN ({placeholders})
+                )
+                ORDER BY borrow_date DESC
+            ''', (up_to_loan_id, *chunk, up_to_loan_id, *chunk)).fetchall()
+            for patron_id, book_id in rows:
+                basket = baskets.setdefault(patron_id, [])
+                if len(basket) < max_books and book_id not in basket:
+                    basket.append(book_id)
+    finally:
         conn.close()
-        return False
\ No newline at end of file
+    return baskets
+
+def get_related_scores(book_ids: Sequence[int]) -> Dict[int, Dict[int, int]]:
+    """Get the stored {related_book_id: score} of each listed book."""
+    related = {book_id: {} for book_id in book_ids}
+    conn = get_db_connection()
+    for chunk in _chunks(list(book_ids), SQL_IN_CHUNK_SIZE):
+        placeholders = ','.join('?' * len(chunk))
+        for row in conn.execute(
+                f'SELECT book_id, related_book_id, score FROM book_related WHERE book_id IN ({placeholders})', chunk):
+            related[row['book_id']][row['related_book_id']] = row['score']
+    conn.close()
+    return related
+
+def store_related_books(conn: sqlite3.Connection, related: Dict[int, List[Tuple[int, int]]],
+                        replace_all: bool = False) -> None:
+    """
+    Store the ranked (related_book_id, score) lists of books, within a transaction.
+
+    Each listed book's previous entries are replaced; with replace_all the
+    whole index is replaced.
+    """
+    if replace_all:
+        conn.execute('DELETE FROM book_related')
+    else:
+        for chunk in _chunks(list(related), SQL_IN_CHUNK_SIZE):
+            conn.execute(f'DELETE FROM book_related WHERE book_id IN ({",".join("?" * len(chunk))})', chunk)
+    conn.executemany(
+        'INSERT INTO book_related (book_id, rank, related_book_id, score) VALUES (?, ?, ?, ?)',
+        (
+            (book_id, rank, related_book_id, score)
+            for book_id, ranked in related.items()
+            for rank, (related_book_id, score) in enumerate(ranked, start=1)
+        )
+    )
+
+def get_related_books(book_id: int, limit: int) -> List[Dict]:
+    """Get up to limit books most often borrowed by patrons who borrowed a book, best first."""
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT r.related_book_id, r.score, b.title, b.author, b.available_copies
+        FROM book_related r
+        JOIN books b ON r.related_book_id = b.id
+        WHERE r.book_id = ?
+        ORDER BY r.rank
+        LIMIT ?
+    ''', (book_id, limit)).fetchall()
+    conn.close()
+    return [
+        {
+            'book_id': row['related_book_id'],
+            'title': row['title'],
+            'author': row['author'],
+            'available_copies': row['available_copies'],
+            'co_borrowers': row['score']
+        }
+        for row in rows
+    ]
+
+# Reminders
+
+def get_open_loans_due_between(index: int, start: Optional[datetime], end: datetime) -> List[Dict]:
+    """
+    Get open loans in one loan database due after start (or from the
+    beginning, if None) and up to end, by due date.
+    """
+    conn = connect_loan_database(index)
+    rows = conn.execute('''
+        SELECT id, patron_id, book_id, due_date FROM borrow_records
+        WHERE return_date IS NULL AND due_date > ? AND due_date <= ?
+        ORDER BY due_date
+    ''', (start.isoformat() if start else '', end.isoformat())).fetchall()
+    conn.close()
+    return [
+        {
+            'loan_id': row['id'],
+            'patron_id': row['patron_id'],
+            'book_id': row['book_id'],
+            'due_date': datetime.fromisoformat(row['due_date'])
+        }
+        for row in rows
+    ]
+
+def get_open_loan_ids(index: int, loan_ids: Sequence[int]) -> set:
+    """Get which of the listed loans in one loan database are still open."""
+    open_ids = set()
+    conn = connect_loan_database(index)
+    for chunk in _chunks(list(loan_ids), SQL_IN_CHUNK_SIZE):
+        placeholders = ', '.join('?' * len(chunk))
+        open_ids.update(row['id'] for row in conn.execute(
+            f'SELECT id FROM borrow_records WHERE return_date IS NULL AND id IN ({placeholders})', tuple(chunk)))
+    conn.close()
+    return open_ids
+
+def queue_outbox_message(conn: sqlite3.Connection, patron_id: str, kind: str, payload: str,
+                         created_at: datetime) -> None:
+    """Queue one message for the delivery worker, within a transaction."""
+    conn.execute(
+        'INSERT INTO reminder_outbox (patron_id, kind, payload, created_at) VALUES (?, ?, ?, ?)',
+        (patron_id, kind, payload, created_at.isoformat())
+    )
+
+def queue_reminder(conn: sqlite3.Connection, patron_id: str, kind: str,
+                   loans: Sequence[Tuple[int, int]], payload: Callable[[Sequence[Tuple[int, int]]], str],
+                   created_at: datetime) -> int:
+    """
+    Queue one outbox message for a patron's loans, within a transaction.
+
+    loans are (loan_database, loan_id) pairs; those already reminded of this
+    kind are dropped first, and payload(remaining_loans) builds the message.
+
+    Returns:
+        int: Number of loans the queued message covers (0 if nothing was queued)
+    """
+    fresh = []
+    for loan in loans:
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO reminder_log (loan_database, loan_id, kind) VALUES (?, ?, ?)',
+            (*loan, kind)
+        )
+        if cursor.rowcount:
+            fresh.append(loan)
+    if fresh:
+        queue_outbox_message(conn, patron_id, kind, payload(fresh), created_at)
+    return len(fresh)
+
+def get_pending_reminders(limit: int, max_attempts: int) -> List[Dict]:
+    """Get the oldest undelivered outbox messages that have not used up their delivery attempts."""
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT id, patron_id, kind, payload, created_at, attempts FROM reminder_outbox
+        WHERE delivered_at IS NULL AND attempts < ?
+        ORDER BY id
+        LIMIT ?
+    ''', (max_attempts, limit)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def count_pending_reminders() -> int:
+    """Get the number of undelivered outbox messages."""
+    conn = get_db_connection()
+    count = conn.execute('SELECT COUNT(*) AS count FROM reminder_outbox WHERE delivered_at IS NULL').fetchone()['count']
+    conn.close()
+    return count
+
+def mark_reminder_delivered(conn: sqlite3.Connection, reminder_id: int, delivered_at: datetime) -> None:
+    """Mark an outbox message as delivered, within a transaction."""
+    conn.execute('UPDATE reminder_outbox SET delivered_at = ?, attempts = attempts + 1 WHERE id = ?',
+                 (delivered_at.isoformat(), reminder_id))
+
+def record_reminder_attempt(conn: sqlite3.Connection, reminder_id: int) -> None:
+    """Count a failed delivery attempt of an outbox message, within a transaction."""
+    conn.execute('UPDATE reminder_outbox SET attempts = attempts + 1 WHERE id = ?', (reminder_id,))
+
+# Holds
+#
+# Every book has a FIFO queue of waiting holds (idx_holds_queue, ordered by
+# hold ID). A copy that becomes free goes to the head of its queue instead of
+# back to available_copies: the hold turns 'ready' and the patron has
+# HOLD_PICKUP_DAYS to borrow it before it expires and passes the copy on.
+# Holds live in the catalog database, next to the copies they set aside.
+
+def release_copy(conn: sqlite3.Connection, book_id: int, when: datetime) -> Optional[int]:
+    """
+    Give a freed copy to the next waiting hold, or back to the catalog,
+    within a catalog transaction. The patron is notified through the outbox.
+
+    Returns:
+        int: ID of the hold the copy was set aside for, or None if it went back to the catalog
+    """
+    expires_at = when + timedelta(days=HOLD_PICKUP_DAYS)
+    hold = conn.execute('''
+        UPDATE holds SET status = 'ready', ready_at = ?, expires_at = ?
+        WHERE id = (
+            SELECT id FROM holds
+            WHERE book_id = ? AND status = 'waiting'
+            ORDER BY id LIMIT 1
+        )
+        RETURNING id, patron_id
+    ''', (when.isoformat(), expires_at.isoformat(), book_id)).fetchone()
+    if hold is None:
+        conn.execute('UPDATE books SET available_copies = available_copies + 1 WHERE id = ?', (book_id,))
+        return None
+    title = conn.execute('SELECT title FROM books WHERE id = ?', (book_id,)).fetchone()['title']
+    queue_outbox_message(conn, hold['patron_id'], 'hold_ready', json.dumps({
+        'patron_id': hold['patron_id'],
+        'kind': 'hold_ready',
+        'book_id': book_id,
+        'title': title,
+        'expires_at': expires_at.isoformat()
+    }), when)
+    return hold['id']
+
+def claim_ready_hold(conn: sqlite3.Connection, patron_id: str, book_id: int, when: datetime) -> Optional[int]:
+    """Mark the patron's ready hold on a book as picked up, within a catalog transaction."""
+    row = conn.execute('''
+        UPDATE holds SET status = 'fulfilled', closed_at = ?
+        WHERE patron_id = ? AND book_id = ? AND status = 'ready'
+        RETURNING id
+    ''', (when.isoformat(), patron_id, book_id)).fetchone()
+    return row['id'] if row else None
+
+def has_ready_hold(patron_id: str, book_id: int) -> bool:
+    """Whether a copy of a book is set aside for the patron to pick up."""
+    conn = get_db_connection()
+    row = conn.execute(
+        "SELECT 1 FROM holds WHERE patron_id = ? AND book_id = ? AND status = 'ready'", (patron_id, book_id)
+    ).fetchone()
+    conn.close()
+    return row is not None
+
+def insert_hold(conn: sqlite3.Connection, patron_id: str, book_id: int, placed_at: datetime) -> Optional[int]:
+    """
+    Join the end of a book's hold queue, within a catalog transaction.
+
+    Returns:
+        int: ID of the new hold, or None if the patron already has an open hold on the book
+    """
+    try:
+        cursor = conn.execute(
+            'INSERT INTO holds (book_id, patron_id, placed_at) VALUES (?, ?, ?)',
+            (book_id, patron_id, placed_at.isoformat())
+        )
+    except sqlite3.IntegrityError:
+        return None
+    return cursor.lastrowid
+
+def cancel_hold(conn: sqlite3.Connection, patron_id: str, book_id: int, when: datetime) -> Optional[str]:
+    """
+    Cancel the patron's open hold on a book, within a catalog transaction.
+    A copy already set aside for it passes to the next hold in line.
+
+    Returns:
+        str: Status the hold had ('waiting' or 'ready'), or None if there was no open hold
+    """
+    row = conn.execute('''
+        SELECT id, status FROM holds
+        WHERE patron_id = ? AND book_id = ? AND status IN ('waiting', 'ready')
+    ''', (patron_id, book_id)).fetchone()
+    if row is None:
+        return None
+    conn.execute("UPDATE holds SET status = 'cancelled', closed_at = ? WHERE id = ?", (when.isoformat(), row['id']))
+    if row['status'] == 'ready':
+        release_copy(conn, book_id, when)
+    return row['status']
+
+def expire_ready_holds(conn: sqlite3.Connection, now: datetime, limit: int) -> List[int]:
+    """
+    Expire up to limit ready holds whose pickup deadline has passed, passing
+    their copies on, within a catalog transaction.
+
+    Returns:
+        list: Book ID of each hold expired
+    """
+    rows = conn.execute('''
+        SELECT id, book_id FROM holds
+        WHERE status = 'ready' AND expires_at <= ?
+        ORDER BY expires_at
+        LIMIT ?
+    ''', (now.isoformat(), limit)).fetchall()
+    for row in rows:
+        conn.execute("UPDATE holds SET status = 'expired', closed_at = ? WHERE id = ?", (now.isoformat(), row['id']))
+        release_copy(conn, row['book_id'], now)
+    return [row['book_id'] for row in rows]
+
+def get_next_hold_expiry() -> Optional[datetime]:
+    """Get the earliest pickup deadline of any ready hold."""
+    conn = get_db_connection()
+    row = conn.execute('''
+        SELECT expires_at FROM holds
+        WHERE status = 'ready'
+        ORDER BY expires_at LIMIT 1
+    ''').fetchone()
+    conn.close()
+    return datetime.fromisoformat(row['expires_at']) if row else None
+
+def get_patron_holds(patron_id: str) -> List[Dict]:
+    """
+    Get a patron's open holds with their queue positions (1 = next in line;
+    ready holds have position 0).
+    """
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT h.id, h.book_id, b.title, h.status, h.placed_at, h.expires_at,
+               CASE WHEN h.status = 'waiting' THEN (
+                   SELECT COUNT(*) FROM holds q
+                   WHERE q.book_id = h.book_id AND q.status = 'waiting' AND q.id <= h.id
+               ) ELSE 0 END AS position
+        FROM holds h
+        JOIN books b ON b.id = h.book_id
+        WHERE h.patron_id = ? AND h.status IN ('waiting', 'ready')
+        ORDER BY h.id
+    ''', (patron_id,)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def get_hold_queue_length(book_id: int) -> int:
+    """Get the number of patrons waiting for a book."""
+    conn = get_db_connection()
+    count = conn.execute(
+        "SELECT COUNT(*) AS count FROM holds WHERE book_id = ? AND status = 'waiting'", (book_id,)
+    ).fetchone()['count']
+    conn.close()
+    return count
+
+# Reports
+
+def get_overdue_loans(as_of: datetime) -> List[Dict]:
+    """
+    Get every open loan due before as_of, across all shards, ordered by due date.
+
+    Each shard returns its loans already sorted, so the per-shard lists are
+    merged rather than re-sorted.
+    """
+    results = scatter_gather('''
+        SELECT br.patron_id, br.book_id, br.borrow_date, br.due_date, b.title, b.author
+        FROM borrow_records br
+        JOIN books b ON br.book_id = b.id
+        WHERE br.return_date IS NULL AND br.due_date < ?
+        ORDER BY br.due_date
+    ''', (as_of.isoformat(),))
+
+    return [
+        {
+            'patron_id': row['patron_id'],
+            'book_id': row['book_id'],
+            'title': row['title'],
+            'author': row['author'],
+            'borrow_date': datetime.fromisoformat(row['borrow_date']),
+            'due_date': datetime.fromisoformat(row['due_date'])
+        }
+        for row in heapq.merge(*results, key=lambda row: row['due_date'])
+    ]
+
+# Change Feed
+
+# change_log is filled by triggers on books and borrow_records (see
+# _create_change_triggers). The main database logs catalog changes, and loan
+# changes too when sharding is off; each patron shard logs its own loans with
+# its own sequence. Consumers page through a log by sequence number.
+
+def _connect_change_log(shard: Optional[int]) -> sqlite3.Connection:
+    if shard is None:
+        return get_db_connection()
+    if not 0 <= shard < shard_count():
+        raise ValueError(f"No loan shard {shard}.")
+    return connect_shard(shard, attach_catalog=False)
+
+def get_changes(since: int, limit: int, shard: Optional[int] = None) -> List[Dict]:
+    """Get up to limit change_log entries with seq > since, oldest first, from the main database or a shard."""
+    conn = _connect_change_log(shard)
+    rows = conn.execute('''
+        SELECT seq, table_name, row_id, op, row_data, changed_at
+        FROM change_log
+        WHERE seq > ?
+        ORDER BY seq
+        LIMIT ?
+    ''', (since, limit)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def get_change_log_bounds(shard: Optional[int] = None) -> Tuple[Optional[int], int]:
+    """
+    Get the oldest retained and the latest assigned sequence numbers of a
+    change log (oldest is None when compaction has emptied it).
+    """
+    conn = _connect_change_log(shard)
+    oldest = conn.execute('SELECT MIN(seq) AS seq FROM change_log').fetchone()['seq']
+    latest = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    conn.close()
+    return oldest, latest['seq'] if latest else 0
+
+def compact_change_log_batch(conn: sqlite3.Connection, changed_before: datetime, batch_size: int) -> int:
+    """
+    Delete up to batch_size of the oldest change_log entries recorded before a
+    cutoff, within a transaction. Entries are taken in sequence order, so the
+    retained log is always a contiguous tail.
+
+    Returns:
+        int: Number of entries deleted
+    """
+    cutoff = changed_before.isoformat(timespec='milliseconds')
+    last = None
+    for row in conn.execute('SELECT seq, changed_at FROM change_log ORDER BY seq LIMIT ?', (batch_size,)):
+        if row['changed_at'] >= cutoff:
+            break
+        last = row['seq']
+    if last is None:
+        return 0
+    return conn.execute('DELETE FROM change_log WHERE seq <= ?', (last,)).rowcount
@@ -0,0 +1,226 @@
+"""
+Admin Routes - Operational endpoints for inspecting a running app
+"""
+
+from flask import Blueprint, Response, abort, current_app, jsonify, request
+from services.memory_diagnostics import DEFAULT_TRACE_FRAMES
+from services.backup import list_snapshots
+from services.request_profiler import PROCESS_WIDE
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
+
+# Largest top-N accepted by the profile and memory endpoints
+MAX_TOP_N = 200
+
+def _top_n():
+    """The ?n= top-N size of the request (default 20)."""
+    n = int(request.args.get('n', 20))
+    if n < 1 or n > MAX_TOP_N:
+        raise ValueError(f"n must be between 1 and {MAX_TOP_N}.")
+    return n
+
+def _profiler():
+    profiler = current_app.extensions.get('request_profiler')
+    if profiler is None:
+        abort(404, description='Request profiling is not enabled.')
+    return profiler
+
+@admin_bp.route('/profile')
+def profile_summary():
+    """
+    Hottest functions of the profiled requests.
+    Query: ?endpoint=<name> (default all), ?n=<count> (default 20), ?sort=tottime|cumtime
+    """
+    profiler = _profiler()
+    endpoint = request.args.get('endpoint')
+    try:
+        top = profiler.top_functions(_top_n(), request.args.get('sort', 'tottime'), endpoint)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'sample_rate': profiler.sample_rate,
+        'header': profiler.header,
+        'skipped': profiler.skipped,
+        'process_wide': PROCESS_WIDE,
+        'endpoints': profiler.endpoints(),
+        'endpoint': endpoint,
+        'top': top
+    })
+
+@admin_bp.route('/profile/collapsed')
+def profile_collapsed():
+    """
+    Collapsed stacks of the profiled requests, for flamegraph.pl or speedscope.
+    Query: ?endpoint=<name> (default all)
+    """
+    return Response(_profiler().collapsed(request.args.get('endpoint')), mimetype='text/plain')
+
+@admin_bp.route('/profile/dump', methods=['POST'])
+def profile_dump():
+    """
+    Write one collapsed-stack file per endpoint to PROFILE_OUTPUT_DIR.
+    """
+    try:
+        paths = _profiler().write_collapsed()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'files': paths})
+
+@admin_bp.route('/profile/reset', methods=['POST'])
+def profile_reset():
+    """
+    Drop the profiles collected so far.
+    """
+    _profiler().reset()
+    return jsonify({'success': True})
+
+def _memory():
+    diagnostics = current_app.extensions.get('memory_diagnostics')
+    if diagnostics is None:
+        abort(404, description='Memory diagnostics are not enabled.')
+    return diagnostics
+
+@admin_bp.route('/memory')
+def memory_status():
+    """
+    Tracing state, traced and peak memory, snapshots and per-endpoint request peaks.
+    """
+    return jsonify(_memory().status())
+
+@admin_bp.route('/memory/start', methods=['POST'])
+def memory_start():
+    """
+    Start tracing allocations.
+    Body (optional): {"frames": 10}
+    """
+    frames = (request.get_json(silent=True) or {}).get('frames', DEFAULT_TRACE_FRAMES)
+    if not isinstance(frames, int) or frames < 1:
+        return jsonify({'error': '"frames" must be a positive integer'}), 400
+    _memory().start(frames)
+    return jsonify(_memory().status())
+
+@admin_bp.route('/memory/stop', methods=['POST'])
+def memory_stop():
+    """
+    Stop tracing allocations (snapshots are kept).
+    """
+    _memory().stop()
+    return jsonify(_memory().status())
+
+@admin_bp.route('/memory/reset_requests', methods=['POST'])
+def memory_reset_requests():
+    """
+    Forget the per-endpoint request peaks recorded so far.
+    """
+    _memory().reset_requests()
+    return jsonify({'success': True})
+
+@admin_bp.route('/memory/snapshots', methods=['POST'])
+def memory_take_snapshot():
+    """
+    Take a snapshot of traced memory.
+    Body (optional): {"label": "after catalog warmup"}
+    """
+    label = str((request.get_json(silent=True) or {}).get('label', ''))
+    try:
+        snapshot = _memory().take_snapshot(label)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify(snapshot), 201
+
+@admin_bp.route('/memory/snapshots/<int:snapshot_id>')
+def memory_snapshot(snapshot_id):
+    """
+    Modules holding the most traced memory in a snapshot.
+    Query: ?n=<count> (default 20)
+    """
+    try:
+        modules = _memory().snapshot_modules(snapshot_id, _top_n())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except KeyError:
+        return jsonify({'error': 'Snapshot not found'}), 404
+    return jsonify({'id': snapshot_id, 'modules': modules})
+
+@admin_bp.route('/memory/diff')
+def memory_diff():
+    """
+    Modules whose traced memory changed most between two snapshots.
+    Query: ?from=<snapshot id>&to=<snapshot id>&n=<count> (default 20)
+    """
+    try:
+        from_id = int(request.args.get('from', ''))
+        to_id = int(request.args.get('to', ''))
+    except ValueError:
+        return jsonify({'error': 'Integer "from" and "to" snapshot IDs are required'}), 400
+    try:
+        changes = _memory().diff(from_id, to_id, _top_n())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except KeyError:
+        return jsonify({'error': 'Snapshot not found'}), 404
+    return jsonify({'from': from_id, 'to': to_id, 'modules': changes})
+
+def _backups():
+    scheduler = current_app.extensions.get('backup_scheduler')
+    if scheduler is None:
+        abort(404, description='Scheduled backups are not enabled.')
+    return scheduler
+
+@admin_bp.route('/backups')
+def backup_status():
+    """
+    Backup counters, the last snapshot's copy rate, request latency during vs
+    outside backups, and the retained snapshots.
+    """
+    scheduler = _backups()
+    return jsonify({**scheduler.stats(), 'snapshots': list_snapshots(scheduler.backup_dir)})
+
+@admin_bp.route('/backups', methods=['POST'])
+def backup_trigger():
+    """
+    Ask the backup scheduler to take a snapshot now; it runs in the background.
+    """
+    _backups().trigger()
+    return jsonify({'success': True}), 202
+
+def _maintenance():
+    scheduler = current_app.extensions.get('maintenance_scheduler')
+    if scheduler is None:
+        abort(404, description='Scheduled maintenance is not enabled.')
+    return scheduler
+
+@admin_bp.route('/maintenance')
+def maintenance_status():
+    """
+    Maintenance window, traffic state and the recorded runs (page counts,
+    freelist size and task durations per database), newest first.
+    """
+    return jsonify(_maintenance().stats())
+
+@admin_bp.route('/maintenance', methods=['POST'])
+def maintenance_trigger():
+    """
+    Ask the maintenance scheduler to run now, outside its window; it runs in the background.
+    """
+    _maintenance().trigger()
+    return jsonify({'success': True}), 202
+
+@admin_bp.route('/catalog_snapshot')
+def catalog_snapshot_status():
+    """
+    Path, search version and size of the loaded catalog snapshot, and how
+    often it was rebuilt or reloaded from another worker's rebuild.
+    """
+    snapshot = current_app.extensions.get('catalog_snapshot')
+    if snapshot is None:
+        abort(404, description='The catalog snapshot search backend is not enabled.')
+    return jsonify(snapshot.stats())
+
+@admin_bp.route('/suggest')
+def suggest_status():
+    """
+    Sizes, catalog search version and rebuild, insert and lookup counts of
+    the typeahead index behind /api/suggest.
+    """
+    return jsonify(current_app.extensions['suggest_index'].stats())
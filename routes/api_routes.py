@@ -2,11 +2,26 @@
 API Routes - JSON API endpoints
 """
 
-from flask import Blueprint, jsonify, request
-from services.library_service import calculate_late_fee_for_book, search_books_in_catalog
+from flask import Blueprint, current_app, jsonify, request, Response, stream_with_context
+from services.library_service import (
+    calculate_late_fee_for_book, search_books_in_catalog,
+    calculate_late_fees_batch, get_availability_batch,
+    borrow_books_by_patron, return_books_by_patron, get_overdue_report,
+    STATUS_HISTORY_LIMIT, get_patron_history
+)
+from services.analytics import get_top_books, get_top_authors
+from services.recommendations import get_related
+from services.holds import place_hold, cancel_patron_hold, get_holds_for_patron
+from database import count_pending_reminders
+from services.catalog_export import EXPORT_FORMATS, parse_export_fields, export_catalog, gzip_stream
+from services.change_feed import DEFAULT_PAGE_SIZE, get_change_page
+from services.suggest import DEFAULT_LIMIT as DEFAULT_SUGGEST_LIMIT, get_suggest_index
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
+# Maximum number of items accepted by the batch lookup endpoints
+MAX_BATCH_SIZE = 1000
+
 @api_bp.route('/late_fee/<patron_id>/<int:book_id>')
 def get_late_fee(patron_id, book_id):
     """
@@ -37,3 +52,295 @@ def search_books_api():
         'results': books,
         'count': len(books)
     })
+
+@api_bp.route('/suggest')
+def suggest_api():
+    """
+    Typeahead completions of a title or author prefix, most borrowed first.
+    Query: ?q=<prefix>, ?type=title|author (default title) and ?limit=<count> (default 10)
+    """
+    prefix = request.args.get('q', '')
+    suggest_type = request.args.get('type', 'title')
+    try:
+        suggestions = get_suggest_index().suggest(prefix, suggest_type, int(request.args.get('limit', DEFAULT_SUGGEST_LIMIT)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'q': prefix, 'type': suggest_type, 'suggestions': suggestions, 'count': len(suggestions)})
+
+@api_bp.route('/catalog/export.<fmt>')
+def export_catalog_api(fmt):
+    """
+    Stream the whole catalog as NDJSON or CSV.
+    Supports sparse fieldsets (?fields=title,isbn), resuming after a book ID
+    (?since=<id>) and gzip when the client sends Accept-Encoding: gzip.
+    """
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported export format: {fmt}'}), 404
+    
+    try:
+        fields = parse_export_fields(request.args.get('fields'))
+        since_id = int(request.args.get('since', 0))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    chunks = export_catalog(fmt, fields, since_id)
+    
+    headers = {'Content-Disposition': f'attachment; filename=catalog.{fmt}'}
+    if 'gzip' in request.accept_encodings:
+        chunks = gzip_stream(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    
+    return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt], headers=headers)
+
+@api_bp.route('/changes')
+def changes_feed():
+    """
+    Page through inserts, updates and deletes of books and borrow records.
+    Query: ?since=<seq> (last sequence applied, default 0), ?limit=<count>
+    and ?shard=<index> for a patron shard's loan changes. Answers 410 when
+    changes after since were compacted away and the consumer must resync.
+    """
+    try:
+        shard = request.args.get('shard')
+        shard = int(shard) if shard is not None else None
+        page = get_change_page(int(request.args.get('since', 0)), int(request.args.get('limit', DEFAULT_PAGE_SIZE)), shard)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page), 410 if page['resync_required'] else 200
+
+@api_bp.route('/late_fee/batch', methods=['POST'])
+def get_late_fees_batch():
+    """
+    Calculate late fees for many (patron_id, book_id) pairs in one request.
+    Batch variant of R4: Late Fee Calculation.
+    Body: {"items": [{"patron_id": "123456", "book_id": 1}, ...]}
+    """
+    payload = request.get_json(silent=True) or {}
+    items = payload.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'A non-empty "items" list is required'}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} items per batch'}), 400
+    
+    # Malformed items are reported in place; the rest are looked up together
+    pairs = []
+    results = []
+    for item in items:
+        book_id = item.get('book_id') if isinstance(item, dict) else None
+        patron_id = item.get('patron_id') if isinstance(item, dict) else None
+        if not isinstance(book_id, int) or not isinstance(patron_id, str):
+            results.append({'error': 'Each item needs a string patron_id and an integer book_id'})
+        else:
+            pairs.append((patron_id.strip(), book_id))
+            results.append(None)
+    
+    fees = iter(calculate_late_fees_batch(pairs))
+    results = [result if result is not None else next(fees) for result in results]
+    
+    return jsonify({'results': results, 'count': len(results)})
+
+@api_bp.route('/availability/batch', methods=['POST'])
+def get_availability_batch_api():
+    """
+    Look up availability for many books in one request.
+    Body: {"book_ids": [1, 2, 3]}
+    """
+    payload = request.get_json(silent=True) or {}
+    book_ids = payload.get('book_ids')
+    if not isinstance(book_ids, list) or not book_ids:
+        return jsonify({'error': 'A non-empty "book_ids" list is required'}), 400
+    if len(book_ids) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} book IDs per batch'}), 400
+    
+    valid_ids = [book_id for book_id in book_ids if isinstance(book_id, int)]
+    availability = iter(get_availability_batch(valid_ids))
+    results = [
+        next(availability) if isinstance(book_id, int) else {'book_id': book_id, 'error': 'Invalid book ID.'}
+        for book_id in book_ids
+    ]
+    
+    return jsonify({'results': results, 'count': len(results)})
+
+@api_bp.route('/availability/stream')
+def availability_stream():
+    """
+    Stream availability changes as Server-Sent Events.
+    Each "availability" event carries book_id and available_copies; clients
+    resume with the Last-Event-ID header and reload on a "reset" event.
+    """
+    bus = current_app.extensions.get('availability_bus')
+    if bus is None:
+        return jsonify({'error': 'The availability stream is not enabled'}), 404
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    events = bus.stream(
+        last_event_id,
+        heartbeat=current_app.config['AVAILABILITY_HEARTBEAT_SECONDS'],
+        max_seconds=current_app.config['AVAILABILITY_STREAM_MAX_SECONDS']
+    )
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(events, mimetype='text/event-stream', headers=headers)
+
+@api_bp.route('/availability/stats')
+def availability_stream_stats():
+    """
+    Counters of the availability bus: notifications, reads, events and open streams.
+    """
+    bus = current_app.extensions.get('availability_bus')
+    if bus is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **bus.stats()})
+
+@api_bp.route('/reports/overdue')
+def overdue_report():
+    """
+    List every overdue loan, most overdue first.
+    Gathers loans from all patron shards when sharding is enabled.
+    """
+    return jsonify(get_overdue_report())
+
+@api_bp.route('/reminders/stats')
+def reminder_stats():
+    """
+    Counters of the due-soon and overdue reminder scheduler and the outbox depth.
+    """
+    scheduler = current_app.extensions.get('reminder_scheduler')
+    if scheduler is None:
+        return jsonify({'enabled': False, 'outbox_depth': count_pending_reminders()})
+    return jsonify({'enabled': True, **scheduler.stats()})
+
+@api_bp.route('/books/<int:book_id>/related')
+def related_books(book_id):
+    """
+    Books most often borrowed by patrons who borrowed this one.
+    Query: ?limit=<count> (default 10)
+    """
+    try:
+        related = get_related(book_id, int(request.args.get('limit', 10)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if related is None:
+        return jsonify({'error': 'Book not found.'}), 404
+    return jsonify({'book_id': book_id, 'related': related, 'count': len(related)})
+
+@api_bp.route('/analytics/top_books')
+def top_books():
+    """
+    Most borrowed books in a rolling window.
+    Query: ?window=day|week|month|year (default week) and ?n=<count> (default 10)
+    """
+    return _ranking(get_top_books)
+
+@api_bp.route('/analytics/top_authors')
+def top_authors():
+    """
+    Authors whose books were borrowed most in a rolling window.
+    Query: ?window=day|week|month|year (default week) and ?n=<count> (default 10)
+    """
+    return _ranking(get_top_authors)
+
+def _ranking(ranking_function):
+    window = request.args.get('window', 'week')
+    try:
+        results = ranking_function(window, int(request.args.get('n', 10)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'window': window, 'results': results, 'count': len(results)})
+
+@api_bp.route('/holds', methods=['POST'])
+def create_hold():
+    """
+    Join the waitlist for a book with no available copies.
+    Body: {"patron_id": "123456", "book_id": 3}
+    """
+    payload = request.get_json(silent=True) or {}
+    patron_id = payload.get('patron_id')
+    book_id = payload.get('book_id')
+    if not isinstance(patron_id, str) or not isinstance(book_id, int):
+        return jsonify({'error': 'A string "patron_id" and an integer "book_id" are required'}), 400
+    
+    success, message = place_hold(patron_id.strip(), book_id)
+    if not success:
+        return jsonify({'success': False, 'message': message}), 500 if message.startswith('Database error') else 400
+    return jsonify({'success': True, 'message': message}), 201
+
+@api_bp.route('/holds/<patron_id>')
+def patron_holds(patron_id):
+    """
+    A patron's open holds with their queue positions (1 = next in line,
+    0 = a copy is waiting to be picked up before expires_at).
+    """
+    holds = get_holds_for_patron(patron_id)
+    return jsonify({'patron_id': patron_id, 'holds': holds, 'count': len(holds)})
+
+@api_bp.route('/patrons/<patron_id>/history')
+def patron_history(patron_id):
+    """
+    Page through a patron's returned loans, most recent first.
+    Query: ?limit=<count> and ?before=<next_before of the previous page>
+    """
+    try:
+        page = get_patron_history(patron_id, int(request.args.get('limit', STATUS_HISTORY_LIMIT)),
+                                  request.args.get('before'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page)
+
+@api_bp.route('/holds/<patron_id>/<int:book_id>', methods=['DELETE'])
+def delete_hold(patron_id, book_id):
+    """
+    Cancel a patron's hold on a book.
+    """
+    success, message = cancel_patron_hold(patron_id, book_id)
+    if not success:
+        return jsonify({'success': False, 'message': message}), 404 if message.startswith('No hold') else 400
+    return jsonify({'success': True, 'message': message})
+
+@api_bp.route('/cart/borrow', methods=['POST'])
+def borrow_cart():
+    """
+    Check out several books for one patron in a single transaction.
+    Bulk interface for R3: Book Borrowing.
+    Body: {"patron_id": "123456", "book_ids": [1, 2, 3]}
+    """
+    return _process_cart(borrow_books_by_patron)
+
+@api_bp.route('/cart/return', methods=['POST'])
+def return_cart():
+    """
+    Return several books for one patron in a single transaction.
+    Bulk interface for R4: Book Return Processing.
+    Body: {"patron_id": "123456", "book_ids": [1, 2, 3]}
+    """
+    return _process_cart(return_books_by_patron)
+
+def _process_cart(cart_operation):
+    """Validate a cart request body and apply cart_operation to it."""
+    payload = request.get_json(silent=True) or {}
+    patron_id = payload.get('patron_id')
+    book_ids = payload.get('book_ids')
+    if not isinstance(patron_id, str) or not isinstance(book_ids, list):
+        return jsonify({'error': 'A string "patron_id" and a "book_ids" list are required'}), 400
+    if not book_ids:
+        return jsonify({'error': 'The cart is empty.'}), 400
+    if len(book_ids) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} books per cart'}), 400
+    
+    # Malformed IDs are reported in place; the rest go through the cart
+    valid_ids = [book_id for book_id in book_ids if isinstance(book_id, int)]
+    if valid_ids:
+        success, message, items = cart_operation(patron_id.strip(), valid_ids)
+        if not items:
+            status = 500 if message.startswith('Database error') else 400
+            return jsonify({'success': False, 'message': message, 'items': []}), status
+    else:
+        success, message, items = False, "No valid book IDs in the cart.", []
+    
+    applied = iter(items)
+    items = [
+        next(applied) if isinstance(book_id, int) else {'book_id': book_id, 'success': False, 'message': 'Invalid book ID.'}
+        for book_id in book_ids
+    ]
+    success = success and len(valid_ids) == len(book_ids)
+    
+    return jsonify({'success': success, 'message': message, 'items': items})
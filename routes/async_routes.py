@@ -0,0 +1,137 @@
+"""
+Async Routes - asyncio-based JSON endpoints for catalog, search and payments
+Database calls run on the async service layer's executor and payments await
+the async gateway client.
+
+Each endpoint is written once, as a coroutine returning (payload, status),
+and served two ways. async_bp mounts them as Flask async views (Flask's async
+extra, asgiref); under WSGI each of those still holds a worker thread for the
+whole gateway call. AsyncApi serves them as a native ASGI app, straight on the
+ASGI server's event loop, so a request waiting on the gateway holds no thread;
+asgi.py puts it in front of the Flask app.
+"""
+
+import functools
+import json
+from typing import Dict, Mapping, Optional, Tuple
+from urllib.parse import parse_qsl
+from flask import Blueprint, Flask, jsonify, request
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Map, Rule
+from services.async_library_service import (
+    get_all_books_async, search_books_in_catalog_async,
+    calculate_late_fee_for_book_async, pay_late_fees_async
+)
+from services.async_payment_service import AsyncPaymentGateway
+
+ASYNC_PREFIX = '/api/async'
+
+async_bp = Blueprint('async_api', __name__, url_prefix=ASYNC_PREFIX)
+
+async def catalog_payload(args: Mapping[str, str]) -> Tuple[Dict, int]:
+    """
+    List all books in the catalog.
+    Async JSON interface for R2: Book Catalog Display
+    """
+    books = await get_all_books_async()
+    return {'results': books, 'count': len(books)}, 200
+
+async def search_payload(args: Mapping[str, str]) -> Tuple[Dict, int]:
+    """
+    Search for books.
+    Async JSON interface for R6: Book Search Functionality
+    """
+    search_term = args.get('q', '').strip()
+    search_type = args.get('type', 'title')
+
+    if not search_term:
+        return {'error': 'Search term is required'}, 400
+
+    books = await search_books_in_catalog_async(search_term, search_type)
+
+    return {
+        'search_term': search_term,
+        'search_type': search_type,
+        'results': books,
+        'count': len(books)
+    }, 200
+
+async def late_fee_payload(args: Mapping[str, str], patron_id: str, book_id: int) -> Tuple[Dict, int]:
+    """
+    Calculate the late fee for a book borrowed by a patron.
+    Async JSON interface for R5: Late Fee Calculation
+    """
+    return await calculate_late_fee_for_book_async(patron_id, book_id), 200
+
+async def pay_late_fee_payload(args: Mapping[str, str], patron_id: str, book_id: int,
+                               gateway: Optional[AsyncPaymentGateway] = None) -> Tuple[Dict, int]:
+    """
+    Pay the late fee for a book through the async payment gateway.
+    """
+    success, message, transaction_id = await pay_late_fees_async(patron_id, book_id, gateway)
+    return {
+        'success': success,
+        'message': message,
+        'transaction_id': transaction_id
+    }, 200 if success else 400
+
+@async_bp.route('/catalog')
+async def catalog_async():
+    payload, status = await catalog_payload(request.args)
+    return jsonify(payload), status
+
+@async_bp.route('/search')
+async def search_books_async():
+    payload, status = await search_payload(request.args)
+    return jsonify(payload), status
+
+@async_bp.route('/late_fee/<patron_id>/<int:book_id>')
+async def get_late_fee_async(patron_id, book_id):
+    payload, status = await late_fee_payload(request.args, patron_id, book_id)
+    return jsonify(payload), status
+
+@async_bp.route('/pay_late_fee/<patron_id>/<int:book_id>', methods=['POST'])
+async def pay_late_fee_async(patron_id, book_id):
+    payload, status = await pay_late_fee_payload(request.args, patron_id, book_id)
+    return jsonify(payload), status
+
+
+class AsyncApi:
+    """
+    Native ASGI app serving the async endpoints on the server's event loop,
+    inside the Flask app's context; every other request (and non-HTTP scope)
+    is passed to fallback, usually the Flask app wrapped by WsgiToAsgi.
+    """
+
+    def __init__(self, app: Flask, fallback, gateway: Optional[AsyncPaymentGateway] = None):
+        self.app = app
+        self.fallback = fallback
+        pay = functools.partial(pay_late_fee_payload, gateway=gateway)
+        self.url_map = Map([
+            Rule(f'{ASYNC_PREFIX}/catalog', endpoint=catalog_payload, methods=['GET']),
+            Rule(f'{ASYNC_PREFIX}/search', endpoint=search_payload, methods=['GET']),
+            Rule(f'{ASYNC_PREFIX}/late_fee/<patron_id>/<int:book_id>', endpoint=late_fee_payload, methods=['GET']),
+            Rule(f'{ASYNC_PREFIX}/pay_late_fee/<patron_id>/<int:book_id>', endpoint=pay, methods=['POST'])
+        ])
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http' or not scope['path'].startswith(ASYNC_PREFIX + '/'):
+            await self.fallback(scope, receive, send)
+            return
+        try:
+            endpoint, values = self.url_map.bind('').match(scope['path'], scope['method'])
+        except HTTPException as e:
+            payload, status = {'error': e.name}, e.code
+        else:
+            args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+            with self.app.app_context():
+                payload, status = await endpoint(args, **values)
+
+        body = json.dumps(payload).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        })
+        await send({'type': 'http.response.body', 'body': body})
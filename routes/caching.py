@@ -0,0 +1,51 @@
+"""
+Caching helpers - Serve rendered pages from the app's ResponseCache
+"""
+
+from functools import wraps
+from flask import current_app, request, session, make_response
+from database import get_catalog_version
+
+
+def cached_page(view):
+    """
+    Cache the rendered output of a GET view keyed by route, query args and the
+    catalog data version.
+
+    Cached bodies are only served (or stored) when the session has no pending
+    flashed messages, and a response is never stored if rendering touched the
+    session, so one user's flashes cannot leak into another user's page.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cache = current_app.extensions.get('response_cache')
+        if cache is None or request.method != 'GET' or session.get('_flashes'):
+            return view(*args, **kwargs)
+
+        key = (
+            request.endpoint,
+            tuple(sorted(request.args.items(multi=True))),
+            get_catalog_version()
+        )
+        entry = cache.get(key)
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough or session.modified:
+                return response
+            entry = cache.put(key, response.get_data(), response.mimetype, response.status_code)
+
+        if _accepts_gzip(entry):
+            response = make_response(entry.gzip_body, entry.status)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = make_response(entry.body, entry.status)
+        response.mimetype = entry.mimetype
+        response.vary.add('Accept-Encoding')
+        return response
+
+    return wrapper
+
+
+def _accepts_gzip(entry) -> bool:
+    """Whether the cached entry has a gzip variant the client can accept."""
+    return entry.gzip_body is not None and 'gzip' in request.accept_encodings
@@ -5,6 +5,7 @@ Catalog Routes - Book catalog related endpoints
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from database import get_all_books
 from services.library_service import add_book_to_catalog
+from routes.caching import cached_page
 
 catalog_bp = Blueprint('catalog', __name__)
 
@@ -14,6 +15,7 @@ def index():
     return redirect(url_for('catalog.catalog'))
 
 @catalog_bp.route('/catalog')
+@cached_page
 def catalog():
     """
     Display all books in the catalog.
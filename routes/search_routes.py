@@ -4,10 +4,12 @@ Search Routes - Book search functionality
 
 from flask import Blueprint, render_template, request, flash
 from services.library_service import search_books_in_catalog
+from routes.caching import cached_page
 
 search_bp = Blueprint('search', __name__)
 
 @search_bp.route('/search')
+@cached_page
 def search_books():
     """
     Search for books in the catalog.
@@ -0,0 +1,99 @@
+"""
+Analytics Module - Circulation rankings over rolling windows
+Borrows are counted into daily and per-window aggregate tables by the borrow
+and return paths (see database.record_circulation), so rankings never scan the
+loan tables: each ranking is an index range read over the window's running
+totals (or, with loan sharding, a bounded heap over the summed shard totals).
+"""
+
+import threading
+from datetime import datetime
+from typing import Dict, List
+from database import (
+    CIRCULATION_WINDOWS, advance_circulation_windows, current_database, get_books_by_ids,
+    get_top_authors_by_borrows, get_top_books_by_borrows, rebuild_circulation_windows, rebuild_daily_circulation,
+    run_write_on_loan_databases
+)
+
+# Largest ranking a caller may ask for
+MAX_TOP_N = 100
+
+# Day each database's windows were last moved forward to, so the expiry
+# step runs once per day per database rather than on every request
+_windows_advanced = {}
+_windows_lock = threading.Lock()
+
+
+def _validate(window: str, n: int) -> None:
+    if window not in CIRCULATION_WINDOWS:
+        raise ValueError(f"Unknown window: {window}. Use one of: {', '.join(CIRCULATION_WINDOWS)}.")
+    if n < 1 or n > MAX_TOP_N:
+        raise ValueError(f"n must be between 1 and {MAX_TOP_N}.")
+
+
+def advance_windows(now: datetime = None) -> None:
+    """Expire days that have fallen out of the rolling windows (at most once a day per database)."""
+    now = now or datetime.now()
+    key = current_database()
+    with _windows_lock:
+        if _windows_advanced.get(key) == now.date():
+            return
+        run_write_on_loan_databases(lambda conn: advance_circulation_windows(conn, now))
+        _windows_advanced[key] = now.date()
+
+
+def get_top_books(window: str = 'week', n: int = 10) -> List[Dict]:
+    """
+    Get the n most borrowed books in a rolling window.
+
+    Args:
+        window: One of CIRCULATION_WINDOWS ('day', 'week', 'month', 'year')
+        n: Number of books to return (1..MAX_TOP_N)
+
+    Returns:
+        list: Books ranked by borrows (ties by book ID) with title and author
+    """
+    _validate(window, n)
+    advance_windows()
+    top = get_top_books_by_borrows(window, n)
+    books = get_books_by_ids([book_id for book_id, _ in top])
+
+    return [
+        {
+            'rank': rank,
+            'book_id': book_id,
+            'title': books[book_id]['title'] if book_id in books else None,
+            'author': books[book_id]['author'] if book_id in books else None,
+            'borrows': borrows
+        }
+        for rank, (book_id, borrows) in enumerate(top, start=1)
+    ]
+
+
+def get_top_authors(window: str = 'week', n: int = 10) -> List[Dict]:
+    """
+    Get the n authors whose books were borrowed most in a rolling window.
+
+    Returns:
+        list: Authors ranked by borrows (ties by name)
+    """
+    _validate(window, n)
+    advance_windows()
+    top = get_top_authors_by_borrows(window, n)
+
+    return [
+        {'rank': rank, 'author': author, 'borrows': borrows}
+        for rank, (author, borrows) in enumerate(top, start=1)
+    ]
+
+
+def rebuild_aggregates(now: datetime = None) -> None:
+    """Recompute all circulation aggregates from the loan tables (for databases that predate them)."""
+    now = now or datetime.now()
+
+    def rebuild(conn):
+        rebuild_daily_circulation(conn)
+        rebuild_circulation_windows(conn, now)
+    run_write_on_loan_databases(rebuild)
+    with _windows_lock:
+        _windows_advanced[current_database()] = now.date()
@@ -0,0 +1,89 @@
+"""
+Async Library Service Module - asyncio variants of the business logic functions
+Blocking SQLite work runs on a dedicated database executor so the event loop
+is never blocked, and payments go through AsyncPaymentGateway.
+"""
+
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+from database import get_all_books
+from services import library_service
+from services.async_payment_service import AsyncPaymentGateway
+
+T = TypeVar('T')
+
+# Number of threads that may run SQLite calls for async callers
+DB_EXECUTOR_WORKERS = 8
+
+_db_executor = None
+_db_executor_lock = threading.Lock()
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """Get the shared executor that runs blocking database calls."""
+    global _db_executor
+    with _db_executor_lock:
+        if _db_executor is None:
+            _db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix='library-db')
+        return _db_executor
+
+def shutdown_db_executor() -> None:
+    """Shut down the database executor (a new one is created on next use)."""
+    global _db_executor
+    with _db_executor_lock:
+        executor, _db_executor = _db_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+async def run_db(function: Callable[..., T], *args) -> T:
+    """
+    Run a blocking database function on the database executor.
+
+    The caller's context variables (including Flask's app context) are copied
+    into the executor thread.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(context.run, function, *args))
+
+async def get_all_books_async() -> List[Dict]:
+    """Async variant of database.get_all_books."""
+    return await run_db(get_all_books)
+
+async def search_books_in_catalog_async(search_term: str, search_type: str) -> List[Dict]:
+    """Async variant of search_books_in_catalog (R6)."""
+    return await run_db(library_service.search_books_in_catalog, search_term, search_type)
+
+async def calculate_late_fee_for_book_async(patron_id: str, book_id: int) -> Dict:
+    """Async variant of calculate_late_fee_for_book (R5)."""
+    return await run_db(library_service.calculate_late_fee_for_book, patron_id, book_id)
+
+async def pay_late_fees_async(patron_id: str, book_id: int,
+                              payment_gateway: AsyncPaymentGateway = None) -> Tuple[bool, str, Optional[str]]:
+    """
+    Process payment for late fees without blocking on the payment gateway.
+    Async variant of pay_late_fees, sharing its validation and messages.
+
+    Args:
+        patron_id: 6-digit library card ID
+        book_id: ID of the book with late fees
+        payment_gateway: Async payment gateway instance (injectable for testing)
+
+    Returns:
+        tuple: (success: bool, message: str, transaction_id: Optional[str])
+    """
+    payment, error = await run_db(library_service.prepare_late_fee_payment, patron_id, book_id)
+    if error:
+        return False, error, None
+
+    if payment_gateway is None:
+        payment_gateway = AsyncPaymentGateway()
+
+    try:
+        outcome = await payment_gateway.process_payment(**payment)
+    except Exception as e:
+        outcome = e
+    return library_service.late_fee_payment_result(outcome)
@@ -0,0 +1,101 @@
+"""
+Async Payment Service Module - asyncio client for the external payment gateway
+Mirrors PaymentGateway, but waits on the gateway with await instead of
+blocking a worker thread, so one event loop can keep many payments in flight.
+"""
+import asyncio
+import time
+from typing import Dict, Tuple
+
+
+class AsyncPaymentGateway:
+    """
+    asyncio-based client for the external payment gateway API.
+    Simulates the same scenarios as PaymentGateway.
+
+    For testing purposes, you should MOCK this class (e.g. with AsyncMock)
+    rather than waiting on the simulated network delay.
+    """
+
+    def __init__(self, api_key: str = "test_key_12345", latency: float = 0.5):
+        """
+        Initialize payment gateway client with API credentials.
+
+        Args:
+            api_key: API key for authentication (default is test key)
+            latency: Simulated gateway round-trip time in seconds
+        """
+        self.api_key = api_key
+        self.base_url = "https://api.payment-gateway.example.com"
+        self.latency = latency
+
+    async def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        """
+        Process a payment through the external gateway.
+
+        Args:
+            patron_id: 6-digit patron/customer ID
+            amount: Payment amount in dollars
+            description: Payment description
+
+        Returns:
+            tuple: (success: bool, transaction_id: str, message: str)
+        """
+        # Simulate API call delay without blocking the event loop
+        await asyncio.sleep(self.latency)
+
+        if amount <= 0:
+            return False, "", "Invalid amount: must be greater than 0"
+
+        if amount > 1000:
+            return False, "", "Payment declined: amount exceeds limit"
+
+        if len(patron_id) != 6:
+            return False, "", "Invalid patron ID format"
+
+        transaction_id = f"txn_{patron_id}_{int(time.time())}"
+        return True, transaction_id, f"Payment of ${amount:.2f} processed successfully"
+
+    async def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        """
+        Refund a previous payment.
+
+        Args:
+            transaction_id: Original transaction ID to refund
+            amount: Amount to refund
+
+        Returns:
+            tuple: (success: bool, message: str)
+        """
+        await asyncio.sleep(self.latency)
+
+        if not transaction_id or not transaction_id.startswith("txn_"):
+            return False, "Invalid transaction ID"
+
+        if amount <= 0:
+            return False, "Invalid refund amount"
+
+        refund_id = f"refund_{transaction_id}_{int(time.time())}"
+        return True, f"Refund of ${amount:.2f} processed successfully. Refund ID: {refund_id}"
+
+    async def verify_payment_status(self, transaction_id: str) -> Dict:
+        """
+        Check the status of a payment transaction.
+
+        Args:
+            transaction_id: Transaction ID to check
+
+        Returns:
+            dict: Payment status information
+        """
+        await asyncio.sleep(self.latency * 0.6)
+
+        if not transaction_id or not transaction_id.startswith("txn_"):
+            return {"status": "not_found", "message": "Transaction not found"}
+
+        return {
+            "transaction_id": transaction_id,
+            "status": "completed",
+            "amount": 10.50,
+            "timestamp": time.time()
+        }
@@ -0,0 +1,248 @@
+"""
+Availability Bus Module - Live availability deltas for Server-Sent Events
+Borrow, return and hold paths call notify_availability_changed() with the
+books they touched once their transaction has committed. One producer thread
+per app coalesces those notifications, reads the current available_copies of
+the touched books in a single query and appends an event for every book whose
+count changed to a bounded replay buffer. Every SSE subscriber reads from that
+buffer, so the database is read once per change however many desks listen.
+
+Event IDs are "<epoch>-<sequence>". A client reconnecting with Last-Event-ID
+is sent the events after it that are still buffered; if they have already
+been dropped, or the ID comes from before a server restart, it is sent a
+reset event instead and should reload the catalog before applying deltas.
+"""
+
+import contextvars
+import itertools
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Iterable, Iterator, Optional
+from flask import current_app, has_app_context
+from database import get_books_by_ids
+
+# Events kept for clients resuming with Last-Event-ID
+REPLAY_BUFFER_SIZE = 1000
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_SECONDS = 15.0
+
+# Longest a single stream stays open; EventSource clients reconnect and resume
+STREAM_MAX_SECONDS = 300.0
+
+# Reconnect delay suggested to clients, in milliseconds
+RETRY_MS = 3000
+
+# Seconds the producer waits before re-reading books after a failed read
+READ_RETRY_SECONDS = 0.5
+
+
+def notify_availability_changed(book_ids: Iterable[int]) -> None:
+    """
+    Tell the current app's availability bus that these books' copies may have
+    changed. Call after the transaction has committed; does nothing when the
+    live availability stream is not enabled.
+    """
+    bus = current_app.extensions.get('availability_bus') if has_app_context() else None
+    if bus is not None:
+        bus.notify(book_ids)
+
+
+def _format_event(event_id: str, event: str, data: Dict) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class AvailabilityBus:
+    """
+    In-process pub/sub of availability deltas with a bounded replay buffer.
+
+    notify() only records book IDs, so write paths never wait on the
+    database or on subscribers; the producer thread does the reads.
+    """
+
+    def __init__(self, replay_size: int = REPLAY_BUFFER_SIZE):
+        self.replay_size = replay_size
+        # Distinguishes this process's event IDs from those of an earlier run
+        self.epoch = uuid.uuid4().hex[:8]
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._changed = threading.Condition()
+        self._events = deque(maxlen=replay_size)  # (sequence, book_id, available_copies)
+        self._sequence = 0
+        self._published = threading.Condition()
+        self._last_known = {}
+        self._stopping = False
+        self._subscriber_ids = itertools.count(1)
+        self._subscribers = set()
+        self.notifications = 0
+        self.reads = 0
+        self.events_published = 0
+        self.resets = 0
+        self.failures = 0
+        self.last_error = None
+
+    def start(self) -> 'AvailabilityBus':
+        """Start the producer thread (it runs in the caller's context, e.g. its app)."""
+        with self._lock:
+            if self._thread is None:
+                with self._changed:
+                    self._stopping = False
+                context = contextvars.copy_context()
+                self._thread = threading.Thread(target=context.run, args=(self._run,),
+                                                name='availability-bus', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the producer thread and end every open stream."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        with self._changed:
+            self._stopping = True
+            self._changed.notify_all()
+        with self._published:
+            self._published.notify_all()
+        if thread is not None:
+            thread.join()
+
+    def stats(self) -> Dict:
+        """Return notification, read and event counters and the number of open streams."""
+        with self._published:
+            buffered = len(self._events)
+            subscribers = len(self._subscribers)
+        return {
+            'epoch': self.epoch,
+            'last_event_id': self._event_id(self._sequence),
+            'notifications': self.notifications,
+            'reads': self.reads,
+            'events_published': self.events_published,
+            'resets': self.resets,
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'buffered_events': buffered,
+            'replay_size': self.replay_size,
+            'subscribers': subscribers
+        }
+
+    def notify(self, book_ids: Iterable[int]) -> None:
+        """Queue books whose availability may have changed for the producer."""
+        with self._changed:
+            self._pending.update(book_ids)
+            self.notifications += 1
+            self._changed.notify()
+
+    def publish(self, book_ids: Iterable[int]) -> int:
+        """
+        Read the books' current availability and publish an event for each one
+        whose available_copies differs from the last published value.
+
+        Returns:
+            int: Number of events published
+        """
+        book_ids = sorted(set(book_ids))
+        books = get_books_by_ids(book_ids)
+        self.reads += 1
+        published = 0
+        with self._published:
+            for book_id in book_ids:
+                book = books.get(book_id)
+                if book is None or self._last_known.get(book_id) == book['available_copies']:
+                    continue
+                self._last_known[book_id] = book['available_copies']
+                self._sequence += 1
+                self._events.append((self._sequence, book_id, book['available_copies']))
+                published += 1
+            if published:
+                self.events_published += published
+                self._published.notify_all()
+        return published
+
+    def _run(self) -> None:
+        while True:
+            with self._changed:
+                while not self._pending and not self._stopping:
+                    self._changed.wait()
+                if self._stopping:
+                    return
+                book_ids, self._pending = self._pending, set()
+            try:
+                self.publish(book_ids)
+            except sqlite3.Error as e:
+                # Put the books back so their changes are still published, and back off
+                self.failures += 1
+                self.last_error = str(e)
+                with self._changed:
+                    self._pending.update(book_ids)
+                    self._changed.wait_for(lambda: self._stopping, timeout=READ_RETRY_SECONDS)
+
+    def _event_id(self, sequence: int) -> str:
+        return f"{self.epoch}-{sequence}"
+
+    def _resume_position(self, last_event_id: Optional[str]) -> Optional[int]:
+        """Sequence to resume after, or None if the client must reset (call holding _published)."""
+        if not last_event_id:
+            return self._sequence
+        epoch, _, sequence = last_event_id.partition('-')
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        sequence = min(int(sequence), self._sequence)
+        oldest = self._events[0][0] if self._events else self._sequence + 1
+        return sequence if sequence >= oldest - 1 else None
+
+    def stream(self, last_event_id: Optional[str] = None, heartbeat: float = HEARTBEAT_SECONDS,
+               max_seconds: float = STREAM_MAX_SECONDS) -> Iterator[str]:
+        """
+        Yield text/event-stream chunks: buffered events after last_event_id
+        (or a reset event), then live events as they are published, with a
+        keep-alive comment whenever heartbeat seconds pass without one. Ends
+        after max_seconds or when the bus is stopped.
+        """
+        deadline = time.monotonic() + max_seconds
+        subscriber = next(self._subscriber_ids)
+        with self._published:
+            self._subscribers.add(subscriber)
+            position = self._resume_position(last_event_id)
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            while True:
+                with self._published:
+                    if position is None:
+                        chunk, position = self._reset(), self._sequence
+                    else:
+                        if position == self._sequence and not self._stopping:
+                            self._published.wait(max(0.0, min(heartbeat, deadline - time.monotonic())))
+                        if self._stopping:
+                            return
+                        chunk, position = self._events_after(position)
+                yield chunk
+                if time.monotonic() >= deadline:
+                    return
+        finally:
+            with self._published:
+                self._subscribers.discard(subscriber)
+
+    def _reset(self) -> str:
+        """Reset event telling a client it missed events (call holding _published)."""
+        self.resets += 1
+        return _format_event(self._event_id(self._sequence), 'reset',
+                             {'reason': 'Missed events are no longer buffered; reload availability.'})
+
+    def _events_after(self, position: int):
+        """(chunk, new position) for buffered events after position (call holding _published)."""
+        if position == self._sequence:
+            return ": keep-alive\n\n", position
+        offset = position - self._events[0][0] + 1
+        if offset < 0:
+            # A subscriber too slow to keep up with the buffer
+            return self._reset(), self._sequence
+        chunk = ''.join(
+            _format_event(self._event_id(sequence), 'availability',
+                          {'book_id': book_id, 'available_copies': available})
+            for sequence, book_id, available in itertools.islice(self._events, offset, None)
+        )
+        return chunk, self._sequence
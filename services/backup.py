@@ -0,0 +1,489 @@
+"""
+Backup Module - Online snapshots with the SQLite backup API
+Copies the catalog database (and every loan shard) while the app keeps
+serving writes. Each copy runs through sqlite3.Connection.backup a few pages
+at a time with a short sleep between steps, so a backup never holds the
+database long enough to starve requests; the price is a longer backup, and
+the copy rate is reported with each snapshot.
+
+A write from another connection makes SQLite restart a backup in progress.
+If a copy is restarted more than MAX_BACKUP_RESTARTS times it is finished in
+one unthrottled step instead, so busy periods cannot postpone it forever.
+Snapshots avoid restarts altogether: they copy every file from one reader
+whose read transactions all started at the same instant, so the files agree
+with each other (a return's queued copy release on its shard and the
+catalog's available copies, say). Writes carry on meanwhile, but the WAL
+files cannot be checkpointed past that point until the snapshot is done.
+
+Snapshots are directories holding the database files and a manifest. They
+are written under a temporary name, integrity-checked, then renamed into
+place, and only the newest `keep` verified ones are retained (a snapshot that
+fails its check never rotates out a good one). BackupScheduler takes them on
+an interval inside the app and records request latencies while a backup is
+running and while none is, so the latency a backup adds can be read back.
+
+Usage:
+    python -m services.backup snapshot --dir backups --keep 7
+    python -m services.backup verify backups/snapshot-20240101T020000
+    python -m services.backup restore backups/snapshot-20240101T020000
+"""
+
+import argparse
+import contextvars
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+from flask import Flask, g
+import database
+from database import connect, current_database, library_databases, retry_on_lock, shard_path
+
+# Pages copied per backup step, and the pause between steps
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP_SECONDS = 0.01
+
+# Restarts (caused by concurrent writes) tolerated before finishing a copy in one step
+MAX_BACKUP_RESTARTS = 5
+
+# Snapshots kept by rotation
+BACKUP_KEEP = 7
+
+# Seconds between scheduled snapshots
+BACKUP_INTERVAL_SECONDS = 24 * 60 * 60
+
+# Request latencies kept for the during/outside-backup comparison
+LATENCY_SAMPLES = 1000
+
+MANIFEST_NAME = 'manifest.json'
+SNAPSHOT_PREFIX = 'snapshot-'
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def copy_database(source: Union[str, sqlite3.Connection], target_path: str, pages: int = BACKUP_PAGES_PER_STEP,
+                  step_sleep: float = BACKUP_STEP_SLEEP_SECONDS,
+                  max_restarts: int = MAX_BACKUP_RESTARTS, name: str = 'main') -> Dict:
+    """
+    Copy a live database (file path or 'file:' URI) to target_path with the
+    online backup API, pages at a time with step_sleep seconds between steps.
+    The source may also be an open connection (left open), copying its
+    schema name.
+
+    Returns:
+        dict: Pages and bytes copied, steps, restarts, whether the copy had to
+              finish unthrottled, and the elapsed time and copy rate
+    """
+    progress = {'steps': 0, 'restarts': 0, 'remaining': None}
+
+    def on_step(status, remaining, total):
+        progress['steps'] += 1
+        if progress['remaining'] is not None and remaining > progress['remaining']:
+            progress['restarts'] += 1
+            if progress['restarts'] > max_restarts:
+                raise _TooManyRestarts()
+        progress['remaining'] = remaining
+        if remaining:
+            time.sleep(step_sleep)
+
+    started = time.perf_counter()
+    source_conn = connect(source) if isinstance(source, str) else source
+    target_conn = sqlite3.connect(target_path)
+    unthrottled = False
+    try:
+        try:
+            source_conn.backup(target_conn, pages=pages, progress=on_step, name=name)
+        except _TooManyRestarts:
+            unthrottled = True
+            source_conn.backup(target_conn, name=name)
+        page_size = target_conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = target_conn.execute('PRAGMA page_count').fetchone()[0]
+    finally:
+        target_conn.close()
+        if source_conn is not source:
+            source_conn.close()
+
+    elapsed = time.perf_counter() - started
+    size = page_size * page_count
+    return {
+        'pages': page_count,
+        'bytes': size,
+        'steps': progress['steps'],
+        'restarts': progress['restarts'],
+        'unthrottled': unthrottled,
+        'seconds': round(elapsed, 4),
+        'bytes_per_second': round(size / elapsed) if elapsed else None
+    }
+
+
+def check_integrity(path: str) -> str:
+    """Run PRAGMA integrity_check on a database file; returns 'ok' or the first problems found."""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        rows = conn.execute('PRAGMA integrity_check(10)').fetchall()
+    except sqlite3.DatabaseError as e:
+        return str(e)
+    finally:
+        conn.close()
+    return '; '.join(row[0] for row in rows)
+
+
+def _attach_all(databases: List[Tuple[Optional[int], str]]) -> sqlite3.Connection:
+    conn = connect(databases[0][1])
+    for position, (_, source) in enumerate(databases[1:], start=1):
+        conn.execute('ATTACH DATABASE ? AS ?', (source, f'db{position}'))
+    return conn
+
+
+def open_snapshot_reader() -> Tuple[sqlite3.Connection, List[Tuple[Optional[int], str]]]:
+    """
+    Open one connection over every database of the library with a read
+    transaction on each, all started at the same point: writers are held off
+    (BEGIN IMMEDIATE over all of them, shards first and the catalog last)
+    just while the reader starts reading. In WAL mode the reader keeps seeing
+    that point however long it stays open. Taking the shard locks also waits
+    out borrows in flight, which hold their shard from before their catalog
+    copy is reserved until the loan commits.
+
+    Returns:
+        tuple: The reader (close it when done) and the (shard index, or None
+               for the catalog, and schema name) of each database, catalog first
+    """
+    databases = library_databases()
+    databases = databases[1:] + databases[:1]
+    schemas = [(shard, 'main' if position == 0 else f'db{position}')
+               for position, (shard, _) in enumerate(databases)]
+
+    def freeze():
+        writer = _attach_all(databases)
+        try:
+            writer.execute('BEGIN IMMEDIATE')
+            reader = _attach_all(databases)
+            try:
+                reader.execute('BEGIN')
+                for _, schema in schemas:
+                    reader.execute(f'SELECT COUNT(*) FROM "{schema}".sqlite_master').fetchone()
+            except BaseException:
+                reader.close()
+                raise
+            return reader
+        finally:
+            writer.rollback()
+            writer.close()
+
+    return retry_on_lock(freeze), schemas[-1:] + schemas[:-1]
+
+
+def create_snapshot(backup_dir: str, keep: int = BACKUP_KEEP, pages: int = BACKUP_PAGES_PER_STEP,
+                    step_sleep: float = BACKUP_STEP_SLEEP_SECONDS) -> Dict:
+    """
+    Snapshot the current database and its loan shards, all as of one point
+    (see open_snapshot_reader), into a new directory under backup_dir, verify
+    it, and if it verified, rotate out snapshots beyond keep.
+
+    Returns:
+        dict: The snapshot's manifest (files with their copy stats and
+              integrity results, totals, and whether it verified)
+    """
+    created = datetime.now()
+    name = SNAPSHOT_PREFIX + created.strftime('%Y%m%dT%H%M%S%f')
+    partial = os.path.join(backup_dir, '.' + name + '.partial')
+    os.makedirs(partial)
+
+    started = time.perf_counter()
+    files = []
+    try:
+        reader, schemas = open_snapshot_reader()
+        try:
+            for shard, schema in schemas:
+                filename = 'library.db' if shard is None else f'shard{shard}.db'
+                stats = copy_database(reader, os.path.join(partial, filename), pages, step_sleep, name=schema)
+                integrity = check_integrity(os.path.join(partial, filename))
+                files.append({'name': filename, 'shard': shard, 'integrity': integrity, **stats})
+        finally:
+            reader.close()
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    elapsed = time.perf_counter() - started
+
+    total_bytes = sum(entry['bytes'] for entry in files)
+    manifest = {
+        'name': name,
+        'created_at': created.isoformat(),
+        'shard_count': database.shard_count(),
+        'files': files,
+        'bytes': total_bytes,
+        'seconds': round(elapsed, 4),
+        'bytes_per_second': round(total_bytes / elapsed) if elapsed else None,
+        'verified': all(entry['integrity'] == 'ok' for entry in files)
+    }
+    with open(os.path.join(partial, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.rename(partial, os.path.join(backup_dir, name))
+
+    manifest['rotated_out'] = rotate_snapshots(backup_dir, keep) if manifest['verified'] else []
+    return manifest
+
+
+def list_snapshots(backup_dir: str) -> List[Dict]:
+    """Manifests of the complete snapshots in backup_dir, oldest first."""
+    if not os.path.isdir(backup_dir):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(backup_dir)):
+        path = os.path.join(backup_dir, name, MANIFEST_NAME)
+        if name.startswith(SNAPSHOT_PREFIX) and os.path.exists(path):
+            with open(path) as f:
+                manifests.append(json.load(f))
+    return manifests
+
+
+def rotate_snapshots(backup_dir: str, keep: int) -> List[str]:
+    """
+    Keep the newest keep verified snapshots and delete every snapshot older
+    than the oldest of them; unverified snapshots never count towards keep.
+    Returns the names removed.
+    """
+    snapshots = list_snapshots(backup_dir)
+    verified = [index for index, manifest in enumerate(snapshots) if manifest['verified']]
+    if len(verified) <= keep:
+        return []
+    oldest_kept = verified[-keep] if keep > 0 else len(snapshots)
+    removed = [manifest['name'] for manifest in snapshots[:oldest_kept]]
+    for name in removed:
+        shutil.rmtree(os.path.join(backup_dir, name))
+    return removed
+
+
+def verify_snapshot(snapshot_dir: str) -> Dict:
+    """
+    Re-check every database file of a snapshot against its manifest.
+
+    Returns:
+        dict: ok, and the integrity result of each file
+    """
+    with open(os.path.join(snapshot_dir, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    results = {}
+    for entry in manifest['files']:
+        path = os.path.join(snapshot_dir, entry['name'])
+        results[entry['name']] = check_integrity(path) if os.path.exists(path) else 'missing'
+    return {'ok': all(result == 'ok' for result in results.values()), 'files': results}
+
+
+def restore_snapshot(snapshot_dir: str) -> Dict:
+    """
+    Copy a verified snapshot back over the current database and loan shards.
+
+    The copy goes through the backup API too, so connections already open on
+    the database see the restored data rather than a half-replaced file.
+
+    Raises:
+        ValueError: If the snapshot fails verification or was taken with a
+                    different number of loan shards
+    """
+    with open(os.path.join(snapshot_dir, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    if manifest['shard_count'] != database.shard_count():
+        raise ValueError(f"Snapshot has {manifest['shard_count']} loan shards; "
+                         f"the database is configured with {database.shard_count()}.")
+    verification = verify_snapshot(snapshot_dir)
+    if not verification['ok']:
+        raise ValueError(f"Snapshot failed verification: {verification['files']}")
+
+    restored = []
+    for entry in manifest['files']:
+        target = current_database() if entry['shard'] is None else shard_path(entry['shard'])
+        source_conn = sqlite3.connect(f"file:{os.path.join(snapshot_dir, entry['name'])}?mode=ro", uri=True)
+        target_conn = connect(target)
+        try:
+            source_conn.backup(target_conn)
+        finally:
+            target_conn.close()
+            source_conn.close()
+        restored.append(entry['name'])
+    # Returns the snapshot caught between their commit and the catalog release
+    for shard in range(database.shard_count()):
+        database.release_pending_copies(shard)
+    return {'snapshot': manifest['name'], 'restored': restored}
+
+
+def _percentile_ms(samples: List[float], pct: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000, 3)
+
+
+class BackupScheduler:
+    """
+    Background thread taking a snapshot every interval seconds, plus the
+    request-latency comparison of traffic served during and outside backups.
+
+    Install with init_app(app) to record latencies; start() runs the schedule.
+    """
+
+    def __init__(self, backup_dir: str, interval: float = BACKUP_INTERVAL_SECONDS, keep: int = BACKUP_KEEP,
+                 pages: int = BACKUP_PAGES_PER_STEP, step_sleep: float = BACKUP_STEP_SLEEP_SECONDS):
+        self.backup_dir = backup_dir
+        self.interval = interval
+        self.keep = keep
+        self.pages = pages
+        self.step_sleep = step_sleep
+        self._thread = None
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._running = 0
+        self._latency = {True: deque(maxlen=LATENCY_SAMPLES), False: deque(maxlen=LATENCY_SAMPLES)}
+        self.backups = 0
+        self.failures = 0
+        self.last_backup = None
+        self.last_error = None
+
+    def init_app(self, app: Flask) -> 'BackupScheduler':
+        app.before_request(self._start_request)
+        app.teardown_request(self._finish_request)
+        app.extensions['backup_scheduler'] = self
+        return self
+
+    def start(self) -> 'BackupScheduler':
+        """Start the schedule thread (it runs in the caller's context, e.g. its app)."""
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                context = contextvars.copy_context()
+                self._thread = threading.Thread(target=context.run, args=(self._run,),
+                                                name='backup-scheduler', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the schedule thread (after the backup in progress, if any)."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            self._wake.set()
+            thread.join()
+
+    def trigger(self) -> None:
+        """Ask the schedule thread to take a snapshot now."""
+        self._wake.set()
+
+    @property
+    def running(self) -> bool:
+        """Whether a backup is in progress."""
+        return self._running > 0
+
+    def run_backup(self) -> Dict:
+        """Take a snapshot now (one at a time) and record the outcome."""
+        with self._run_lock:
+            self._running += 1
+            try:
+                manifest = create_snapshot(self.backup_dir, self.keep, self.pages, self.step_sleep)
+            except (OSError, sqlite3.Error) as e:
+                self.failures += 1
+                self.last_error = str(e)
+                raise
+            finally:
+                self._running -= 1
+        self.backups += 1
+        if not manifest['verified']:
+            self.failures += 1
+        self.last_backup = manifest
+        return manifest
+
+    def stats(self) -> Dict:
+        """Backup counters, the last snapshot's copy rate, and request latency during vs outside backups."""
+        during, outside = list(self._latency[True]), list(self._latency[False])
+        latency = {}
+        for pct in (50, 95):
+            with_backup, without = _percentile_ms(during, pct), _percentile_ms(outside, pct)
+            latency[f'p{pct}_ms_during_backup'] = with_backup
+            latency[f'p{pct}_ms_outside_backup'] = without
+            latency[f'p{pct}_ms_added'] = round(with_backup - without, 3) \
+                if with_backup is not None and without is not None else None
+        last = self.last_backup
+        return {
+            'running': self.running,
+            'backups': self.backups,
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'last_backup': {
+                'name': last['name'],
+                'created_at': last['created_at'],
+                'bytes': last['bytes'],
+                'seconds': last['seconds'],
+                'bytes_per_second': last['bytes_per_second'],
+                'verified': last['verified']
+            } if last else None,
+            'requests_during_backup': len(during),
+            'requests_outside_backup': len(outside),
+            **latency
+        }
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.run_backup()
+            except (OSError, sqlite3.Error):
+                pass  # counted in failures; the next interval tries again
+
+    def _start_request(self) -> None:
+        g.backup_request_started = (time.perf_counter(), self.running)
+
+    def _finish_request(self, exc: Optional[BaseException]) -> None:
+        started = g.pop('backup_request_started', None)
+        if started is not None:
+            began, running = started
+            self._latency[running or self.running].append(time.perf_counter() - began)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', default=database.DATABASE, help='Library database file')
+    parser.add_argument('--shards', type=int, default=database.SHARD_COUNT, help='Number of loan shard files')
+    commands = parser.add_subparsers(dest='command', required=True)
+    snapshot = commands.add_parser('snapshot', help='Take a snapshot of the live database')
+    snapshot.add_argument('--dir', default='backups', help='Directory holding the snapshots')
+    snapshot.add_argument('--keep', type=int, default=BACKUP_KEEP, help='Snapshots retained after rotation')
+    snapshot.add_argument('--pages', type=int, default=BACKUP_PAGES_PER_STEP, help='Pages copied per step')
+    snapshot.add_argument('--step-sleep-ms', type=float, default=BACKUP_STEP_SLEEP_SECONDS * 1000)
+    listing = commands.add_parser('list', help='List the snapshots in a directory')
+    listing.add_argument('--dir', default='backups')
+    verify = commands.add_parser('verify', help='Integrity-check a snapshot')
+    verify.add_argument('snapshot')
+    restore = commands.add_parser('restore', help='Restore a verified snapshot over the database')
+    restore.add_argument('snapshot')
+    args = parser.parse_args()
+
+    database.DATABASE = args.database
+    database.SHARD_COUNT = args.shards
+    if args.command == 'snapshot':
+        result = create_snapshot(args.dir, args.keep, args.pages, args.step_sleep_ms / 1000)
+    elif args.command == 'list':
+        result = list_snapshots(args.dir)
+    elif args.command == 'verify':
+        result = verify_snapshot(args.snapshot)
+    else:
+        result = restore_snapshot(args.snapshot)
+    print(json.dumps(result, indent=2))
+    if args.command == 'verify' and not result['ok']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Catalog Export Module - Streaming catalog serialization
+Turns the book stream from database.iter_books into NDJSON or CSV chunks
+without ever materializing the full catalog in memory.
+"""
+
+import csv
+import io
+import json
+import zlib
+from typing import Iterable, Iterator, List, Optional
+from database import BOOK_COLUMNS, iter_books
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+def parse_export_fields(fields_param: Optional[str]) -> List[str]:
+    """
+    Parse a sparse fieldset parameter such as "title,isbn".
+
+    Returns:
+        list: Requested fields in order (all book columns if none were given)
+
+    Raises:
+        ValueError: If any requested field is not a book column
+    """
+    if not fields_param or not fields_param.strip():
+        return list(BOOK_COLUMNS)
+
+    fields = []
+    for field in fields_param.split(','):
+        field = field.strip()
+        if field not in BOOK_COLUMNS:
+            raise ValueError(f"Unknown field '{field}'. Allowed fields: {', '.join(BOOK_COLUMNS)}")
+        if field not in fields:
+            fields.append(field)
+    return fields
+
+def export_catalog(fmt: str, fields: List[str], since_id: int = 0, batch_size: int = 500) -> Iterator[bytes]:
+    """
+    Stream the catalog as encoded chunks.
+
+    Args:
+        fmt: 'ndjson' or 'csv'
+        fields: Columns to include in each record
+        since_id: Only export books with an ID greater than this cursor
+        batch_size: Rows fetched from the database per round trip
+
+    Returns:
+        iterator: UTF-8 encoded chunks, one per fetched batch
+    """
+    rows = iter_books(fields, since_id, batch_size)
+    if fmt == 'ndjson':
+        lines = _ndjson_lines(rows, fields)
+    elif fmt == 'csv':
+        lines = _csv_lines(rows, fields)
+    else:
+        raise ValueError(f"Unsupported export format '{fmt}'")
+    return _batched(lines, batch_size)
+
+def gzip_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Compress a stream of chunks incrementally into a single gzip member."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def _ndjson_lines(rows: Iterable[tuple], fields: List[str]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row))) + '\n'
+
+def _csv_lines(rows: Iterable[tuple], fields: List[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only (empty export)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _batched(lines: Iterable[str], batch_size: int) -> Iterator[bytes]:
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            yield ''.join(batch).encode('utf-8')
+            batch = []
+    if batch:
+        yield ''.join(batch).encode('utf-8')
@@ -0,0 +1,333 @@
+"""
+Catalog Snapshot Module - Memory-mapped, read-only catalog for search
+Title, author and ISBN search otherwise reads the whole books table for every
+query. Instead, the searchable text of the catalog is written to one compact
+file that every worker process maps with mmap, so the operating system keeps
+a single copy of its pages however many workers there are.
+
+File layout (native byte order, sections 8-byte aligned):
+
+- header: magic, format version, byte order, record count, search version,
+  then an (offset, length) table of the sections below
+- records: one fixed-width record per book in title order (the order
+  get_all_books returns): id and the offset/length of its title, author and
+  ISBN in the string heap
+- strings: the UTF-8 title, author and ISBN of every book
+- title/author folded heaps: lowercased titles (authors) in record order,
+  each followed by a NUL, with the start offset of every record's entry
+- title/author/ISBN orders: record numbers sorted by folded title, folded
+  author and ISBN, for binary search
+
+Title and author search keep their substring semantics: the folded heap is
+searched with mmap.find and each hit is mapped back to its record by binary
+search over the start offsets. ISBN lookups and prefix queries binary-search
+the sorted orders. Strings are sliced straight out of the mapping; only the
+copy counts of the matching books are read from the database, since they
+change with every borrow.
+
+The file is rebuilt whenever the catalog search version (bumped by triggers
+when books are added or removed, or their title, author or ISBN changes)
+moves past the one it was built from. A rebuild is written to a temporary
+file and renamed into place, so readers never see a partial file; workers
+that notice the change at the same time may each rebuild it.
+
+Build one by hand with: python -m services.catalog_snapshot --database library.db
+"""
+
+import argparse
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from typing import Callable, Dict, List, Optional, Sequence
+from flask import current_app, has_app_context
+import database
+from database import get_catalog_search_rows, get_copy_counts, get_meta_value
+
+MAGIC = b'LIBCSNAP'
+FORMAT_VERSION = 1
+
+SECTIONS = ('records', 'strings', 'title_folded', 'title_starts', 'author_folded', 'author_starts',
+            'title_order', 'author_order', 'isbn_order')
+
+_HEADER = struct.Struct('=8sIBxxxIQ')
+_SECTION = struct.Struct('=QQ')
+# id, then (offset, length) of title, author and ISBN in the string heap
+_RECORD = struct.Struct('=qIIIIII')
+_BYTE_ORDER = {'little': 1, 'big': 2}[sys.byteorder]
+
+
+def snapshot_path(database_uri: str) -> str:
+    """Default snapshot file of a catalog database file."""
+    if database_uri.startswith('file:'):
+        raise ValueError("Set CATALOG_SNAPSHOT_PATH when the catalog is a 'file:' URI.")
+    return os.path.splitext(database_uri)[0] + '.catalog-snapshot'
+
+
+def _fold(text: str) -> bytes:
+    return text.lower().encode('utf-8')
+
+
+def write_snapshot(path: str, version: int, rows: Sequence) -> int:
+    """
+    Write a snapshot of (id, title, author, isbn) rows, given in title order,
+    atomically replacing any file at path.
+
+    Returns:
+        int: Size of the file in bytes
+    """
+    records = bytearray()
+    strings = bytearray()
+    heaps = {'title': bytearray(), 'author': bytearray()}
+    starts = {'title': array('I'), 'author': array('I')}
+    keys = {'title': [], 'author': [], 'isbn': []}
+    for number, row in enumerate(rows):
+        fields = {}
+        for field in ('title', 'author', 'isbn'):
+            encoded = row[field].encode('utf-8')
+            fields[field] = (len(strings), len(encoded))
+            strings += encoded
+        records += _RECORD.pack(row['id'], *fields['title'], *fields['author'], *fields['isbn'])
+        for field in ('title', 'author'):
+            folded = _fold(row[field])
+            starts[field].append(len(heaps[field]))
+            heaps[field] += folded + b'\0'
+            keys[field].append((folded, number))
+        keys['isbn'].append((row['isbn'].encode('utf-8'), number))
+
+    orders = {field: array('I', (number for _, number in sorted(pairs))) for field, pairs in keys.items()}
+    sections = {
+        'records': records, 'strings': strings,
+        'title_folded': heaps['title'], 'title_starts': starts['title'].tobytes(),
+        'author_folded': heaps['author'], 'author_starts': starts['author'].tobytes(),
+        'title_order': orders['title'].tobytes(), 'author_order': orders['author'].tobytes(),
+        'isbn_order': orders['isbn'].tobytes(),
+    }
+
+    offset = _HEADER.size + _SECTION.size * len(SECTIONS)
+    table = []
+    body = bytearray()
+    for name in SECTIONS:
+        padding = -(offset + len(body)) % 8
+        body += b'\0' * padding
+        table.append((offset + len(body), len(sections[name])))
+        body += sections[name]
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.catalog-snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, _BYTE_ORDER, len(rows), version))
+            for entry in table:
+                f.write(_SECTION.pack(*entry))
+            f.write(body)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return offset + len(body)
+
+
+class SnapshotReader:
+    """
+    A snapshot file mapped read-only.
+
+    Raises ValueError from the constructor if the file is not a snapshot this
+    code can read (another format version or byte order).
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mm)
+        if len(view) < _HEADER.size:
+            raise ValueError("Not a catalog snapshot.")
+        magic, format_version, byte_order, self.count, self.version = _HEADER.unpack_from(view)
+        if magic != MAGIC or format_version != FORMAT_VERSION or byte_order != _BYTE_ORDER:
+            raise ValueError("Not a catalog snapshot this version can read.")
+        self.size = len(view)
+        self._sections = {
+            name: _SECTION.unpack_from(view, _HEADER.size + _SECTION.size * index)
+            for index, name in enumerate(SECTIONS)
+        }
+        self._records = self._sections['records'][0]
+        self._strings = self._sections['strings'][0]
+        self._starts = {field: self._array(view, f'{field}_starts') for field in ('title', 'author')}
+        self._orders = {field: self._array(view, f'{field}_order') for field in ('title', 'author', 'isbn')}
+
+    def _array(self, view: memoryview, name: str) -> memoryview:
+        offset, length = self._sections[name]
+        return view[offset:offset + length].cast('I')
+
+    def _record(self, number: int):
+        return _RECORD.unpack_from(self._mm, self._records + number * _RECORD.size)
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self._strings + offset
+        return str(memoryview(self._mm)[start:start + length], 'utf-8')
+
+    def book(self, number: int) -> Dict:
+        """The id, title, author and isbn of a record."""
+        book_id, title_at, title_len, author_at, author_len, isbn_at, isbn_len = self._record(number)
+        return {
+            'id': book_id,
+            'title': self._string(title_at, title_len),
+            'author': self._string(author_at, author_len),
+            'isbn': self._string(isbn_at, isbn_len)
+        }
+
+    def _folded_key(self, field: str, number: int) -> bytes:
+        heap, length = self._sections[f'{field}_folded']
+        starts = self._starts[field]
+        end = starts[number + 1] - 1 if number + 1 < self.count else length - 1
+        return self._mm[heap + starts[number]:heap + end]
+
+    def _isbn_key(self, number: int) -> bytes:
+        _, _, _, _, _, isbn_at, isbn_len = self._record(number)
+        return self._mm[self._strings + isbn_at:self._strings + isbn_at + isbn_len]
+
+    def find_substring(self, field: str, term: str) -> List[int]:
+        """Record numbers, in title order, whose title or author contains term (case-insensitive)."""
+        needle = _fold(term)
+        if not needle or b'\0' in needle:
+            return []
+        heap, length = self._sections[f'{field}_folded']
+        starts = self._starts[field]
+        end = heap + length
+        matches = []
+        position = heap
+        while True:
+            hit = self._mm.find(needle, position, end)
+            if hit < 0:
+                return matches
+            number = bisect.bisect_right(starts, hit - heap) - 1
+            matches.append(number)
+            # Continue after this record, so a title containing the term twice matches once
+            position = heap + starts[number + 1] if number + 1 < self.count else end
+
+    def find_prefix(self, field: str, prefix: str, limit: int) -> List[int]:
+        """Up to limit record numbers whose folded title or author starts with prefix, in key order."""
+        return self._scan_order(field, _fold(prefix), lambda number: self._folded_key(field, number), limit)
+
+    def find_isbn(self, isbn: str) -> List[int]:
+        """Record numbers whose ISBN is exactly isbn."""
+        key = isbn.encode('utf-8')
+        return [number for number in self._scan_order('isbn', key, self._isbn_key, self.count)
+                if self._isbn_key(number) == key]
+
+    def _scan_order(self, field: str, prefix: bytes, key: Callable[[int], bytes], limit: int) -> List[int]:
+        order = self._orders[field]
+        # bisect_left by key(order[i]); bisect's key= argument needs Python 3.10
+        index, high = 0, len(order)
+        while index < high:
+            middle = (index + high) // 2
+            if key(order[middle]) < prefix:
+                index = middle + 1
+            else:
+                high = middle
+        matches = []
+        while index < len(order) and len(matches) < limit:
+            number = order[index]
+            if not key(number).startswith(prefix):
+                break
+            matches.append(number)
+            index += 1
+        return matches
+
+
+class CatalogSnapshot:
+    """
+    The current snapshot of one catalog database, rebuilt when the catalog
+    search version moves past it. Safe to share between threads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._reader = None
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+        self.reloads = 0
+
+    def current(self) -> SnapshotReader:
+        """The snapshot reader for the catalog as it is now, rebuilding the file if needed."""
+        version = get_meta_value('catalog_search_version')
+        reader = self._reader
+        if reader is not None and reader.version >= version:
+            return reader
+        with self._lock:
+            if self._reader is None or self._reader.version < version:
+                self._reader = self._open_or_build(version)
+            return self._reader
+
+    def _open_or_build(self, version: int) -> SnapshotReader:
+        try:
+            reader = SnapshotReader(self.path)
+            if reader.version >= version:
+                # Another worker already rebuilt it
+                self.reloads += 1
+                return reader
+        except (OSError, ValueError):
+            pass
+        fresh_version, rows = get_catalog_search_rows()
+        write_snapshot(self.path, fresh_version, rows)
+        self.rebuilds += 1
+        return SnapshotReader(self.path)
+
+    def search(self, search_term: str, search_type: str) -> List[Dict]:
+        """
+        Search like search_books_in_catalog: case-insensitive substring match
+        on title or author, exact match on ISBN. Expects validated input.
+        """
+        reader = self.current()
+        if search_type == 'isbn':
+            numbers = reader.find_isbn(search_term.strip())
+        else:
+            numbers = reader.find_substring(search_type, search_term.strip())
+        books = [reader.book(number) for number in numbers]
+        counts = get_copy_counts([book['id'] for book in books])
+        results = []
+        for book in books:
+            if book['id'] in counts:
+                book['total_copies'], book['available_copies'] = counts[book['id']]
+                results.append(book)
+        return results
+
+    def stats(self) -> Dict:
+        """Path, version and size of the loaded snapshot, and rebuild counters."""
+        reader = self._reader
+        return {
+            'path': self.path,
+            'version': reader.version if reader else None,
+            'books': reader.count if reader else None,
+            'bytes': reader.size if reader else None,
+            'rebuilds': self.rebuilds,
+            'reloads': self.reloads
+        }
+
+
+def get_catalog_snapshot() -> Optional[CatalogSnapshot]:
+    """The current app's catalog snapshot, or None when search reads the database directly."""
+    return current_app.extensions.get('catalog_snapshot') if has_app_context() else None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', default=database.DATABASE, help='Library database file')
+    parser.add_argument('--output', help='Snapshot file (default: next to the database)')
+    args = parser.parse_args()
+
+    database.DATABASE = args.database
+    database.init_database()
+    snapshot = CatalogSnapshot(args.output or snapshot_path(args.database))
+    snapshot.current()
+    print(json.dumps(snapshot.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Change Feed Module - Incremental sync of catalog and loan mutations
+Triggers on books and borrow_records append every insert, update and delete
+to change_log, so downstream mirrors (search, reporting) page through the
+changes after the last sequence number they applied instead of re-exporting
+the catalog. Entries older than a retention window are compacted away; a
+consumer that falls further behind than that is told to resync from a full
+export (/api/catalog/export.<fmt>).
+
+With patron sharding, loan changes are logged in each shard with its own
+sequence and are read with shard=<index>; the main log holds catalog changes.
+
+Compact as a job with: python -m services.change_feed --days 30
+"""
+
+import argparse
+import json
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import database
+from database import (
+    compact_change_log_batch, get_change_log_bounds, get_changes, run_write,
+    run_write_on_loan_databases, sharding_enabled
+)
+
+# Changes older than this many days are compacted away
+CHANGE_RETENTION_DAYS = 30
+
+# Entries deleted per write transaction, so writers are never blocked for long
+COMPACTION_BATCH_SIZE = 500
+
+# Default and largest page of changes served at once
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+
+def get_change_page(since: int = 0, limit: int = DEFAULT_PAGE_SIZE, shard: Optional[int] = None) -> Dict:
+    """
+    Get the next page of changes after a sequence number.
+
+    Args:
+        since: Last sequence number the consumer applied (0 to start from the oldest retained change)
+        limit: Maximum changes returned
+        shard: Patron shard whose loan changes to read (None for the main log)
+
+    Returns:
+        dict: Changes in sequence order (row is the row after the change, None
+              for deletes), next_since to pass on the following call, has_more,
+              the retained sequence range, and resync_required when changes
+              after since have already been compacted away
+
+    Raises:
+        ValueError: If since or limit is out of range, or there is no such shard
+    """
+    if since < 0:
+        raise ValueError("since must not be negative.")
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}.")
+
+    oldest, latest = get_change_log_bounds(shard)
+    first_retained = oldest if oldest is not None else latest + 1
+    page = {
+        'since': since,
+        'oldest_seq': oldest,
+        'latest_seq': latest,
+        'resync_required': since + 1 < first_retained
+    }
+    if page['resync_required']:
+        return {**page, 'changes': [], 'count': 0, 'next_since': since, 'has_more': True}
+
+    rows = get_changes(since, limit + 1, shard)
+    has_more = len(rows) > limit
+    changes = [
+        {
+            'seq': row['seq'],
+            'table': row['table_name'],
+            'id': row['row_id'],
+            'op': row['op'],
+            'row': json.loads(row['row_data']) if row['row_data'] is not None else None,
+            'changed_at': row['changed_at']
+        }
+        for row in rows[:limit]
+    ]
+    return {
+        **page,
+        'changes': changes,
+        'count': len(changes),
+        'next_since': changes[-1]['seq'] if changes else since,
+        'has_more': has_more
+    }
+
+
+def compact_change_log(retention_days: int = CHANGE_RETENTION_DAYS,
+                       batch_size: int = COMPACTION_BATCH_SIZE) -> Dict:
+    """
+    Drop change_log entries recorded more than retention_days ago, from the
+    main log and every shard's log.
+
+    Returns:
+        dict: Cutoff, entries removed and transactions used
+    """
+    if retention_days < 0:
+        raise ValueError("retention_days must not be negative.")
+    if batch_size <= 0:
+        raise ValueError("batch_size must be positive.")
+
+    cutoff = datetime.now() - timedelta(days=retention_days)
+
+    def compact(conn):
+        return compact_change_log_batch(conn, cutoff, batch_size)
+
+    removed = 0
+    batches = 0
+    while True:
+        deleted = run_write_on_loan_databases(compact)
+        if sharding_enabled():
+            deleted.append(run_write(compact))
+        batches += len(deleted)
+        removed += sum(deleted)
+        if max(deleted) < batch_size:
+            break
+
+    return {'changed_before': cutoff.isoformat(), 'removed': removed, 'batches': batches}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', default=database.DATABASE, help='Library database file')
+    parser.add_argument('--days', type=int, default=CHANGE_RETENTION_DAYS, help='Keep changes from the last this many days')
+    parser.add_argument('--batch-size', type=int, default=COMPACTION_BATCH_SIZE, help='Entries deleted per transaction')
+    args = parser.parse_args()
+
+    database.DATABASE = args.database
+    database.init_database()
+    print(json.dumps(compact_change_log(args.days, args.batch_size), indent=2))
+
+
+if __name__ == '__main__':
+    main()
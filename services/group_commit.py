@@ -0,0 +1,178 @@
+"""
+Group Commit Module - Single-writer queue for write transactions
+One dedicated thread owns the write connection. Callers enqueue write
+operations and wait on a future, and the writer commits whatever is queued
+within a short latency window as one transaction, so many borrows and returns
+share a single fsync.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+import database
+
+_STOP = object()
+
+
+class GroupCommitWriter:
+    """
+    Batches write operations from many threads into shared transactions.
+
+    Each operation runs inside its own SAVEPOINT, so an operation that raises
+    is rolled back on its own and its caller gets the exception, while the
+    rest of the batch still commits.
+    """
+
+    def __init__(self, database_path: Optional[str] = None, max_batch: int = 64, max_latency: float = 0.002):
+        """
+        Args:
+            database_path: Database file or URI to write to (defaults to the current database)
+            max_batch: Maximum number of operations committed together
+            max_latency: Seconds to wait for more operations after the first
+                         one of a batch arrives
+        """
+        self.database = database_path or database.current_database()
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.error = None
+        self.batches = 0
+        self.operations = 0
+
+    def start(self) -> 'GroupCommitWriter':
+        """Start the writer thread."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Commit everything already queued, then stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def submit(self, operation: Callable) -> Future:
+        """
+        Queue operation(conn) for the next batch and return a future for its result.
+
+        Raises RuntimeError if the writer thread is not running (never
+        started, stopped, or died; see error).
+        """
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            raise RuntimeError(f"Group-commit writer is not running{f': {self.error}' if self.error else ''}.")
+        future = Future()
+        self._queue.put((operation, future))
+        if not thread.is_alive():
+            # The writer died after the check above; nobody would take it off the queue
+            self._fail_queued(self.error or RuntimeError("Group-commit writer stopped."))
+        return future
+
+    def stats(self) -> Dict:
+        """Return batch counters and the current queue depth."""
+        return {
+            'batches': self.batches,
+            'operations': self.operations,
+            'average_batch_size': round(self.operations / self.batches, 2) if self.batches else 0.0,
+            'queue_depth': self._queue.qsize(),
+            'error': str(self.error) if self.error else None
+        }
+
+    def _run(self) -> None:
+        try:
+            conn = database.connect(self.database)
+        except Exception as e:
+            self._fail(e)
+            return
+        try:
+            stopping = False
+            while not stopping:
+                batch, stopping = self._collect_batch()
+                if batch:
+                    self._commit_batch(conn, batch)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            conn.close()
+
+    def _fail(self, error: Exception) -> None:
+        """Record why the writer thread is ending and fail everything still queued."""
+        self.error = error
+        self._fail_queued(error)
+
+    def _fail_queued(self, error: Exception) -> None:
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _STOP and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(error)
+
+    def _collect_batch(self) -> Tuple[List, bool]:
+        """Block for the first operation, then gather more until the window closes."""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        window_ends = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch:
+            remaining = window_ends - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _commit_batch(self, conn, batch: List) -> None:
+        # Skip operations whose callers gave up waiting (see database.run_write)
+        batch = [(operation, future) for operation, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        def attempt():
+            outcomes = []
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for operation, _ in batch:
+                    conn.execute('SAVEPOINT operation')
+                    try:
+                        outcomes.append((True, operation(conn)))
+                        conn.execute('RELEASE operation')
+                    except Exception as e:
+                        if database.is_lock_error(e):
+                            raise
+                        conn.execute('ROLLBACK TO operation')
+                        conn.execute('RELEASE operation')
+                        outcomes.append((False, e))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return outcomes
+
+        try:
+            outcomes = database.retry_on_lock(attempt)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.operations += len(batch)
+        for (_, future), (succeeded, value) in zip(batch, outcomes):
+            if succeeded:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
@@ -0,0 +1,195 @@
+"""
+Holds Module - Waitlists for books with no available copies
+A patron places a hold on a book that is out; holds on a book form a FIFO
+queue. When a copy is returned it is set aside for the hold at the head of
+the queue in the same transaction as the return, and the patron is notified
+through the outbox. The patron then has HOLD_PICKUP_DAYS to borrow it; holds
+not picked up in time are expired by HoldExpiryTimer and the copy passes to
+the next patron in line.
+
+Queue operations go through the per-book queue index (idx_holds_queue), so
+joining, serving and cancelling cost O(log n) per title.
+"""
+
+import contextvars
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from database import (
+    cancel_hold, expire_ready_holds, get_book_by_id, get_next_hold_expiry, get_open_loan,
+    get_patron_holds, insert_hold, run_write
+)
+from services.availability_bus import notify_availability_changed
+
+logger = logging.getLogger(__name__)
+
+# Ready holds expired per transaction
+EXPIRY_BATCH_SIZE = 100
+
+# Longest the expiry timer sleeps between checks (new holds may become ready meanwhile)
+EXPIRY_MAX_WAIT_SECONDS = 60.0
+
+
+def _valid_patron_id(patron_id: str) -> bool:
+    return bool(patron_id) and patron_id.isdigit() and len(patron_id) == 6
+
+
+def place_hold(patron_id: str, book_id: int) -> Tuple[bool, str]:
+    """
+    Join the waitlist for a book with no available copies.
+
+    Args:
+        patron_id: 6-digit library card ID
+        book_id: ID of the book to hold
+
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    if not _valid_patron_id(patron_id):
+        return False, "Invalid patron ID. Must be exactly 6 digits."
+
+    book = get_book_by_id(book_id)
+    if not book:
+        return False, "Book not found."
+
+    if get_open_loan(patron_id, book_id):
+        return False, "You already have this book borrowed."
+
+    # The availability check and the insert share one catalog transaction,
+    # so a hold is never queued behind a copy that is already free
+    def enqueue(conn):
+        available = conn.execute('SELECT available_copies FROM books WHERE id = ?', (book_id,)).fetchone()
+        if available['available_copies'] > 0:
+            return "This book is available; borrow it instead."
+        if insert_hold(conn, patron_id, book_id, datetime.now()) is None:
+            return "You already have a hold on this book."
+        return None
+
+    try:
+        error = run_write(enqueue)
+    except sqlite3.Error:
+        return False, "Database error occurred while placing hold."
+
+    if error:
+        return False, error
+
+    position = get_hold_position(patron_id, book_id)
+    return True, f'Hold placed on "{book["title"]}". Position in queue: {position}.'
+
+
+def cancel_patron_hold(patron_id: str, book_id: int) -> Tuple[bool, str]:
+    """
+    Leave the waitlist for a book, or give up a copy set aside for the patron.
+
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    if not _valid_patron_id(patron_id):
+        return False, "Invalid patron ID. Must be exactly 6 digits."
+
+    try:
+        status = run_write(lambda conn: cancel_hold(conn, patron_id, book_id, datetime.now()))
+    except sqlite3.Error:
+        return False, "Database error occurred while cancelling hold."
+
+    if status is None:
+        return False, "No hold found for this patron and book."
+    if status == 'ready':
+        notify_availability_changed([book_id])
+    return True, "Hold cancelled."
+
+
+def get_holds_for_patron(patron_id: str) -> List[Dict]:
+    """
+    Get a patron's open holds: position 1 is next in line, and ready holds
+    (position 0) are waiting to be picked up by their expires_at deadline.
+    """
+    return get_patron_holds(patron_id)
+
+
+def get_hold_position(patron_id: str, book_id: int) -> Optional[int]:
+    """Get the patron's position in a book's queue (0 once ready), or None without an open hold."""
+    for hold in get_patron_holds(patron_id):
+        if hold['book_id'] == book_id:
+            return hold['position']
+    return None
+
+
+def expire_holds(now: Optional[datetime] = None) -> int:
+    """
+    Expire every ready hold past its pickup deadline, passing each copy on.
+
+    Returns:
+        int: Number of holds expired
+    """
+    now = now or datetime.now()
+    expired = 0
+    while True:
+        book_ids = run_write(lambda conn: expire_ready_holds(conn, now, EXPIRY_BATCH_SIZE))
+        notify_availability_changed(book_ids)
+        expired += len(book_ids)
+        if len(book_ids) < EXPIRY_BATCH_SIZE:
+            return expired
+
+
+class HoldExpiryTimer:
+    """
+    Background thread that expires ready holds as their pickup deadlines pass.
+
+    It sleeps until the earliest deadline (at most max_wait seconds, so holds
+    that become ready in the meantime are not missed), then expires every
+    hold that is due.
+    """
+
+    def __init__(self, max_wait: float = EXPIRY_MAX_WAIT_SECONDS):
+        self.max_wait = max_wait
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.runs = 0
+        self.expired = 0
+        self.failures = 0
+        self.last_error = None
+
+    def start(self) -> 'HoldExpiryTimer':
+        """Start the timer thread (it runs in the caller's context, e.g. its app)."""
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                context = contextvars.copy_context()
+                self._thread = threading.Thread(target=context.run, args=(self._run,),
+                                                name='hold-expiry-timer', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the timer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def stats(self) -> Dict:
+        """Return run, expiry and failure counters."""
+        return {'runs': self.runs, 'expired': self.expired, 'failures': self.failures, 'last_error': self.last_error}
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.runs += 1
+            wait = self.max_wait
+            try:
+                self.expired += expire_holds()
+                next_expiry = get_next_hold_expiry()
+            except Exception as e:
+                # Database errors, group-commit timeouts or a dead writer: try
+                # again after max_wait; due holds are still due then
+                logger.exception('Hold expiry run failed')
+                self.failures += 1
+                self.last_error = str(e)
+            else:
+                if next_expiry is not None:
+                    wait = min(wait, max(0.0, (next_expiry - datetime.now()).total_seconds()))
+            self._stop.wait(wait)
@@ -3,14 +3,27 @@ Library Service Module - Business Logic Functions
 Contains all the core business logic for the Library Management System
 """
 
+import sqlite3
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 from database import (
     get_book_by_id, get_book_by_isbn, get_patron_borrow_count,
     insert_book, insert_borrow_record, update_book_availability,
-    update_borrow_record_return_date, get_all_books, get_patron_borrowed_books
+    update_borrow_record_return_date, get_all_books, get_patron_borrowed_books, get_patron_loan_history,
+    get_books_by_ids, get_open_loans_for_pairs, get_open_loan,
+    run_write, count_open_loans, checkout_copy, checkin_copy, get_overdue_loans, has_ready_hold
 )
 from services.payment_service import PaymentGateway
+from services.availability_bus import notify_availability_changed
+from services.catalog_snapshot import get_catalog_snapshot
+from services.suggest import notify_book_added
+
+# Most recent returned loans listed on a patron's status report; the rest are
+# paged through with get_patron_history
+STATUS_HISTORY_LIMIT = 20
+
+# Largest page of loans returned by get_patron_history
+MAX_HISTORY_PAGE = 100
 
 def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -> Tuple[bool, str]:
     """
@@ -53,6 +66,7 @@ def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -
     # Insert new book
     success = insert_book(title.strip(), author.strip(), isbn, total_copies, total_copies)
     if success:
+        notify_book_added(isbn)
         return True, f'Book "{title.strip()}" has been successfully added to the catalog.'
     else:
         return False, "Database error occurred while adding the book."
@@ -78,29 +92,33 @@ def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     if not book:
         return False, "Book not found."
     
-    if book['available_copies'] <= 0:
+    # A copy set aside for the patron's hold is not counted as available
+    if book['available_copies'] <= 0 and not has_ready_hold(patron_id, book_id):
         return False, "This book is currently not available."
     
-    # Check patron's current borrowed books count
-    current_borrowed = get_patron_borrow_count(patron_id)
-    
-    # FIX: Changed > 5 to >= 5 to properly enforce the 5-book limit
-    if current_borrowed >= 5:
-        return False, "You have reached the maximum borrowing limit of 5 books."
-    
     # Create borrow record
     borrow_date = datetime.now()
     due_date = borrow_date + timedelta(days=14)
     
-    # Insert borrow record and update availability
-    borrow_success = insert_borrow_record(patron_id, book_id, borrow_date, due_date)
-    if not borrow_success:
+    # Check the borrowing limit, take a copy and insert the borrow record in
+    # one write transaction, so concurrent borrows can never over-issue a title
+    def checkout(conn):
+        # FIX: Changed > 5 to >= 5 to properly enforce the 5-book limit
+        if count_open_loans(conn, patron_id) >= 5:
+            return "You have reached the maximum borrowing limit of 5 books."
+        if not checkout_copy(conn, patron_id, book_id, borrow_date, due_date):
+            return "This book is currently not available."
+        return None
+    
+    try:
+        error = run_write(checkout, patron_id=patron_id)
+    except sqlite3.Error:
         return False, "Database error occurred while creating borrow record."
     
-    availability_success = update_book_availability(book_id, -1)
-    if not availability_success:
-        return False, "Database error occurred while updating book availability."
+    if error:
+        return False, error
     
+    notify_availability_changed([book_id])
     return True, f'Successfully borrowed "{book["title"]}". Due date: {due_date.strftime("%Y-%m-%d")}.'
 
 def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
@@ -124,34 +142,125 @@ def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     if not book:
         return False, "Book not found."
     
-    # Get patron's currently borrowed books
-    borrowed_books = get_patron_borrowed_books(patron_id)
-    
-    # Check if patron has this book borrowed
-    book_borrowed = False
-    for borrowed in borrowed_books:
-        if borrowed['book_id'] == book_id:
-            book_borrowed = True
-            break
-    
-    if not book_borrowed:
-        return False, "You do not have this book borrowed."
-    
-    # Process return
+    # Process return: the open-loan check, return date update and availability
+    # change all run on one connection inside a single transaction
     return_date = datetime.now()
     
-    # Update borrow record with return date
-    return_success = update_borrow_record_return_date(patron_id, book_id, return_date)
-    if not return_success:
+    try:
+        book_borrowed = run_write(lambda conn: checkin_copy(conn, patron_id, book_id, return_date), patron_id=patron_id)
+    except sqlite3.Error:
         return False, "Database error occurred while updating return record."
     
-    # Update book availability
-    availability_success = update_book_availability(book_id, 1)
-    if not availability_success:
-        return False, "Database error occurred while updating book availability."
+    if not book_borrowed:
+        return False, "You do not have this book borrowed."
     
+    notify_availability_changed([book_id])
     return True, f'Successfully returned "{book["title"]}".'
 
+def borrow_books_by_patron(patron_id: str, book_ids: List[int]) -> Tuple[bool, str, List[Dict]]:
+    """
+    Check out a cart of books for a patron in a single transaction.
+    Bulk variant of borrow_book_by_patron for the circulation desk.
+
+    The patron is validated once and the 5-book limit is enforced across the
+    whole cart. Items that cannot be borrowed are reported individually while
+    the rest of the cart is still applied.
+
+    Args:
+        patron_id: 6-digit library card ID
+        book_ids: IDs of the books to borrow, in cart order
+
+    Returns:
+        tuple: (success: bool, message: str, items: list of per-item results
+                with book_id, success and message)
+    """
+    # Validate patron ID
+    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+        return False, "Invalid patron ID. Must be exactly 6 digits.", []
+
+    if not book_ids:
+        return False, "The cart is empty.", []
+
+    books = get_books_by_ids(book_ids)
+    borrow_date = datetime.now()
+    due_date = borrow_date + timedelta(days=14)
+
+    def checkout_cart(conn):
+        items = []
+        current_borrowed = count_open_loans(conn, patron_id)
+        for book_id in book_ids:
+            book = books.get(book_id)
+            if not book:
+                items.append(_cart_item(book_id, False, "Book not found."))
+            elif current_borrowed >= 5:
+                items.append(_cart_item(book_id, False, "You have reached the maximum borrowing limit of 5 books."))
+            elif not checkout_copy(conn, patron_id, book_id, borrow_date, due_date):
+                items.append(_cart_item(book_id, False, "This book is currently not available."))
+            else:
+                current_borrowed += 1
+                items.append(_cart_item(
+                    book_id, True,
+                    f'Successfully borrowed "{book["title"]}". Due date: {due_date.strftime("%Y-%m-%d")}.'
+                ))
+        return items
+
+    try:
+        items = run_write(checkout_cart, patron_id=patron_id)
+    except sqlite3.Error:
+        return False, "Database error occurred while processing the cart.", []
+
+    notify_availability_changed(item['book_id'] for item in items if item['success'])
+    borrowed = sum(1 for item in items if item['success'])
+    return borrowed == len(items), f"Borrowed {borrowed} of {len(items)} book(s).", items
+
+def return_books_by_patron(patron_id: str, book_ids: List[int]) -> Tuple[bool, str, List[Dict]]:
+    """
+    Return a cart of books for a patron in a single transaction.
+    Bulk variant of return_book_by_patron for the circulation desk.
+
+    Args:
+        patron_id: 6-digit library card ID
+        book_ids: IDs of the books to return, in cart order
+
+    Returns:
+        tuple: (success: bool, message: str, items: list of per-item results
+                with book_id, success and message)
+    """
+    # Validate patron ID
+    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+        return False, "Invalid patron ID. Must be exactly 6 digits.", []
+
+    if not book_ids:
+        return False, "The cart is empty.", []
+
+    books = get_books_by_ids(book_ids)
+    return_date = datetime.now()
+
+    def checkin_cart(conn):
+        items = []
+        for book_id in book_ids:
+            book = books.get(book_id)
+            if not book:
+                items.append(_cart_item(book_id, False, "Book not found."))
+            elif not checkin_copy(conn, patron_id, book_id, return_date):
+                items.append(_cart_item(book_id, False, "You do not have this book borrowed."))
+            else:
+                items.append(_cart_item(book_id, True, f'Successfully returned "{book["title"]}".'))
+        return items
+
+    try:
+        items = run_write(checkin_cart, patron_id=patron_id)
+    except sqlite3.Error:
+        return False, "Database error occurred while processing the cart.", []
+
+    notify_availability_changed(item['book_id'] for item in items if item['success'])
+    returned = sum(1 for item in items if item['success'])
+    return returned == len(items), f"Returned {returned} of {len(items)} book(s).", items
+
+def _cart_item(book_id: int, success: bool, message: str) -> Dict:
+    """Build the per-item result reported for a cart operation."""
+    return {'book_id': book_id, 'success': success, 'message': message}
+
 def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
     """
     Calculate late fees for a specific book.
@@ -177,15 +286,8 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
             'status': 'Invalid patron ID'
         }
     
-    # Get patron's currently borrowed books
-    borrowed_books = get_patron_borrowed_books(patron_id)
-    
-    # Find the specific book
-    target_book = None
-    for borrowed in borrowed_books:
-        if borrowed['book_id'] == book_id:
-            target_book = borrowed
-            break
+    # Look up the patron's open loan of this book
+    target_book = get_open_loan(patron_id, book_id)
     
     if not target_book:
         return {
@@ -194,17 +296,21 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
             'status': 'Book not currently borrowed by this patron'
         }
     
+    return _late_fee_for_due_date(target_book['due_date'], datetime.now())
+
+def _late_fee_for_due_date(due_date: datetime, now: datetime) -> Dict:
+    """Apply the R5 fee structure to a loan with the given due date."""
     # Check if overdue
-    if not target_book['is_overdue']:
+    if not now > due_date:
         return {
             'fee_amount': 0.00,
             'days_overdue': 0,
             'status': 'Book is not overdue'
         }
-    
+
     # Calculate days overdue
-    days_overdue = (datetime.now() - target_book['due_date']).days
-    
+    days_overdue = (now - due_date).days
+
     # Calculate fee with tiered structure
     if days_overdue <= 7:
         # $0.50 per day for first 7 days
@@ -222,6 +328,73 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
         'status': f'Overdue by {days_overdue} day(s)'
     }
 
+def calculate_late_fees_batch(pairs: List[Tuple[str, int]]) -> List[Dict]:
+    """
+    Calculate late fees for many (patron_id, book_id) pairs at once.
+    Batch variant of calculate_late_fee_for_book for kiosk clients.
+
+    All open loans are fetched with a fixed number of chunked queries instead
+    of one get_patron_borrowed_books call per pair.
+
+    Args:
+        pairs: (patron_id, book_id) pairs to look up
+
+    Returns:
+        list: One result per pair, in request order, each containing patron_id,
+              book_id, fee_amount, days_overdue and status
+    """
+    valid_pairs = [
+        (patron_id, book_id) for patron_id, book_id in pairs
+        if patron_id and patron_id.isdigit() and len(patron_id) == 6
+    ]
+    loans = get_open_loans_for_pairs(valid_pairs) if valid_pairs else {}
+    now = datetime.now()
+
+    results = []
+    for patron_id, book_id in pairs:
+        if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+            fee_info = {'fee_amount': 0.00, 'days_overdue': 0, 'status': 'Invalid patron ID'}
+        elif (patron_id, book_id) not in loans:
+            fee_info = {
+                'fee_amount': 0.00,
+                'days_overdue': 0,
+                'status': 'Book not currently borrowed by this patron'
+            }
+        else:
+            fee_info = _late_fee_for_due_date(loans[(patron_id, book_id)]['due_date'], now)
+        results.append({'patron_id': patron_id, 'book_id': book_id, **fee_info})
+
+    return results
+
+def get_availability_batch(book_ids: List[int]) -> List[Dict]:
+    """
+    Look up availability for many books at once.
+
+    Args:
+        book_ids: IDs of the books to check
+
+    Returns:
+        list: One result per ID, in request order, with available_copies and
+              total_copies, or an error if the book does not exist
+    """
+    books = get_books_by_ids(book_ids)
+
+    results = []
+    for book_id in book_ids:
+        book = books.get(book_id)
+        if not book:
+            results.append({'book_id': book_id, 'error': 'Book not found.'})
+            continue
+        results.append({
+            'book_id': book_id,
+            'title': book['title'],
+            'available_copies': book['available_copies'],
+            'total_copies': book['total_copies'],
+            'is_available': book['available_copies'] > 0
+        })
+
+    return results
+
 def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]:
     """
     Search for books in the catalog.
@@ -241,6 +414,11 @@ def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]:
     if search_type not in ['title', 'author', 'isbn']:
         return []
     
+    # Search the memory-mapped catalog snapshot when the app uses one
+    snapshot = get_catalog_snapshot()
+    if snapshot is not None:
+        return snapshot.search(search_term, search_type)
+    
     # Get all books
     all_books = get_all_books()
     
@@ -270,7 +448,7 @@ def get_patron_status_report(patron_id: str) -> Dict:
         patron_id: 6-digit library card ID
         
     Returns:
-        dict: Patron status report with borrowed books and total fees
+        dict: Patron status report with borrowed books, total fees and borrowing history
     """
     # Validate patron ID
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
@@ -279,6 +457,7 @@ def get_patron_status_report(patron_id: str) -> Dict:
             'borrowed_books': [],
             'total_books_borrowed': 0,
             'total_late_fees': 0.00,
+            'borrowing_history': [],
             'status': 'Invalid patron ID'
         }
     
@@ -311,55 +490,171 @@ def get_patron_status_report(patron_id: str) -> Dict:
         
         book_details.append(book_info)
     
+    # The most recent returned loans, including ones already moved to the archive
+    borrowing_history = [
+        _history_entry(loan) for loan in get_patron_loan_history(patron_id, limit=STATUS_HISTORY_LIMIT)
+    ]
+    
     return {
         'patron_id': patron_id,
         'borrowed_books': book_details,
         'total_books_borrowed': len(borrowed_books),
         'total_late_fees': round(total_late_fees, 2),
+        'borrowing_history': borrowing_history,
         'status': 'Active' if len(borrowed_books) > 0 else 'No books currently borrowed'
     }
 
-def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway = None) -> Tuple[bool, str, Optional[str]]:
+def _history_entry(loan: Dict) -> Dict:
+    return {
+        'book_id': loan['book_id'],
+        'title': loan['title'],
+        'author': loan['author'],
+        'borrow_date': loan['borrow_date'].strftime('%Y-%m-%d'),
+        'return_date': loan['return_date'].strftime('%Y-%m-%d')
+    }
+
+def get_patron_history(patron_id: str, limit: int = STATUS_HISTORY_LIMIT, before: Optional[str] = None) -> Dict:
     """
-    Process payment for late fees using external payment gateway.
-    
-    NEW FEATURE FOR ASSIGNMENT 3: Demonstrates need for mocking/stubbing
-    This function depends on an external payment service that should be mocked in tests.
+    Get one page of a patron's returned loans, most recent first, including
+    archived ones.
     
     Args:
         patron_id: 6-digit library card ID
-        book_id: ID of the book with late fees
-        payment_gateway: Payment gateway instance (injectable for testing)
+        limit: Loans per page (1 to MAX_HISTORY_PAGE)
+        before: Cursor continuing after the previous page (its next_before)
         
     Returns:
-        tuple: (success: bool, message: str, transaction_id: Optional[str])
+        dict: The loans, their count, and next_before for the following page (None on the last page)
         
-    Example for you to mock:
-        # In tests, mock the payment gateway:
-        mock_gateway = Mock(spec=PaymentGateway)
-        mock_gateway.process_payment.return_value = (True, "txn_123", "Success")
-        success, msg, txn = pay_late_fees("123456", 1, mock_gateway)
+    Raises:
+        ValueError: If the patron ID, limit or cursor is invalid
+    """
+    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+        raise ValueError("Invalid patron ID. Must be exactly 6 digits.")
+    if not 1 <= limit <= MAX_HISTORY_PAGE:
+        raise ValueError(f"limit must be between 1 and {MAX_HISTORY_PAGE}.")
+    cursor = None
+    if before is not None:
+        borrow_date, _, loan_id = before.rpartition('~')
+        try:
+            cursor = (datetime.fromisoformat(borrow_date), int(loan_id))
+        except ValueError:
+            raise ValueError("before must be the next_before of a previous page.")
+    
+    # One extra row tells whether another page follows
+    loans = get_patron_loan_history(patron_id, limit=limit + 1, before=cursor)
+    page = loans[:limit]
+    last = page[-1] if len(loans) > limit else None
+    return {
+        'patron_id': patron_id,
+        'history': [_history_entry(loan) for loan in page],
+        'count': len(page),
+        'next_before': f"{last['borrow_date'].isoformat()}~{last['id']}" if last else None
+    }
+
+def get_overdue_report() -> Dict:
+    """
+    Get every overdue loan in the library, most overdue first, with its late fee.
+
+    Returns:
+        dict: Overdue loans (patron, book, dates, days overdue, fee) and totals
+    """
+    now = datetime.now()
+    loans = []
+    total_late_fees = 0.00
+
+    for loan in get_overdue_loans(now):
+        fee_info = _late_fee_for_due_date(loan['due_date'], now)
+        loans.append({
+            'patron_id': loan['patron_id'],
+            'book_id': loan['book_id'],
+            'title': loan['title'],
+            'author': loan['author'],
+            'borrow_date': loan['borrow_date'].strftime('%Y-%m-%d'),
+            'due_date': loan['due_date'].strftime('%Y-%m-%d'),
+            'days_overdue': fee_info['days_overdue'],
+            'late_fee': fee_info['fee_amount']
+        })
+        total_late_fees += fee_info['fee_amount']
+
+    return {
+        'overdue_loans': loans,
+        'count': len(loans),
+        'total_late_fees': round(total_late_fees, 2)
+    }
+
+def prepare_late_fee_payment(patron_id: str, book_id: int) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Validate a late fee payment and work out the charge.
+    Shared by pay_late_fees and its async variant.
+    
+    Returns:
+        tuple: (process_payment keyword arguments, None), or (None, error message)
     """
     # Validate patron ID
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
-        return False, "Invalid patron ID. Must be exactly 6 digits.", None
+        return None, "Invalid patron ID. Must be exactly 6 digits."
     
     # Calculate late fee first
     fee_info = calculate_late_fee_for_book(patron_id, book_id)
     
     # Check if there's a fee to pay
     if not fee_info or 'fee_amount' not in fee_info:
-        return False, "Unable to calculate late fees.", None
+        return None, "Unable to calculate late fees."
     
     fee_amount = fee_info.get('fee_amount', 0.0)
     
     if fee_amount <= 0:
-        return False, "No late fees to pay for this book.", None
+        return None, "No late fees to pay for this book."
     
     # Get book details for payment description
     book = get_book_by_id(book_id)
     if not book:
-        return False, "Book not found.", None
+        return None, "Book not found."
+    
+    return {
+        'patron_id': patron_id,
+        'amount': fee_amount,
+        'description': f"Late fees for '{book['title']}'"
+    }, None
+
+def late_fee_payment_result(outcome: Union[Tuple[bool, str, str], Exception]) -> Tuple[bool, str, Optional[str]]:
+    """
+    Turn a gateway's (success, transaction_id, message), or the exception it
+    raised, into the result of pay_late_fees and its async variant.
+    """
+    if isinstance(outcome, Exception):
+        # Handle payment gateway errors
+        return False, f"Payment processing error: {str(outcome)}", None
+    success, transaction_id, message = outcome
+    if success:
+        return True, f"Payment successful! {message}", transaction_id
+    return False, f"Payment failed: {message}", None
+
+def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway = None) -> Tuple[bool, str, Optional[str]]:
+    """
+    Process payment for late fees using external payment gateway.
+    
+    NEW FEATURE FOR ASSIGNMENT 3: Demonstrates need for mocking/stubbing
+    This function depends on an external payment service that should be mocked in tests.
+    
+    Args:
+        patron_id: 6-digit library card ID
+        book_id: ID of the book with late fees
+        payment_gateway: Payment gateway instance (injectable for testing)
+        
+    Returns:
+        tuple: (success: bool, message: str, transaction_id: Optional[str])
+        
+    Example for you to mock:
+        # In tests, mock the payment gateway:
+        mock_gateway = Mock(spec=PaymentGateway)
+        mock_gateway.process_payment.return_value = (True, "txn_123", "Success")
+        success, msg, txn = pay_late_fees("123456", 1, mock_gateway)
+    """
+    payment, error = prepare_late_fee_payment(patron_id, book_id)
+    if error:
+        return False, error, None
     
     # Use provided gateway or create new one
     if payment_gateway is None:
@@ -368,20 +663,10 @@ def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway
     # Process payment through external gateway
     # THIS IS WHAT YOU SHOULD MOCK IN THEIR TESTS!
     try:
-        success, transaction_id, message = payment_gateway.process_payment(
-            patron_id=patron_id,
-            amount=fee_amount,
-            description=f"Late fees for '{book['title']}'"
-        )
-        
-        if success:
-            return True, f"Payment successful! {message}", transaction_id
-        else:
-            return False, f"Payment failed: {message}", None
-            
+        outcome = payment_gateway.process_payment(**payment)
     except Exception as e:
-        # Handle payment gateway errors
-        return False, f"Payment processing error: {str(e)}", None
+        outcome = e
+    return late_fee_payment_result(outcome)
 
 
 def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway: PaymentGateway = None) -> Tuple[bool, str]:
@@ -0,0 +1,78 @@
+"""
+Loan Archive Module - Moves long-returned loans out of the hot borrow_records table
+Open-loan lookups only need recent rows, so loans returned more than a
+retention period ago are moved to borrow_history in small batched
+transactions. History queries (get_patron_loan_history) read both tables.
+
+Run as a job with: python -m services.loan_archive --days 90
+"""
+
+import argparse
+import json
+from datetime import datetime, timedelta
+from typing import Dict
+import database
+from database import archive_returned_loan_batch, get_loan_table_stats, run_write_on_loan_databases
+
+# Loans returned more than this many days ago are archived
+ARCHIVE_AFTER_DAYS = 90
+
+# Loans moved per write transaction, so borrows and returns are never blocked for long
+ARCHIVE_BATCH_SIZE = 200
+
+
+def archive_returned_loans(older_than_days: int = ARCHIVE_AFTER_DAYS,
+                           batch_size: int = ARCHIVE_BATCH_SIZE) -> Dict:
+    """
+    Archive every loan returned more than older_than_days ago.
+
+    Args:
+        older_than_days: Retention period of returned loans in the hot table
+        batch_size: Maximum loans moved per transaction
+
+    Returns:
+        dict: Cutoff, loans archived, transactions used and the loan table
+              stats before and after the run
+    """
+    if older_than_days < 0:
+        raise ValueError("older_than_days must not be negative.")
+    if batch_size <= 0:
+        raise ValueError("batch_size must be positive.")
+
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    before = get_loan_table_stats()
+
+    archived = 0
+    batches = 0
+    while True:
+        moved = run_write_on_loan_databases(
+            lambda conn: archive_returned_loan_batch(conn, cutoff, batch_size)
+        )
+        batches += len(moved)
+        archived += sum(moved)
+        if sum(moved) == 0:
+            break
+
+    return {
+        'returned_before': cutoff.isoformat(),
+        'archived': archived,
+        'batches': batches,
+        'before': before,
+        'after': get_loan_table_stats()
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', default=database.DATABASE, help='Library database file')
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS, help='Archive loans returned more than this many days ago')
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='Loans moved per transaction')
+    args = parser.parse_args()
+
+    database.DATABASE = args.database
+    database.init_database()
+    print(json.dumps(archive_returned_loans(args.days, args.batch_size), indent=2))
+
+
+if __name__ == '__main__':
+    main()
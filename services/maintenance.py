@@ -0,0 +1,383 @@
+"""
+Maintenance Module - ANALYZE, incremental VACUUM, WAL checkpoints and quick_check
+Bulk imports and loan churn leave the database with free pages and the
+query planner with stale statistics. A maintenance run visits the catalog
+database and every loan shard and, within a time budget:
+
+- refreshes planner statistics (ANALYZE the first time, PRAGMA optimize after)
+- hands free pages back to the file system with incremental_vacuum, a few
+  pages per step so writers only ever wait for one short step
+- checkpoints the WAL (truncating it when every frame could be copied back)
+- runs PRAGMA quick_check
+
+Statements are interrupted through a progress handler once the budget is
+spent, and the remaining tasks are reported as skipped. Page counts, freelist
+size and the duration of every task are recorded for each run.
+
+Incremental vacuum needs auto_vacuum=INCREMENTAL, which init_database sets
+on new databases; older files are converted once with --convert (a full
+VACUUM, so run it while the app is stopped).
+
+MaintenanceScheduler runs maintenance inside the app once per low-traffic
+window (e.g. 02:00-05:00), when the request rate is below a threshold.
+
+Usage:
+    python -m services.maintenance --budget 60
+    python -m services.maintenance --convert
+"""
+
+import argparse
+import contextvars
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, time as clock_time, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+from flask import Flask
+import database
+from database import connect, is_lock_error, library_databases
+
+# Seconds a maintenance run may take across all databases
+MAINTENANCE_BUDGET_SECONDS = 60.0
+
+# Free pages returned per incremental_vacuum step
+VACUUM_PAGES_PER_STEP = 256
+
+# Rows sampled per index by ANALYZE (PRAGMA analysis_limit), keeping it cheap on large tables
+ANALYSIS_LIMIT = 1000
+
+# Problems reported by quick_check before it stops
+QUICK_CHECK_MAX_ERRORS = 10
+
+# SQLite virtual machine instructions between budget checks
+PROGRESS_CHECK_INSTRUCTIONS = 10000
+
+TASKS = ('optimize', 'incremental_vacuum', 'checkpoint', 'quick_check')
+
+# Default low-traffic window and the request rate above which it is not quiet
+MAINTENANCE_WINDOW = '02:00-05:00'
+MAX_REQUESTS_PER_MINUTE = 30
+
+# Seconds between the scheduler's checks of the window and the request rate
+CHECK_INTERVAL_SECONDS = 60.0
+
+# Maintenance runs kept in the scheduler's history
+HISTORY_SIZE = 30
+
+_AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+class _BudgetExhausted(Exception):
+    pass
+
+
+def page_stats(conn: sqlite3.Connection) -> Dict:
+    """Page size and counts, freelist size and auto_vacuum mode of a database."""
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    return {
+        'page_size': page_size,
+        'page_count': page_count,
+        'freelist_count': freelist,
+        'bytes': page_size * page_count,
+        'free_bytes': page_size * freelist,
+        'auto_vacuum': _AUTO_VACUUM_MODES.get(auto_vacuum, str(auto_vacuum))
+    }
+
+
+def _optimize(conn: sqlite3.Connection) -> Dict:
+    conn.execute(f'PRAGMA analysis_limit={ANALYSIS_LIMIT}')
+    analyzed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+    statement = 'PRAGMA optimize' if analyzed else 'ANALYZE'
+    conn.execute(statement)
+    return {'statement': statement}
+
+
+def _incremental_vacuum(conn: sqlite3.Connection, deadline: float, pages_per_step: int) -> Dict:
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return {'skipped': 'auto_vacuum is not incremental; convert with --convert'}
+    freed = steps = 0
+    while True:
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if not free:
+            break
+        if time.monotonic() >= deadline:
+            raise _BudgetExhausted()
+        # The pragma frees one page per row returned, so it must be read to the end
+        conn.execute(f'PRAGMA incremental_vacuum({min(free, pages_per_step)})').fetchall()
+        freed += free - conn.execute('PRAGMA freelist_count').fetchone()[0]
+        steps += 1
+    return {'pages_freed': freed, 'steps': steps}
+
+
+def _checkpoint(conn: sqlite3.Connection) -> Dict:
+    if conn.execute('PRAGMA journal_mode').fetchone()[0] != 'wal':
+        return {'skipped': 'not in WAL mode'}
+    busy, frames, checkpointed = conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+    truncated = False
+    if not busy and frames == checkpointed:
+        # Every frame is in the database file, so resetting the WAL only waits
+        # for readers that started before the checkpoint
+        truncated = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()[0] == 0
+    return {'wal_frames': frames, 'checkpointed_frames': checkpointed, 'busy': bool(busy), 'truncated': truncated}
+
+
+def _quick_check(conn: sqlite3.Connection) -> Dict:
+    rows = conn.execute(f'PRAGMA quick_check({QUICK_CHECK_MAX_ERRORS})').fetchall()
+    result = '; '.join(row[0] for row in rows)
+    return {'ok': result == 'ok', 'result': result}
+
+
+def maintain_database(uri: str, deadline: float, tasks: Sequence[str] = TASKS,
+                      pages_per_step: int = VACUUM_PAGES_PER_STEP) -> Dict:
+    """
+    Run the maintenance tasks on one database until the monotonic deadline.
+
+    Returns:
+        dict: Page stats before and after, and the outcome and duration of
+              each task (skipped once the budget is spent, error if it failed)
+    """
+    conn = connect(uri)
+    try:
+        before = page_stats(conn)
+        conn.set_progress_handler(lambda: time.monotonic() >= deadline, PROGRESS_CHECK_INSTRUCTIONS)
+        results = {}
+        for task in tasks:
+            if time.monotonic() >= deadline:
+                results[task] = {'skipped': 'time budget exhausted'}
+                continue
+            started = time.perf_counter()
+            try:
+                if task == 'optimize':
+                    result = _optimize(conn)
+                elif task == 'incremental_vacuum':
+                    result = _incremental_vacuum(conn, deadline, pages_per_step)
+                elif task == 'checkpoint':
+                    result = _checkpoint(conn)
+                else:
+                    result = _quick_check(conn)
+            except _BudgetExhausted:
+                result = {'skipped': 'time budget exhausted'}
+            except sqlite3.OperationalError as e:
+                if time.monotonic() >= deadline:
+                    result = {'skipped': 'time budget exhausted'}
+                elif is_lock_error(e):
+                    result = {'error': 'database is busy'}
+                else:
+                    result = {'error': str(e)}
+            result['seconds'] = round(time.perf_counter() - started, 4)
+            results[task] = result
+        conn.set_progress_handler(None, 0)
+        after = page_stats(conn)
+    finally:
+        conn.close()
+    return {'before': before, 'after': after, 'tasks': results}
+
+
+def run_maintenance(budget_seconds: float = MAINTENANCE_BUDGET_SECONDS, tasks: Sequence[str] = TASKS,
+                    pages_per_step: int = VACUUM_PAGES_PER_STEP) -> Dict:
+    """
+    Maintain the catalog database and every loan shard within one time budget.
+
+    Returns:
+        dict: Start time, duration, and per-database page stats and task results
+    """
+    unknown = set(tasks) - set(TASKS)
+    if unknown:
+        raise ValueError(f"Unknown maintenance tasks: {', '.join(sorted(unknown))}.")
+    if budget_seconds <= 0:
+        raise ValueError("budget_seconds must be positive.")
+
+    started_at = datetime.now()
+    started = time.perf_counter()
+    deadline = time.monotonic() + budget_seconds
+    databases = {}
+    for shard, uri in library_databases():
+        databases['catalog' if shard is None else f'shard{shard}'] = maintain_database(uri, deadline, tasks, pages_per_step)
+    return {
+        'started_at': started_at.isoformat(),
+        'seconds': round(time.perf_counter() - started, 4),
+        'budget_seconds': budget_seconds,
+        'databases': databases
+    }
+
+
+def convert_to_incremental_vacuum() -> List[str]:
+    """
+    Switch every database of the library still without auto_vacuum to
+    INCREMENTAL. Rebuilds each converted file with VACUUM, holding its write
+    lock throughout, so run it while the app is stopped.
+
+    Returns:
+        list: The databases converted
+    """
+    converted = []
+    for shard, uri in library_databases():
+        conn = connect(uri)
+        try:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                conn.execute('VACUUM')
+                converted.append('catalog' if shard is None else f'shard{shard}')
+        finally:
+            conn.close()
+    return converted
+
+
+def parse_window(window: str) -> Tuple[clock_time, clock_time]:
+    """Parse "HH:MM-HH:MM" (which may wrap past midnight) into start and end times."""
+    try:
+        start, end = (clock_time.fromisoformat(part.strip()) for part in window.split('-'))
+    except ValueError:
+        raise ValueError(f"Maintenance window must look like 02:00-05:00, not '{window}'.")
+    if start == end:
+        raise ValueError("The maintenance window must not be empty.")
+    return start, end
+
+
+def window_start(now: datetime, window: Tuple[clock_time, clock_time]) -> Optional[datetime]:
+    """Start of the occurrence of the window containing now, or None outside it."""
+    start, end = window
+    today = datetime.combine(now.date(), start)
+    if start < end:
+        return today if start <= now.time() < end else None
+    if now.time() >= start:
+        return today
+    if now.time() < end:
+        return today - timedelta(days=1)
+    return None
+
+
+class MaintenanceScheduler:
+    """
+    Background thread running maintenance once per low-traffic window.
+
+    Install with init_app(app) so requests are counted; a window is only
+    used while fewer than max_requests_per_minute requests arrived in the
+    last minute. trigger() runs maintenance now regardless of the window.
+    """
+
+    def __init__(self, window: str = MAINTENANCE_WINDOW, budget: float = MAINTENANCE_BUDGET_SECONDS,
+                 max_requests_per_minute: int = MAX_REQUESTS_PER_MINUTE,
+                 check_interval: float = CHECK_INTERVAL_SECONDS):
+        self.window = parse_window(window)
+        self.budget = budget
+        self.max_requests_per_minute = max_requests_per_minute
+        self.check_interval = check_interval
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._forced = False
+        # Arrival times of the latest requests; one more than the limit is enough to tell
+        self._requests = deque(maxlen=max_requests_per_minute + 1)
+        self._history = deque(maxlen=HISTORY_SIZE)
+        self._last_window = None
+        self.running = False
+        self.runs = 0
+
+    def init_app(self, app: Flask) -> 'MaintenanceScheduler':
+        app.before_request(self._count_request)
+        app.extensions['maintenance_scheduler'] = self
+        return self
+
+    def start(self) -> 'MaintenanceScheduler':
+        """Start the scheduler thread (it runs in the caller's context, e.g. its app)."""
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                context = contextvars.copy_context()
+                self._thread = threading.Thread(target=context.run, args=(self._run,),
+                                                name='maintenance-scheduler', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the scheduler thread (after the run in progress, if any)."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            self._wake.set()
+            thread.join()
+
+    def trigger(self) -> None:
+        """Ask the scheduler thread to run maintenance now."""
+        self._forced = True
+        self._wake.set()
+
+    def is_quiet(self) -> bool:
+        """Whether fewer than max_requests_per_minute requests arrived in the last minute."""
+        requests = list(self._requests)
+        return len(requests) < self._requests.maxlen or requests[0] < time.monotonic() - 60
+
+    def due(self, now: Optional[datetime] = None) -> bool:
+        """Whether now is in a window that has not had its run yet, and traffic is quiet."""
+        start = window_start(now or datetime.now(), self.window)
+        return start is not None and start != self._last_window and self.is_quiet()
+
+    def run(self) -> Dict:
+        """Run maintenance now and record it in the history."""
+        self.running = True
+        try:
+            result = run_maintenance(self.budget)
+        finally:
+            self.running = False
+        self.runs += 1
+        self._history.append(result)
+        return result
+
+    def stats(self) -> Dict:
+        """Scheduler state and the recorded maintenance runs, newest first."""
+        return {
+            'window': '-'.join(t.strftime('%H:%M') for t in self.window),
+            'budget_seconds': self.budget,
+            'running': self.running,
+            'quiet': self.is_quiet(),
+            'runs': self.runs,
+            'history': list(reversed(self._history))
+        }
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            now = datetime.now()
+            if self._forced or self.due(now):
+                self._forced = False
+                self._last_window = window_start(now, self.window) or self._last_window
+                try:
+                    self.run()
+                except sqlite3.Error:
+                    pass  # a failed run is retried in the next window
+
+    def _count_request(self) -> None:
+        self._requests.append(time.monotonic())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', default=database.DATABASE, help='Library database file')
+    parser.add_argument('--shards', type=int, default=database.SHARD_COUNT, help='Number of loan shard files')
+    parser.add_argument('--budget', type=float, default=MAINTENANCE_BUDGET_SECONDS, help='Time budget in seconds')
+    parser.add_argument('--tasks', default=','.join(TASKS), help='Comma-separated tasks (default: %(default)s)')
+    parser.add_argument('--convert', action='store_true',
+                        help='Switch databases to auto_vacuum=INCREMENTAL with a full VACUUM (app stopped)')
+    args = parser.parse_args()
+
+    database.DATABASE = args.database
+    database.SHARD_COUNT = args.shards
+    if args.convert:
+        print(json.dumps({'converted': convert_to_incremental_vacuum()}, indent=2))
+        return
+    print(json.dumps(run_maintenance(args.budget, args.tasks.split(',')), indent=2))
+
+
+if __name__ == '__main__':
+    main()
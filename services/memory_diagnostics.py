@@ -0,0 +1,257 @@
+"""
+Memory Diagnostics Module - tracemalloc snapshots and per-request peaks
+Starts and stops tracemalloc on demand, keeps a few labelled snapshots, and
+reports traced memory grouped by the module that allocated it (database,
+services.library_service, routes.catalog_routes, ...; third-party and
+standard-library code is grouped by top-level package), either for one
+snapshot or as the difference between two.
+
+While tracing, the peak traced memory of each request above its starting
+level is recorded per endpoint. tracemalloc's peak is process-wide and has to
+be reset at the start of each measured request, so only one request is
+measured at a time (others overlapping it are counted as skipped), and the
+process-wide peak is carried across those resets separately.
+"""
+
+import itertools
+import os
+import sys
+import threading
+import tracemalloc
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from flask import Flask, g, request
+
+# Snapshots kept at once; the oldest is dropped first
+MAX_SNAPSHOTS = 10
+
+# Stack frames recorded per allocation when tracing starts (more frames cost more memory)
+DEFAULT_TRACE_FRAMES = 10
+
+# Endpoint name used for requests that matched no route
+UNMATCHED_ENDPOINT = '<unmatched>'
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+class ModuleResolver:
+    """Maps source file names to the module names allocations are grouped by."""
+
+    def __init__(self):
+        self._packages = {}
+        for name, module in list(sys.modules.items()):
+            filename = getattr(module, '__file__', None)
+            if filename:
+                self._packages[os.path.abspath(filename)] = name.split('.')[0]
+        self._cache = {}
+
+    def __call__(self, filename: str) -> str:
+        module = self._cache.get(filename)
+        if module is None:
+            module = self._cache[filename] = self._resolve(filename)
+        return module
+
+    def _resolve(self, filename: str) -> str:
+        if filename.startswith('<'):
+            return filename  # e.g. <frozen importlib._bootstrap>
+        path = os.path.abspath(filename)
+        if self.is_project(filename):
+            relative = os.path.splitext(os.path.relpath(path, PROJECT_ROOT))[0]
+            return relative.replace(os.sep, '.').removesuffix('.__init__')
+        return self._packages.get(path, '<other>')
+
+    def is_project(self, filename: str) -> bool:
+        if filename.startswith('<'):
+            return False
+        path = os.path.abspath(filename)
+        return path.startswith(PROJECT_ROOT + os.sep) and 'site-packages' not in path
+
+
+def group_by_module(snapshot: tracemalloc.Snapshot, resolver: ModuleResolver) -> Dict[str, Tuple[int, int]]:
+    """
+    Total (bytes, blocks) of a snapshot per module. Each allocation counts
+    towards the innermost frame in this project's code if its traceback has
+    one (so memory allocated inside sqlite3 or Jinja on behalf of database.py
+    is charged to database), otherwise towards its innermost frame.
+    """
+    groups = defaultdict(lambda: [0, 0])
+    for trace in snapshot.traces:
+        frames = trace.traceback
+        owner = frames[-1].filename
+        for frame in reversed(frames):
+            if resolver.is_project(frame.filename):
+                owner = frame.filename
+                break
+        group = groups[resolver(owner)]
+        group[0] += trace.size
+        group[1] += 1
+    return {module: (size, count) for module, (size, count) in groups.items()}
+
+
+class MemoryDiagnostics:
+    """
+    On-demand tracemalloc control, snapshots and per-endpoint request peaks.
+
+    Install with init_app(app); nothing is traced until start() is called.
+    """
+
+    def __init__(self, max_snapshots: int = MAX_SNAPSHOTS):
+        self.max_snapshots = max_snapshots
+        self._snapshots = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+        self._peak = 0  # process-wide peak before the last reset_peak()
+        self.skipped = 0
+        self._requests = defaultdict(lambda: {'requests': 0, 'max_peak_bytes': 0, 'total_peak_bytes': 0})
+
+    def init_app(self, app: Flask) -> 'MemoryDiagnostics':
+        app.before_request(self._start_request)
+        app.teardown_request(self._finish_request)
+        app.extensions['memory_diagnostics'] = self
+        return self
+
+    def start(self, frames: int = DEFAULT_TRACE_FRAMES) -> None:
+        """Start tracing allocations (restarting if already tracing with a different frame limit)."""
+        if tracemalloc.is_tracing() and tracemalloc.get_traceback_limit() != frames:
+            tracemalloc.stop()
+        if not tracemalloc.is_tracing():
+            with self._lock:
+                self._peak = 0
+            tracemalloc.start(frames)
+
+    def stop(self) -> None:
+        """Stop tracing; snapshots already taken are kept."""
+        tracemalloc.stop()
+
+    def status(self) -> Dict:
+        """Tracing state, traced memory, snapshots and per-endpoint request peaks."""
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        with self._lock:
+            peak = max(peak, self._peak) if tracing else 0
+            snapshots = [
+                {'id': snapshot_id, 'label': label, 'taken_at': taken_at, 'traced_bytes': traced}
+                for snapshot_id, (label, taken_at, traced, _) in self._snapshots.items()
+            ]
+            requests = {
+                endpoint: {
+                    'requests': stats['requests'],
+                    'max_peak_bytes': stats['max_peak_bytes'],
+                    'mean_peak_bytes': stats['total_peak_bytes'] // stats['requests']
+                }
+                for endpoint, stats in sorted(self._requests.items())
+            }
+        return {
+            'tracing': tracing,
+            'frames': tracemalloc.get_traceback_limit() if tracing else 0,
+            'traced_bytes': current,
+            'peak_traced_bytes': peak,
+            'tracemalloc_overhead_bytes': tracemalloc.get_tracemalloc_memory() if tracing else 0,
+            'snapshots': snapshots,
+            'requests': requests,
+            'skipped_requests': self.skipped
+        }
+
+    def take_snapshot(self, label: str = '') -> Dict:
+        """
+        Snapshot traced memory, grouped by module right away.
+
+        Raises:
+            RuntimeError: If tracemalloc is not tracing
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("Memory tracing is not running; start it first.")
+        snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        modules = group_by_module(snapshot, ModuleResolver())
+        traced = sum(size for size, _ in modules.values())
+        with self._lock:
+            snapshot_id = next(self._ids)
+            self._snapshots[snapshot_id] = (label, datetime.now().isoformat(), traced, modules)
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        return {'id': snapshot_id, 'label': label, 'traced_bytes': traced}
+
+    def _modules(self, snapshot_id: int) -> Dict[str, Tuple[int, int]]:
+        with self._lock:
+            if snapshot_id not in self._snapshots:
+                raise KeyError(snapshot_id)
+            return self._snapshots[snapshot_id][3]
+
+    def snapshot_modules(self, snapshot_id: int, n: int = 20) -> List[Dict]:
+        """
+        The n modules holding the most traced memory in a snapshot.
+
+        Raises:
+            KeyError: If there is no such snapshot
+        """
+        modules = self._modules(snapshot_id)
+        ranked = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:n]
+        return [{'module': module, 'bytes': size, 'blocks': count} for module, (size, count) in ranked]
+
+    def diff(self, from_id: int, to_id: int, n: int = 20) -> List[Dict]:
+        """
+        The n modules whose traced memory changed most between two snapshots.
+
+        Raises:
+            KeyError: If either snapshot does not exist
+        """
+        before, after = self._modules(from_id), self._modules(to_id)
+        changes = []
+        for module in before.keys() | after.keys():
+            size_before, count_before = before.get(module, (0, 0))
+            size_after, count_after = after.get(module, (0, 0))
+            if size_after != size_before or count_after != count_before:
+                changes.append({
+                    'module': module,
+                    'bytes': size_after,
+                    'bytes_diff': size_after - size_before,
+                    'blocks': count_after,
+                    'blocks_diff': count_after - count_before
+                })
+        changes.sort(key=lambda change: abs(change['bytes_diff']), reverse=True)
+        return changes[:n]
+
+    def reset_requests(self) -> None:
+        """Forget the recorded request peaks."""
+        with self._lock:
+            self._requests.clear()
+            self.skipped = 0
+
+    def _start_request(self) -> None:
+        if not tracemalloc.is_tracing():
+            return
+        if not self._active.acquire(blocking=False):
+            with self._lock:
+                self.skipped += 1
+            return
+        with self._lock:
+            current, peak = tracemalloc.get_traced_memory()
+            self._peak = max(self._peak, peak)
+            tracemalloc.reset_peak()
+        g.memory_at_start = current
+
+    def _finish_request(self, exc: Optional[BaseException]) -> None:
+        start = g.pop('memory_at_start', None)
+        if start is None:
+            return
+        tracing = tracemalloc.is_tracing()
+        _, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        self._active.release()
+        if not tracing:
+            return
+        used = max(0, peak - start)
+        with self._lock:
+            stats = self._requests[request.endpoint or UNMATCHED_ENDPOINT]
+            stats['requests'] += 1
+            stats['total_peak_bytes'] += used
+            stats['max_peak_bytes'] = max(stats['max_peak_bytes'], used)
@@ -0,0 +1,208 @@
+"""
+Recommendations Module - "Patrons also borrowed" co-borrow index
+For every book, the books most often borrowed by the same patrons are kept in
+the book_related table (top RELATED_TOP_K per book), so a lookup reads K rows.
+
+The index is built offline from every patron's borrowing history and then
+refreshed incrementally: only loans recorded since the last build or refresh
+are read, and only the books they touch are re-ranked.
+
+Run as a job with: python -m services.recommendations [--rebuild]
+"""
+
+import argparse
+import heapq
+import json
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+import database
+from database import (
+    get_book_by_id, get_last_loan_id, get_loans_after, get_meta_value, get_patron_baskets,
+    get_related_books, get_related_scores, iter_loan_baskets, loan_database_count,
+    run_write, set_meta_value, store_related_books
+)
+
+# Related books kept per book
+RELATED_TOP_K = 20
+
+# Most recent distinct books of a patron that take part in co-borrow counts;
+# bounds the quadratic pair count of very heavy borrowers
+MAX_BASKET_BOOKS = 50
+
+# Books whose co-borrow counts are held in memory at once during a full build
+ANCHORS_PER_PASS = 25000
+
+# Serializes builds and refreshes in this process (both read-modify-write the index)
+_index_lock = threading.Lock()
+
+
+def _watermark_key(index: int) -> str:
+    return f'related_index_last_loan_{index}'
+
+
+def _rank(scores: Dict[int, int], top_k: int, exclude: int) -> List[Tuple[int, int]]:
+    """Top (related_book_id, score) pairs other than exclude (ties keep first-seen order)."""
+    ranked = heapq.nlargest(top_k + 1, scores.items(), key=itemgetter(1))
+    return [(book_id, score) for book_id, score in ranked if book_id != exclude][:top_k]
+
+
+def build_related_index(top_k: int = RELATED_TOP_K, max_basket: int = MAX_BASKET_BOOKS,
+                        anchors_per_pass: int = ANCHORS_PER_PASS) -> Dict:
+    """
+    Rebuild the whole co-borrow index from every loan database.
+
+    Patron baskets are packed into one flat integer array, then counted in
+    passes over ranges of anchor book IDs so that memory is bounded by
+    anchors_per_pass books' neighbour counts rather than by all book pairs.
+
+    Returns:
+        dict: Patrons, basket entries, books indexed, passes and elapsed seconds
+    """
+    with _index_lock:
+        started = time.perf_counter()
+        watermarks = {index: get_last_loan_id(index) for index in range(loan_database_count())}
+
+        books = array('i')
+        ends = array('l')
+        patrons = 0
+        for index, last_loan_id in watermarks.items():
+            for _, basket in iter_loan_baskets(index, max_basket, last_loan_id):
+                patrons += 1
+                if len(basket) > 1:
+                    books.extend(basket)
+                    ends.append(len(books))
+
+        related = {}
+        max_book_id = max(books) if books else 0
+        passes = 0
+        for low in range(0, max_book_id + 1, anchors_per_pass):
+            high = low + anchors_per_pass
+            neighbours = defaultdict(Counter)
+            start = 0
+            for end in ends:
+                basket = books[start:end]
+                start = end
+                for anchor in basket:
+                    if low <= anchor < high:
+                        neighbours[anchor].update(basket)
+            for anchor, counts in neighbours.items():
+                related[anchor] = _rank(counts, top_k, exclude=anchor)
+            passes += 1
+
+        def store(conn):
+            store_related_books(conn, related, replace_all=True)
+            for index, last_loan_id in watermarks.items():
+                set_meta_value(conn, _watermark_key(index), last_loan_id)
+        run_write(store)
+
+        return {
+            'patrons': patrons,
+            'basket_entries': len(books),
+            'books_indexed': len(related),
+            'passes': passes,
+            'seconds': round(time.perf_counter() - started, 3)
+        }
+
+
+def refresh_related_index(top_k: int = RELATED_TOP_K, max_basket: int = MAX_BASKET_BOOKS) -> Dict:
+    """
+    Fold loans recorded since the last build or refresh into the index.
+
+    For each patron with new loans, every newly borrowed book is paired with
+    the patron's earlier books and with each other, and the affected books'
+    stored rankings are re-ranked with those increments. Counts of pairs that
+    had dropped out of a book's top K are not kept, so a periodic full build
+    is still worthwhile.
+
+    Returns:
+        dict: New loans read, books re-ranked and elapsed seconds
+    """
+    with _index_lock:
+        started = time.perf_counter()
+        deltas = defaultdict(Counter)
+        watermarks = {}
+        new_loans = 0
+
+        for index in range(loan_database_count()):
+            last_loan_id = get_meta_value(_watermark_key(index))
+            loans = get_loans_after(index, last_loan_id)
+            if not loans:
+                continue
+            new_loans += len(loans)
+            watermarks[index] = loans[-1][0]
+
+            new_books = defaultdict(dict)
+            for _, patron_id, book_id in loans:
+                new_books[patron_id][book_id] = None
+            earlier = get_patron_baskets(index, list(new_books), last_loan_id, max_basket)
+
+            for patron_id, borrowed in new_books.items():
+                previous = earlier.get(patron_id, [])
+                added = [book_id for book_id in borrowed if book_id not in previous]
+                for position, book_id in enumerate(added):
+                    for other in previous + added[position + 1:]:
+                        deltas[book_id][other] += 1
+                        deltas[other][book_id] += 1
+
+        related = {}
+        if deltas:
+            stored = get_related_scores(list(deltas))
+            for book_id, increments in deltas.items():
+                scores = stored[book_id]
+                for other, count in increments.items():
+                    scores[other] = scores.get(other, 0) + count
+                related[book_id] = _rank(scores, top_k, exclude=book_id)
+
+        if watermarks:
+            def store(conn):
+                store_related_books(conn, related)
+                for index, last_loan_id in watermarks.items():
+                    set_meta_value(conn, _watermark_key(index), last_loan_id)
+            run_write(store)
+
+        return {
+            'new_loans': new_loans,
+            'books_reranked': len(related),
+            'seconds': round(time.perf_counter() - started, 3)
+        }
+
+
+def get_related(book_id: int, limit: int = 10) -> Optional[List[Dict]]:
+    """
+    Get the books most often borrowed by patrons who borrowed a book.
+
+    Args:
+        book_id: ID of the book
+        limit: Number of related books to return (1..RELATED_TOP_K)
+
+    Returns:
+        list: Related books, best first, or None if the book does not exist
+
+    Raises:
+        ValueError: If limit is out of range
+    """
+    if limit < 1 or limit > RELATED_TOP_K:
+        raise ValueError(f"limit must be between 1 and {RELATED_TOP_K}.")
+    if not get_book_by_id(book_id):
+        return None
+    return get_related_books(book_id, limit)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', default=database.DATABASE, help='Library database file')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the whole index instead of refreshing it')
+    args = parser.parse_args()
+
+    database.DATABASE = args.database
+    database.init_database()
+    result = build_related_index() if args.rebuild else refresh_related_index()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
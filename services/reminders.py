@@ -0,0 +1,289 @@
+"""
+Reminders Module - Overdue scanner and due-soon reminder scheduler
+The scheduler keeps a min-heap of upcoming reminders keyed by the time they
+fire: a due-soon reminder DUE_SOON_DAYS before a loan's due date and an
+overdue reminder at the due date. The heap is filled by range queries on the
+open-loan due-date index covering the next horizon, so a tick pops only the
+reminders that are due instead of walking every patron's loans.
+
+Fired reminders are batched per patron into one message per kind and written
+to the reminder_outbox table; a delivery worker (deliver_reminders) sends them
+from there. Each loan is reminded at most once per kind.
+
+Run one scan as a job with: python -m services.reminders [--deliver]
+"""
+
+import argparse
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+import database
+from database import (
+    count_pending_reminders, get_books_by_ids, get_open_loan_ids, get_open_loans_due_between,
+    get_pending_reminders, loan_database_count, mark_reminder_delivered, queue_reminder,
+    record_reminder_attempt, run_write
+)
+
+# Days before the due date that a due-soon reminder fires
+DUE_SOON_DAYS = 2
+
+# How far ahead of now each refill of the heap reads loans
+SCAN_HORIZON = timedelta(hours=1)
+
+# How often loans already behind the horizon are scanned for again, to pick
+# up loans recorded with an already-near due date since they were last read
+RESCAN_INTERVAL = timedelta(hours=24)
+
+# Seconds between ticks of the scheduler thread
+TICK_SECONDS = 60.0
+
+# Delivery attempts before an outbox message is given up on
+MAX_DELIVERY_ATTEMPTS = 5
+
+DUE_SOON = 'due_soon'
+OVERDUE = 'overdue'
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderScheduler:
+    """
+    Fires due-soon and overdue reminders from a heap of upcoming reminders.
+
+    tick() can be called directly (as the job and the tests do) or from the
+    scheduler thread started with start().
+    """
+
+    def __init__(self, due_soon_days: int = DUE_SOON_DAYS, horizon: timedelta = SCAN_HORIZON,
+                 rescan_interval: timedelta = RESCAN_INTERVAL, tick_seconds: float = TICK_SECONDS):
+        """
+        Args:
+            due_soon_days: Days before the due date that a due-soon reminder fires
+            horizon: How far ahead of now each refill of the heap reads loans
+            rescan_interval: How often the whole backlog is read again
+            tick_seconds: Seconds between ticks of the scheduler thread
+        """
+        self.due_soon_lead = timedelta(days=due_soon_days)
+        self.horizon = horizon
+        self.rescan_interval = rescan_interval
+        self.tick_seconds = tick_seconds
+        self._heap = []
+        self._queued = set()
+        self._sequence = itertools.count()
+        self._loaded_until = None
+        self._last_rescan = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.ticks = 0
+        self.scans = 0
+        self.loans_scanned = 0
+        self.reminders_queued = 0
+        self.loans_reminded = 0
+        self.last_scan_seconds = 0.0
+        self.max_scan_seconds = 0.0
+        self.total_scan_seconds = 0.0
+        self.failures = 0
+        self.last_error = None
+
+    def start(self) -> 'ReminderScheduler':
+        """Start the scheduler thread (it runs in the caller's context, e.g. its app)."""
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                context = contextvars.copy_context()
+                self._thread = threading.Thread(target=context.run, args=(self._run,),
+                                                name='reminder-scheduler', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the scheduler thread after its current tick."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def stats(self) -> Dict:
+        """Return scan counters, the heap depth and the outbox depth."""
+        return {
+            'ticks': self.ticks,
+            'scans': self.scans,
+            'loans_scanned': self.loans_scanned,
+            'reminders_queued': self.reminders_queued,
+            'loans_reminded': self.loans_reminded,
+            'last_scan_seconds': round(self.last_scan_seconds, 6),
+            'max_scan_seconds': round(self.max_scan_seconds, 6),
+            'total_scan_seconds': round(self.total_scan_seconds, 6),
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'queue_depth': len(self._heap),
+            'outbox_depth': count_pending_reminders()
+        }
+
+    def tick(self, now: Optional[datetime] = None) -> Dict:
+        """
+        Read loans entering the horizon, then queue every reminder that is due.
+
+        Returns:
+            dict: Loans read, reminders fired and outbox messages queued by this tick
+        """
+        now = now or datetime.now()
+        with self._lock:
+            self.ticks += 1
+            scanned = self._refill(now)
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                self._queued.discard(entry[2:4] + (entry[4]['loan_id'],))
+                due.append(entry)
+            try:
+                messages, loans = self._fire(due, now) if due else (0, 0)
+            except Exception:
+                # Put the popped reminders back so the next tick fires them
+                for entry in due:
+                    self._queued.add(entry[2:4] + (entry[4]['loan_id'],))
+                    heapq.heappush(self._heap, entry)
+                raise
+            self.reminders_queued += messages
+            self.loans_reminded += loans
+        return {'loans_scanned': scanned, 'fired': len(due), 'messages_queued': messages}
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                # Database errors, group-commit timeouts or a dead writer; the
+                # reminders the tick popped are back on the heap for the next one
+                logger.exception('Reminder tick failed')
+                self.failures += 1
+                self.last_error = str(e)
+            self._stop.wait(self.tick_seconds)
+
+    def _refill(self, now: datetime) -> int:
+        """Push the reminders of loans due in the next horizon onto the heap."""
+        if self._last_rescan is None or now - self._last_rescan >= self.rescan_interval:
+            self._loaded_until = None
+            self._last_rescan = now
+        until = now + self.horizon
+        if self._loaded_until is not None and until <= self._loaded_until:
+            return 0
+
+        started = time.perf_counter()
+        scanned = 0
+        for index in range(loan_database_count()):
+            for kind, lead in ((OVERDUE, timedelta(0)), (DUE_SOON, self.due_soon_lead)):
+                start = self._loaded_until + lead if self._loaded_until else None
+                for loan in get_open_loans_due_between(index, start, until + lead):
+                    scanned += 1
+                    key = (kind, index, loan['loan_id'])
+                    if key not in self._queued:
+                        self._queued.add(key)
+                        heapq.heappush(self._heap, (loan['due_date'] - lead, next(self._sequence), kind, index, loan))
+        self._loaded_until = until
+
+        elapsed = time.perf_counter() - started
+        self.scans += 1
+        self.loans_scanned += scanned
+        self.last_scan_seconds = elapsed
+        self.max_scan_seconds = max(self.max_scan_seconds, elapsed)
+        self.total_scan_seconds += elapsed
+        return scanned
+
+    def _fire(self, due: List, now: datetime):
+        """Batch fired reminders per patron and kind and write them to the outbox."""
+        by_database = defaultdict(list)
+        for _, _, _, index, loan in due:
+            by_database[index].append(loan['loan_id'])
+        still_open = {index: get_open_loan_ids(index, loan_ids) for index, loan_ids in by_database.items()}
+
+        batches = defaultdict(dict)
+        for _, _, kind, index, loan in due:
+            if loan['loan_id'] not in still_open[index]:
+                continue
+            # A loan already past due by the time it is first seen only gets the overdue reminder
+            if kind == DUE_SOON and loan['due_date'] <= now:
+                continue
+            batches[(loan['patron_id'], kind)][(index, loan['loan_id'])] = loan
+        if not batches:
+            return 0, 0
+
+        titles = get_books_by_ids({loan['book_id'] for batch in batches.values() for loan in batch.values()})
+
+        def queue(conn):
+            messages = loans = 0
+            for (patron_id, kind), batch in batches.items():
+                def payload(fresh, patron_id=patron_id, kind=kind, batch=batch):
+                    return json.dumps({
+                        'patron_id': patron_id,
+                        'kind': kind,
+                        'loans': [
+                            {
+                                'book_id': batch[key]['book_id'],
+                                'title': titles.get(batch[key]['book_id'], {}).get('title'),
+                                'due_date': batch[key]['due_date'].isoformat()
+                            }
+                            for key in fresh
+                        ]
+                    })
+                reminded = queue_reminder(conn, patron_id, kind, list(batch), payload, now)
+                if reminded:
+                    messages += 1
+                    loans += reminded
+            return messages, loans
+        return run_write(queue)
+
+
+def deliver_reminders(send: Callable[[Dict], None], batch_size: int = 100,
+                      max_attempts: int = MAX_DELIVERY_ATTEMPTS) -> Dict:
+    """
+    Send a batch of pending outbox messages.
+
+    send(message) is called with each message (its payload decoded); a message
+    is marked delivered when send returns, and counted as a failed attempt if
+    it raises, to be retried on a later run until max_attempts is reached.
+
+    Returns:
+        dict: Numbers of messages delivered and failed
+    """
+    delivered = failed = 0
+    for message in get_pending_reminders(batch_size, max_attempts):
+        message['payload'] = json.loads(message['payload'])
+        try:
+            send(message)
+        except Exception:
+            failed += 1
+            run_write(lambda conn: record_reminder_attempt(conn, message['id']))
+        else:
+            delivered += 1
+            run_write(lambda conn: mark_reminder_delivered(conn, message['id'], datetime.now()))
+    return {'delivered': delivered, 'failed': failed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', default=database.DATABASE, help='Library database file')
+    parser.add_argument('--due-soon-days', type=int, default=DUE_SOON_DAYS)
+    parser.add_argument('--deliver', action='store_true', help='Print pending outbox messages and mark them delivered')
+    args = parser.parse_args()
+
+    database.DATABASE = args.database
+    database.init_database()
+    scheduler = ReminderScheduler(due_soon_days=args.due_soon_days)
+    result = {'tick': scheduler.tick(), 'stats': scheduler.stats()}
+    if args.deliver:
+        result['delivery'] = deliver_reminders(lambda message: print(json.dumps(message)))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
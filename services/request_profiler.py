@@ -0,0 +1,246 @@
+"""
+Request Profiler Module - Sampled cProfile profiling of Flask requests
+Profiles a random sample of requests, plus every request carrying the
+profiling header, with cProfile from before_request to teardown_request, so
+the time spent in routes, library_service, database and template rendering
+all shows up. Profiles are aggregated per endpoint and can be read back as a
+top-N of the hottest functions or as collapsed stacks for flame graphs.
+
+Only one request is profiled at a time (profiling is meant to be cheap to
+leave on); sampled requests that arrive while another is being profiled
+simply run unprofiled. Before Python 3.12 cProfile hooks only the thread that
+enabled it. From 3.12 it is built on sys.monitoring, whose events fire in
+every thread, so a profile also takes in whatever other requests run while it
+is open (PROCESS_WIDE, reported by the admin summary): read such profiles
+from a quiet instance, or one header-selected request at a time.
+"""
+
+import cProfile
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+from flask import Flask, g, request
+
+# Endpoint name used for requests that matched no route
+UNMATCHED_ENDPOINT = '<unmatched>'
+
+# Stack paths carrying less than this many seconds are left out of collapsed output
+MIN_STACK_SECONDS = 1e-6
+
+# Deepest call path followed when collapsing stacks
+MAX_STACK_DEPTH = 128
+
+# Call paths walked per collapse; time below paths not walked is kept under TRUNCATED_FRAME
+MAX_STACK_PATHS = 20000
+TRUNCATED_FRAME = '<truncated>'
+
+# Whether a profile records every thread (cProfile on sys.monitoring) rather than its own
+PROCESS_WIDE = sys.version_info >= (3, 12)
+
+
+def _function_label(function) -> str:
+    """Readable flame-graph frame name for a pstats (file, line, name) key."""
+    filename, line, name = function
+    if filename == '~':
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def collapse_stacks(stats: Dict, min_seconds: float = MIN_STACK_SECONDS,
+                    max_depth: int = MAX_STACK_DEPTH, max_paths: int = MAX_STACK_PATHS) -> Dict[str, float]:
+    """
+    Turn pstats data into collapsed stacks ("root;caller;callee" -> seconds).
+
+    cProfile records caller/callee edges rather than whole stacks, so each
+    function's own time is spread over the paths reaching it in proportion
+    to the cumulative time of each incoming edge. Highly connected call
+    graphs have exponentially many such paths, so at most max_paths are
+    walked, none deeper than max_depth; the time below a path cut short is
+    charged to a TRUNCATED_FRAME under it.
+    """
+    callees = defaultdict(dict)
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees[caller][function] = edge
+    stacks = defaultdict(float)
+    budget = [max_paths]
+
+    def walk(path: List, on_path: set, function, share: float) -> None:
+        budget[0] -= 1
+        _, _, own_time, cumulative, _ = stats[function]
+        path.append(_function_label(function))
+        on_path.add(function)
+        if own_time * share >= min_seconds:
+            stacks[';'.join(path)] += own_time * share
+        cut_short = 0.0
+        for callee, edge in callees[function].items():
+            callee_cumulative = stats[callee][3]
+            if callee in on_path or not callee_cumulative:
+                continue
+            callee_share = share * edge[3] / callee_cumulative
+            if callee_cumulative * callee_share < min_seconds:
+                continue
+            if len(path) < max_depth and budget[0] > 0:
+                walk(path, on_path, callee, callee_share)
+            else:
+                cut_short += callee_cumulative * callee_share
+        if cut_short >= min_seconds:
+            stacks[';'.join(path + [TRUNCATED_FRAME])] += cut_short
+        path.pop()
+        on_path.discard(function)
+
+    for function, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            walk([], set(), function, 1.0)
+    return dict(stacks)
+
+
+class RequestProfiler:
+    """
+    Per-endpoint cProfile aggregates for a Flask app.
+
+    Install with init_app(app); profiled requests are chosen by sample_rate
+    or by a truthy value in the header request header.
+    """
+
+    def __init__(self, sample_rate: float = 0.01, header: str = 'X-Profile', output_dir: Optional[str] = None):
+        """
+        Args:
+            sample_rate: Fraction of requests profiled (0 profiles only requests with the header)
+            header: Request header that asks for a request to be profiled
+            output_dir: Directory collapsed-stack files are written to by write_collapsed()
+        """
+        self.sample_rate = sample_rate
+        self.header = header
+        self.output_dir = output_dir
+        self._active = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._requests = defaultdict(int)
+        self._seconds = defaultdict(float)
+        self.skipped = 0
+
+    def init_app(self, app: Flask) -> 'RequestProfiler':
+        app.before_request(self._start)
+        app.teardown_request(self._finish)
+        app.extensions['request_profiler'] = self
+        return self
+
+    def should_profile(self) -> bool:
+        """Whether the current request was asked for or sampled."""
+        if request.headers.get(self.header, '').lower() in ('1', 'true', 'yes'):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _start(self) -> None:
+        if not self.should_profile():
+            return
+        if not self._active.acquire(blocking=False):
+            self.skipped += 1
+            return
+        g.request_profile = (cProfile.Profile(), time.perf_counter())
+        g.request_profile[0].enable()
+
+    def _finish(self, exc: Optional[BaseException]) -> None:
+        started = g.pop('request_profile', None)
+        if started is None:
+            return
+        profile, began = started
+        profile.disable()
+        self._active.release()
+        self.record(request.endpoint or UNMATCHED_ENDPOINT, profile, time.perf_counter() - began)
+
+    def record(self, endpoint: str, profile: cProfile.Profile, seconds: float) -> None:
+        """Add one request's profile to its endpoint's aggregate."""
+        with self._lock:
+            if endpoint in self._stats:
+                self._stats[endpoint].add(profile)
+            else:
+                self._stats[endpoint] = pstats.Stats(profile)
+            self._requests[endpoint] += 1
+            self._seconds[endpoint] += seconds
+
+    def reset(self) -> None:
+        """Drop every collected profile."""
+        with self._lock:
+            self._stats.clear()
+            self._requests.clear()
+            self._seconds.clear()
+            self.skipped = 0
+
+    def endpoints(self) -> Dict[str, Dict]:
+        """Profiled requests and their total wall time, per endpoint."""
+        with self._lock:
+            return {
+                endpoint: {'requests': count, 'total_seconds': round(self._seconds[endpoint], 6)}
+                for endpoint, count in sorted(self._requests.items())
+            }
+
+    def _merged(self, endpoint: Optional[str]) -> Dict:
+        """Raw pstats data of one endpoint, or of all endpoints merged."""
+        with self._lock:
+            if endpoint is not None:
+                stats = self._stats.get(endpoint)
+                return dict(stats.stats) if stats else {}
+            merged = pstats.Stats()
+            for stats in self._stats.values():
+                merged.add(stats)
+            return dict(merged.stats)
+
+    def top_functions(self, n: int = 20, sort: str = 'tottime', endpoint: Optional[str] = None) -> List[Dict]:
+        """
+        The n hottest functions by own time ('tottime') or including callees ('cumtime').
+
+        Raises:
+            ValueError: If sort is not 'tottime' or 'cumtime'
+        """
+        if sort not in ('tottime', 'cumtime'):
+            raise ValueError("sort must be 'tottime' or 'cumtime'.")
+        column = 2 if sort == 'tottime' else 3
+        stats = self._merged(endpoint)
+        ranked = sorted(stats.items(), key=lambda item: item[1][column], reverse=True)[:n]
+        return [
+            {
+                'function': _function_label(function),
+                'calls': calls,
+                'primitive_calls': primitive_calls,
+                'tottime_seconds': round(own_time, 6),
+                'cumtime_seconds': round(cumulative, 6),
+                'cumtime_per_call_ms': round(cumulative / calls * 1000, 4) if calls else 0.0
+            }
+            for function, (primitive_calls, calls, own_time, cumulative, _) in ranked
+        ]
+
+    def collapsed(self, endpoint: Optional[str] = None) -> str:
+        """Collapsed stacks ("frame;frame;frame microseconds" per line) for flame-graph tools."""
+        stacks = collapse_stacks(self._merged(endpoint))
+        return ''.join(
+            f"{stack} {round(seconds * 1_000_000)}\n"
+            for stack, seconds in sorted(stacks.items())
+            if round(seconds * 1_000_000) > 0
+        )
+
+    def write_collapsed(self, directory: Optional[str] = None) -> List[str]:
+        """
+        Write one <endpoint>.collapsed file per profiled endpoint.
+
+        Returns:
+            list: Paths of the files written
+        """
+        directory = directory or self.output_dir
+        if not directory:
+            raise ValueError("No output directory configured for collapsed stacks.")
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for endpoint in self.endpoints():
+            path = os.path.join(directory, re.sub(r'[^\w.-]', '_', endpoint) + '.collapsed')
+            with open(path, 'w') as f:
+                f.write(self.collapsed(endpoint))
+            paths.append(path)
+        return paths
@@ -0,0 +1,103 @@
+"""
+Response Cache Module - Rendered page cache
+Keeps rendered catalog/search pages in a size-bounded LRU so repeated requests
+for unchanged data skip the database query and Jinja rendering.
+"""
+
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+
+class CachedResponse:
+    """A rendered response body with an optional gzip-precompressed variant."""
+
+    __slots__ = ('body', 'gzip_body', 'mimetype', 'status')
+
+    def __init__(self, body: bytes, mimetype: str, status: int = 200, gzip_body: Optional[bytes] = None):
+        self.body = body
+        self.gzip_body = gzip_body
+        self.mimetype = mimetype
+        self.status = status
+
+    @property
+    def size(self) -> int:
+        """Number of bytes held by this entry (both variants)."""
+        return len(self.body) + (len(self.gzip_body) if self.gzip_body else 0)
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache of rendered responses.
+
+    Keys are built by the caller and should include everything the body depends
+    on (route, query args and the catalog data version). Entries are evicted in
+    least-recently-used order once either max_entries or max_bytes is exceeded.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 16 * 1024 * 1024,
+                 gzip_enabled: bool = True, gzip_min_size: int = 1024):
+        """
+        Args:
+            max_entries: Maximum number of cached responses
+            max_bytes: Maximum total size of cached bodies (including gzip variants)
+            gzip_enabled: Whether to store a gzip-precompressed variant of each body
+            gzip_min_size: Bodies smaller than this are not worth compressing
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.gzip_enabled = gzip_enabled
+        self.gzip_min_size = gzip_min_size
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        """Return the cached response for key (marking it recently used), or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, body: bytes, mimetype: str, status: int = 200) -> CachedResponse:
+        """Store a rendered body under key and evict old entries as needed."""
+        gzip_body = None
+        if self.gzip_enabled and len(body) >= self.gzip_min_size:
+            gzip_body = gzip.compress(body, compresslevel=6)
+        entry = CachedResponse(body, mimetype, status, gzip_body)
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            if entry.size > self.max_bytes:
+                return entry
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+        return entry
+
+    def clear(self) -> None:
+        """Drop every cached response."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,384 @@
+"""
+Suggest Module - Typeahead completions for titles and authors
+Normalized titles and authors (accents stripped, case-folded, whitespace
+collapsed) are kept in memory as sorted (key, value) arrays, so the entries
+starting with a prefix are one contiguous run found with two binary searches.
+The run is ranked by borrows in a rolling circulation window and the top K
+are returned, merged from per-block best lists so that short prefixes
+matching much of the catalog cost no more than long ones (see PrefixIndex).
+
+The index is built from the catalog on first use. Books added through this
+process are inserted into it in place; changes made elsewhere (another
+worker, an import, an edit or delete) move the catalog search version, which
+is checked at most every refresh_seconds and triggers a rebuild. Borrow
+counts are reloaded every rank_refresh_seconds. Rebuilds and reloads run on
+a background thread while lookups keep using the current index, which is
+swapped for the new one when it is ready.
+"""
+
+import bisect
+import contextvars
+import heapq
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from flask import current_app, has_app_context
+from database import (
+    CIRCULATION_WINDOWS, get_author_borrow_totals, get_book_borrow_totals, get_book_by_isbn,
+    get_catalog_search_rows, get_meta_value
+)
+
+# Completions returned when no limit is given, and the most a caller may ask for
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# Longest prefix accepted (titles are at most 200 characters)
+MAX_PREFIX_LENGTH = 200
+
+# Entries per block, and blocks per group, whose best entries are precomputed
+BLOCK_SIZE = 256
+GROUP_BLOCKS = 16
+
+# Entries added since the precomputed lists were built before they are rebuilt
+MAX_ADDED = 1024
+
+SUGGEST_TYPES = ('title', 'author')
+
+# Sorts after every character that appears in a normalized key
+_KEY_END = '\U0010ffff'
+
+
+def normalize(text: str) -> str:
+    """Lowercase text, strip accents and collapse whitespace, for prefix matching."""
+    if not text.isascii():
+        text = ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+    return ' '.join(text.casefold().split())
+
+
+class PrefixIndex:
+    """
+    Sorted (key, value) entries with prefix lookups ranked by a score per
+    value (values are unique). Not thread-safe; SuggestIndex serializes access.
+
+    The entries are cut into blocks of BLOCK_SIZE, and blocks into groups of
+    GROUP_BLOCKS, each with its best MAX_LIMIT entries precomputed. A lookup
+    scans at most the two partly covered blocks at the ends of the prefix's
+    run and merges the precomputed lists of the blocks and groups in between,
+    so its cost does not grow with the length of the run. Entries added after
+    the lists were computed are kept in a small sorted list of their own
+    until the next set_scores (or until there are MAX_ADDED of them).
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, object]] = (), scores: Optional[Dict] = None,
+                 presorted: bool = False):
+        self._entries = list(entries) if presorted else sorted(entries)
+        self._keys = {value: key for key, value in self._entries}
+        self._added = []
+        self.set_scores(scores or {})
+
+    def __len__(self) -> int:
+        return len(self._entries) + len(self._added)
+
+    def __contains__(self, value) -> bool:
+        return value in self._keys
+
+    def sorted_entries(self) -> Iterator[Tuple[str, object]]:
+        """
+        The entries in key order as they are now. The result stays valid, and
+        cheap to take, while later add() calls change the index.
+        """
+        # _entries is only ever replaced, never changed in place
+        return heapq.merge(self._entries, tuple(self._added))
+
+    def add(self, key: str, value) -> None:
+        """Insert one entry (with no score)."""
+        bisect.insort(self._added, (key, value))
+        self._keys[value] = key
+        if len(self._added) > MAX_ADDED:
+            self._summarize()
+
+    def set_scores(self, scores: Dict) -> None:
+        """Replace the scores of the values; values not given score 0."""
+        self._scores = {value: score for value, score in scores.items() if score > 0 and value in self._keys}
+        self._summarize()
+
+    def score(self, value) -> int:
+        return self._scores.get(value, 0)
+
+    def _rank(self, entry: Tuple[str, object]) -> Tuple:
+        return -self._scores.get(entry[1], 0), entry[0], entry[1]
+
+    def _summarize(self) -> None:
+        """Fold added entries in and recompute the best entries of every block and group."""
+        if self._added:
+            self._entries = list(heapq.merge(self._entries, self._added))
+            self._added = []
+        self._block_tops = [self._top(self._entries[start:start + BLOCK_SIZE])
+                            for start in range(0, len(self._entries), BLOCK_SIZE)]
+        self._group_tops = [
+            list(islice(heapq.merge(*self._block_tops[block:block + GROUP_BLOCKS]), MAX_LIMIT))
+            for block in range(0, len(self._block_tops), GROUP_BLOCKS)
+        ]
+
+    def _top(self, block: List[Tuple[str, object]]) -> List[Tuple]:
+        """The best MAX_LIMIT rankings of a block: its scored entries, then the rest in key order."""
+        scores = self._scores
+        top = sorted((-scores[value], key, value) for key, value in block if value in scores)[:MAX_LIMIT]
+        if len(top) < MAX_LIMIT:
+            unscored = ((0, key, value) for key, value in block if value not in scores)
+            top.extend(islice(unscored, MAX_LIMIT - len(top)))
+        return top
+
+    @staticmethod
+    def _span(entries: List[Tuple[str, object]], prefix: str) -> Tuple[int, int]:
+        """The [start, end) positions of the entries whose key starts with prefix."""
+        start = bisect.bisect_left(entries, (prefix,))
+        end = bisect.bisect_left(entries, (prefix + _KEY_END,), start)
+        return start, end
+
+    def complete(self, prefix: str, limit: int) -> List:
+        """
+        Up to limit (at most MAX_LIMIT) values whose key starts with prefix,
+        highest score first (ties by key, then value).
+        """
+        start, end = self._span(self._entries, prefix)
+        added_start, added_end = self._span(self._added, prefix)
+        ranked = [sorted(map(self._rank, self._added[added_start:added_end]))]
+
+        group_size = BLOCK_SIZE * GROUP_BLOCKS
+        position = start
+        while position < end:
+            block = position // BLOCK_SIZE
+            if position % group_size == 0 and end - position >= group_size:
+                ranked.append(self._group_tops[block // GROUP_BLOCKS])
+                position += group_size
+            elif position % BLOCK_SIZE == 0 and end - position >= BLOCK_SIZE:
+                ranked.append(self._block_tops[block])
+                position += BLOCK_SIZE
+            else:
+                stop = min(end, (block + 1) * BLOCK_SIZE)
+                ranked.append(sorted(map(self._rank, self._entries[position:stop])))
+                position = stop
+        return [value for _, _, value in islice(heapq.merge(*ranked), limit)]
+
+
+class SuggestIndex:
+    """
+    Title and author prefix indexes of the current app's catalog, ranked by
+    circulation. Safe to share between threads.
+    """
+
+    def __init__(self, rank_window: str = 'year', refresh_seconds: float = 5, rank_refresh_seconds: float = 300):
+        if rank_window not in CIRCULATION_WINDOWS:
+            raise ValueError(f"Unknown window: {rank_window}. Use one of: {', '.join(CIRCULATION_WINDOWS)}.")
+        self.rank_window = rank_window
+        self.refresh_seconds = refresh_seconds
+        self.rank_refresh_seconds = rank_refresh_seconds
+        self.version = None
+        self._books = {}
+        self._author_books = Counter()
+        self._titles = None
+        self._authors = None
+        self._checked_at = None
+        self._ranked_at = None
+        # Guards the indexes; held only for lookups, inserts and swaps
+        self._lock = threading.Lock()
+        # Serializes refreshes; held while new indexes are built
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        # Books added by this process while a refresh is building new indexes
+        self._added_during_refresh = None
+        self.rebuilds = 0
+        self.reloads = 0
+        self.inserts = 0
+        self.lookups = 0
+        self.failures = 0
+        self.last_error = None
+
+    def refresh(self, reload_borrows: bool = True) -> None:
+        """
+        Rebuild the indexes if the catalog search version moved (or they were
+        never built), else reload the borrow counts if reload_borrows. Lookups
+        keep using the current indexes until the new ones are swapped in.
+        """
+        with self._refresh_lock:
+            with self._lock:
+                built, version = self._titles is not None, self.version
+                if built:
+                    title_entries, author_entries = self._titles.sorted_entries(), self._authors.sorted_entries()
+                self._added_during_refresh = []
+            try:
+                started = time.monotonic()
+                if not built or get_meta_value('catalog_search_version') != version:
+                    self._install(started, *self._build())
+                elif reload_borrows:
+                    titles = PrefixIndex(title_entries, get_book_borrow_totals(self.rank_window), presorted=True)
+                    authors = PrefixIndex(author_entries, get_author_borrow_totals(self.rank_window), presorted=True)
+                    self._install(started, None, None, None, titles, authors)
+                else:
+                    with self._lock:
+                        self._checked_at = started
+            finally:
+                with self._lock:
+                    self._added_during_refresh = None
+
+    def _build(self) -> Tuple:
+        """Read the catalog and borrow counts into new indexes (no locks held)."""
+        version, rows = get_catalog_search_rows()
+        books = {row['id']: (row['title'], row['author']) for row in rows}
+        author_books = Counter(row['author'] for row in rows)
+        titles = PrefixIndex(((normalize(row['title']), row['id']) for row in rows),
+                             get_book_borrow_totals(self.rank_window))
+        authors = PrefixIndex(((normalize(author), author) for author in author_books),
+                              get_author_borrow_totals(self.rank_window))
+        return version, books, author_books, titles, authors
+
+    def _install(self, started: float, version: Optional[int], books: Optional[Dict], author_books: Optional[Counter],
+                 titles: PrefixIndex, authors: PrefixIndex) -> None:
+        """
+        Swap in new indexes (with books, author_books and version when the
+        catalog was re-read), replaying books added while they were built.
+        """
+        with self._lock:
+            rebuilt = books is not None
+            if not rebuilt:
+                version, books, author_books = self.version, self._books, self._author_books
+            for book in self._added_during_refresh:
+                if book['id'] not in books:
+                    # Added after the catalog was read; counts as one version step
+                    books[book['id']] = (book['title'], book['author'])
+                    author_books[book['author']] += 1
+                    version += 1
+                self._index_book(book, titles, authors)
+            self.version, self._books, self._author_books = version, books, author_books
+            self._titles, self._authors = titles, authors
+            self._checked_at = self._ranked_at = started
+            if rebuilt:
+                self.rebuilds += 1
+            else:
+                self.reloads += 1
+
+    @staticmethod
+    def _index_book(book: Dict, titles: PrefixIndex, authors: PrefixIndex) -> None:
+        if book['id'] not in titles:
+            titles.add(normalize(book['title']), book['id'])
+        if book['author'] not in authors:
+            authors.add(normalize(book['author']), book['author'])
+
+    def _schedule_refresh(self) -> None:
+        """
+        Build the indexes on first use; afterwards start a background refresh
+        when refresh_seconds have passed since the last one.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._titles is not None:
+                if self._refreshing or now - self._checked_at < self.refresh_seconds:
+                    return
+                self._refreshing = True
+                reload_borrows = now - self._ranked_at >= self.rank_refresh_seconds
+        if self._titles is None:
+            # Nothing to serve yet; concurrent first lookups wait for this build
+            self.refresh(reload_borrows=False)
+            return
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(self._background_refresh, reload_borrows),
+                         name='suggest-refresh', daemon=True).start()
+
+    def _background_refresh(self, reload_borrows: bool) -> None:
+        try:
+            self.refresh(reload_borrows)
+        except sqlite3.Error as e:
+            # Keep serving the current indexes; the next interval tries again
+            self.failures += 1
+            self.last_error = str(e)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def add_book(self, book: Dict) -> None:
+        """Insert a book just added to the catalog by this process."""
+        with self._lock:
+            if self._titles is None:
+                return
+            self._books[book['id']] = (book['title'], book['author'])
+            self._author_books[book['author']] += 1
+            self._index_book(book, self._titles, self._authors)
+            if self._added_during_refresh is not None:
+                self._added_during_refresh.append(book)
+            # The insert moved the catalog search version by one
+            self.version += 1
+            self.inserts += 1
+
+    def suggest(self, prefix: str, suggest_type: str = 'title', limit: int = DEFAULT_LIMIT) -> List[Dict]:
+        """
+        Complete a title or author prefix, most borrowed first.
+
+        Returns:
+            list: {'book_id', 'title', 'author', 'borrows'} per title, or
+            {'author', 'borrows'} per author
+
+        Raises:
+            ValueError: If the type or limit is not allowed
+        """
+        if suggest_type not in SUGGEST_TYPES:
+            raise ValueError(f"type must be one of: {', '.join(SUGGEST_TYPES)}.")
+        if limit < 1 or limit > MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}.")
+        key = normalize(prefix[:MAX_PREFIX_LENGTH])
+        if not key:
+            return []
+
+        self._schedule_refresh()
+        with self._lock:
+            self.lookups += 1
+            if suggest_type == 'author':
+                authors = self._authors.complete(key, limit)
+                return [{'author': author, 'borrows': self._authors.score(author)} for author in authors]
+
+            book_ids = self._titles.complete(key, limit)
+            return [
+                {
+                    'book_id': book_id,
+                    'title': self._books[book_id][0],
+                    'author': self._books[book_id][1],
+                    'borrows': self._titles.score(book_id)
+                }
+                for book_id in book_ids
+            ]
+
+    def stats(self) -> Dict:
+        """Index sizes, catalog search version and counters."""
+        with self._lock:
+            return {
+                'version': self.version,
+                'titles': len(self._titles) if self._titles is not None else 0,
+                'authors': len(self._authors) if self._authors is not None else 0,
+                'rank_window': self.rank_window,
+                'rebuilds': self.rebuilds,
+                'reloads': self.reloads,
+                'inserts': self.inserts,
+                'lookups': self.lookups,
+                'refreshing': self._refreshing,
+                'failures': self.failures,
+                'last_error': self.last_error
+            }
+
+
+def get_suggest_index() -> Optional[SuggestIndex]:
+    """The current app's suggest index, or None outside an app."""
+    return current_app.extensions.get('suggest_index') if has_app_context() else None
+
+
+def notify_book_added(isbn: str) -> None:
+    """Insert a newly added book into the current app's suggest index, if there is one."""
+    index = get_suggest_index()
+    if index is None:
+        return
+    book = get_book_by_isbn(isbn)
+    if book is not None:
+        index.add_book(book)
@@ -0,0 +1,110 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import tempfile
+from datetime import datetime, timedelta
+import pytest
+from database import init_database, insert_book, insert_borrow_record, get_book_by_isbn, get_db_connection
+from services.library_service import borrow_book_by_patron, return_book_by_patron
+from services.analytics import get_top_books, get_top_authors, advance_windows, rebuild_aggregates
+from app import create_app
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp()
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    yield
+    os.close(db_fd)
+    os.unlink(temp_db)
+
+def _add_books():
+    insert_book("Popular", "Author A", "1111111111111", 5, 5)
+    insert_book("Steady", "Author B", "2222222222222", 5, 5)
+    insert_book("Sequel", "Author A", "3333333333333", 5, 5)
+    return [get_book_by_isbn(isbn)['id'] for isbn in ("1111111111111", "2222222222222", "3333333333333")]
+
+def test_borrows_are_ranked_per_book_and_author():
+    popular, steady, sequel = _add_books()
+    for patron_id in ("100001", "100002", "100003"):
+        borrow_book_by_patron(patron_id, popular)
+    borrow_book_by_patron("100001", steady)
+    borrow_book_by_patron("100002", steady)
+    borrow_book_by_patron("100001", sequel)
+
+    books = get_top_books('week', 2)
+    authors = get_top_authors('week', 5)
+
+    assert [(book['book_id'], book['borrows']) for book in books] == [(popular, 3), (steady, 2)]
+    assert books[0]['title'] == "Popular" and books[0]['rank'] == 1
+    assert [(author['author'], author['borrows']) for author in authors] == [("Author A", 4), ("Author B", 2)]
+
+def test_returns_do_not_change_borrow_rankings():
+    popular, _, _ = _add_books()
+    borrow_book_by_patron("100001", popular)
+    return_book_by_patron("100001", popular)
+
+    assert get_top_books('day', 1)[0]['borrows'] == 1
+
+def test_backdated_borrows_only_count_in_windows_covering_them():
+    popular, _, _ = _add_books()
+    borrowed = datetime.now() - timedelta(days=20)
+    insert_borrow_record("100001", popular, borrowed, borrowed + timedelta(days=14))
+
+    assert get_top_books('week', 10) == []
+    assert get_top_books('month', 10)[0]['borrows'] == 1
+    assert get_top_authors('month', 10)[0]['author'] == "Author A"
+
+def test_days_expire_out_of_rolling_windows():
+    popular, steady, _ = _add_books()
+    borrow_book_by_patron("100001", popular)
+    borrowed = datetime.now() - timedelta(days=3)
+    insert_borrow_record("100002", steady, borrowed, borrowed + timedelta(days=14))
+    assert len(get_top_books('week', 10)) == 2
+
+    advance_windows(datetime.now() + timedelta(days=5))
+
+    week = get_top_books('week', 10)
+    assert [book['book_id'] for book in week] == [popular]
+    assert get_top_books('day', 10) == []
+    assert len(get_top_books('month', 10)) == 2
+
+def test_rebuild_recomputes_aggregates_from_loans():
+    popular, steady, _ = _add_books()
+    now = datetime.now()
+    conn = get_db_connection()
+    conn.executemany('''
+        INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+        VALUES (?, ?, ?, ?)
+    ''', [("100001", popular, now.isoformat(), now.isoformat()),
+          ("100002", popular, now.isoformat(), now.isoformat()),
+          ("100003", steady, now.isoformat(), now.isoformat())])
+    conn.commit()
+    conn.close()
+    assert get_top_books('week', 10) == []
+
+    rebuild_aggregates()
+
+    assert [(book['book_id'], book['borrows']) for book in get_top_books('week', 10)] == [(popular, 2), (steady, 1)]
+    assert get_top_authors('year', 1)[0]['author'] == "Author A"
+
+def test_rejects_unknown_window_and_bad_n():
+    with pytest.raises(ValueError):
+        get_top_books('decade', 10)
+    with pytest.raises(ValueError):
+        get_top_authors('week', 0)
+
+def test_analytics_endpoints():
+    client = create_app({'RESPONSE_CACHE_ENABLED': False}).test_client()
+    borrow_book_by_patron("100001", 1)
+
+    response = client.get('/api/analytics/top_books?window=month&n=5')
+    assert response.status_code == 200
+    assert response.get_json()['results'][0]['book_id'] == 1
+
+    response = client.get('/api/analytics/top_authors')
+    assert response.status_code == 200
+    assert response.get_json()['window'] == 'week'
+
+    assert client.get('/api/analytics/top_books?window=decade').status_code == 400
+    assert client.get('/api/analytics/top_books?n=abc').status_code == 400
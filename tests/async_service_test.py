@@ -0,0 +1,120 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import json
+import tempfile
+import time
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock
+from app import create_app
+from routes.async_routes import AsyncApi
+from database import get_book_by_isbn, init_database, insert_book, insert_borrow_record
+from services.async_library_service import pay_late_fees_async, search_books_in_catalog_async
+from services.async_payment_service import AsyncPaymentGateway
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp()
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    yield
+    os.close(db_fd)
+    os.unlink(temp_db)
+
+def test_search_runs_on_db_executor():
+    insert_book("Async Book", "Author", "1234567890001", 1, 1)
+    results = asyncio.run(search_books_in_catalog_async("async", "title"))
+    assert [book["title"] for book in results] == ["Async Book"]
+
+def test_pay_late_fees_async_success():
+    insert_book("Late Book", "Author", "1234567890001", 1, 0)
+    borrow_date = datetime.now() - timedelta(days=20)
+    insert_borrow_record("123456", 1, borrow_date, borrow_date + timedelta(days=14))
+
+    gateway = AsyncMock(spec=AsyncPaymentGateway)
+    gateway.process_payment.return_value = (True, "txn_123", "Success")
+
+    success, message, txn = asyncio.run(pay_late_fees_async("123456", 1, gateway))
+
+    assert success is True
+    assert txn == "txn_123"
+    gateway.process_payment.assert_awaited_once_with(
+        patron_id="123456", amount=3.00, description="Late fees for 'Late Book'"
+    )
+
+def test_pay_late_fees_async_no_fee():
+    gateway = AsyncMock(spec=AsyncPaymentGateway)
+    success, message, txn = asyncio.run(pay_late_fees_async("123456", 1, gateway))
+    assert success is False
+    assert message == "No late fees to pay for this book."
+    gateway.process_payment.assert_not_awaited()
+
+def test_gateways_overlap_on_one_event_loop():
+    gateway = AsyncPaymentGateway(latency=0.2)
+
+    async def pay_many():
+        return await asyncio.gather(*(gateway.process_payment(f"{100000 + i}", 5.0) for i in range(20)))
+
+    start = time.perf_counter()
+    results = asyncio.run(pay_many())
+    assert all(success for success, _, _ in results)
+    assert time.perf_counter() - start < 1.0
+
+def test_async_routes():
+    pytest.importorskip("asgiref")
+    client = create_app().test_client()
+    response = client.get('/api/async/search?q=gatsby')
+    assert response.get_json()['count'] == 1
+    response = client.get('/api/async/late_fee/123456/3')
+    assert response.get_json()['status'] == 'Book is not overdue'
+    response = client.post('/api/async/pay_late_fee/123456/3')
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'No late fees to pay for this book.'
+
+def _asgi(asgi_app, method, path, query=b''):
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query, 'headers': []}
+    return asgi_app(scope, receive, send), messages
+
+def test_native_asgi_api_serves_payments_concurrently_on_the_event_loop():
+    app = create_app()
+    insert_book("Late Book", "Author", "1234567890001", 20, 20)
+    book_id = get_book_by_isbn("1234567890001")['id']
+    borrow_date = datetime.now() - timedelta(days=20)
+    patron_ids = [f"{300000 + i}" for i in range(20)]
+    for patron_id in patron_ids:
+        insert_borrow_record(patron_id, book_id, borrow_date, borrow_date + timedelta(days=14))
+    forwarded = []
+
+    async def fallback(scope, receive, send):
+        forwarded.append(scope['path'])
+
+    api = AsyncApi(app, fallback, gateway=AsyncPaymentGateway(latency=0.2))
+    calls = [_asgi(api, 'POST', f'/api/async/pay_late_fee/{patron_id}/{book_id}') for patron_id in patron_ids]
+
+    async def pay_all():
+        await asyncio.gather(*(call for call, _ in calls))
+
+    start = time.perf_counter()
+    asyncio.run(pay_all())
+    assert time.perf_counter() - start < 1.0
+    assert all(messages[0]['status'] == 200 for _, messages in calls)
+
+    call, messages = _asgi(api, 'GET', '/api/async/search', b'q=gatsby')
+    asyncio.run(call)
+    assert json.loads(messages[1]['body'])['count'] == 1
+    call, messages = _asgi(api, 'GET', '/api/async/pay_late_fee/123456/4')
+    asyncio.run(call)
+    assert messages[0]['status'] == 405
+    call, _ = _asgi(api, 'GET', '/catalog')
+    asyncio.run(call)
+    assert forwarded == ['/catalog']
@@ -0,0 +1,134 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import json
+import sqlite3
+import tempfile
+import time
+import pytest
+from database import init_database, add_sample_data
+import services.availability_bus
+from services.availability_bus import AvailabilityBus
+from services.library_service import borrow_book_by_patron, return_book_by_patron
+from app import create_app
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp()
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    add_sample_data()
+    yield
+    os.close(db_fd)
+    os.unlink(temp_db)
+
+@pytest.fixture
+def app():
+    app = create_app({'RESPONSE_CACHE_ENABLED': False, 'AVAILABILITY_STREAM_ENABLED': True,
+                      'AVAILABILITY_HEARTBEAT_SECONDS': 0.05, 'AVAILABILITY_STREAM_MAX_SECONDS': 0.5})
+    yield app
+    app.extensions['availability_bus'].stop()
+
+def _events(text):
+    """Parse a text/event-stream body into (id, event, data) tuples, skipping comments and retry."""
+    events = []
+    for block in text.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith((':', 'retry')))
+        if 'event' in fields:
+            events.append((fields['id'], fields['event'], json.loads(fields['data'])))
+    return events
+
+def _wait_for_events(bus, count):
+    deadline = time.monotonic() + 2
+    while bus.stats()['events_published'] < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def test_borrow_and_return_publish_availability_deltas(app):
+    bus = app.extensions['availability_bus']
+    with app.app_context():
+        assert borrow_book_by_patron("111111", 1)[0]
+        _wait_for_events(bus, 1)
+        assert return_book_by_patron("111111", 1)[0]
+        _wait_for_events(bus, 2)
+
+    response = app.test_client().get('/api/availability/stream', headers={'Last-Event-ID': f'{bus.epoch}-0'})
+    assert response.mimetype == 'text/event-stream'
+    events = _events(response.get_data(as_text=True))
+    assert [(event, data) for _, event, data in events] == [
+        ('availability', {'book_id': 1, 'available_copies': 2}),
+        ('availability', {'book_id': 1, 'available_copies': 3}),
+    ]
+    assert [event_id for event_id, _, _ in events] == [f'{bus.epoch}-1', f'{bus.epoch}-2']
+
+def test_resume_replays_only_events_after_last_event_id(app):
+    bus = app.extensions['availability_bus']
+    with app.app_context():
+        borrow_book_by_patron("111111", 1)
+        _wait_for_events(bus, 1)
+        borrow_book_by_patron("111111", 2)
+        _wait_for_events(bus, 2)
+
+    response = app.test_client().get(f'/api/availability/stream?last_event_id={bus.epoch}-1')
+    events = _events(response.get_data(as_text=True))
+    assert [(event_id, data['book_id']) for event_id, _, data in events] == [(f'{bus.epoch}-2', 2)]
+
+def test_unknown_or_expired_event_ids_get_a_reset(app):
+    client = app.test_client()
+    events = _events(client.get('/api/availability/stream', headers={'Last-Event-ID': 'oldepoch-7'}).get_data(as_text=True))
+    assert [event for _, event, _ in events] == ['reset']
+
+    with app.app_context():
+        bus = AvailabilityBus(replay_size=2)
+        for copies in (3, 2, 1):
+            with bus._published:
+                bus._sequence += 1
+                bus._events.append((bus._sequence, 1, copies))
+        stream = bus.stream(f'{bus.epoch}-0', heartbeat=0.01, max_seconds=0.05)
+        next(stream)  # retry
+        assert 'event: reset' in next(stream)
+
+def test_unchanged_availability_is_not_republished(app):
+    with app.app_context():
+        bus = AvailabilityBus()
+        assert bus.publish([1, 2]) == 2
+        assert bus.publish([1, 2]) == 0
+        assert bus.publish([999]) == 0
+
+def test_live_subscriber_gets_events_published_after_it_connects(app):
+    bus = app.extensions['availability_bus']
+    stream = bus.stream(heartbeat=0.05, max_seconds=2)
+    assert next(stream).startswith('retry:')
+    with app.app_context():
+        borrow_book_by_patron("111111", 2)
+    chunk = next(stream)
+    while chunk.startswith(':'):
+        chunk = next(stream)
+    assert _events(chunk) == [(f'{bus.epoch}-1', 'availability', {'book_id': 2, 'available_copies': 1})]
+    assert bus.stats()['subscribers'] == 1
+    stream.close()
+    assert bus.stats()['subscribers'] == 0
+
+def test_stream_is_off_by_default():
+    client = create_app({'RESPONSE_CACHE_ENABLED': False}).test_client()
+    assert client.get('/api/availability/stream').status_code == 404
+    assert client.get('/api/availability/stats').get_json() == {'enabled': False}
+
+def test_failed_reads_are_retried_not_dropped(app, monkeypatch):
+    bus = app.extensions['availability_bus']
+    read = services.availability_bus.get_books_by_ids
+    calls = []
+
+    def flaky_read(book_ids):
+        calls.append(1)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return read(book_ids)
+
+    monkeypatch.setattr(services.availability_bus, 'get_books_by_ids', flaky_read)
+    monkeypatch.setattr(services.availability_bus, 'READ_RETRY_SECONDS', 0.01)
+    with app.app_context():
+        assert borrow_book_by_patron("111111", 1)[0]
+        _wait_for_events(bus, 1)
+    stats = bus.stats()
+    assert stats['events_published'] == 1
+    assert stats['failures'] == 1 and stats['last_error'] == "database is locked"
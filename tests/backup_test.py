@@ -0,0 +1,180 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import sqlite3
+import tempfile
+import threading
+import time
+import pytest
+import database
+from database import init_database, add_sample_data, get_book_by_id, insert_book, shard_path
+import services.backup
+from services.backup import copy_database, create_snapshot, list_snapshots, restore_snapshot, verify_snapshot
+from services.library_service import borrow_book_by_patron, return_book_by_patron
+from app import create_app
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp(suffix='.db')
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    add_sample_data()
+    yield temp_db
+    os.close(db_fd)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(temp_db + suffix):
+            os.unlink(temp_db + suffix)
+
+def test_throttled_copy_steps_through_pages(setup_db, tmp_path):
+    for n in range(200):
+        insert_book(f"Book {n} " + "x" * 150, "Author", f"{n:013d}", 1, 1)
+
+    stats = copy_database(setup_db, str(tmp_path / 'copy.db'), pages=4, step_sleep=0)
+
+    assert stats['steps'] > 1 and stats['pages'] > 4 and not stats['unthrottled']
+    conn = sqlite3.connect(str(tmp_path / 'copy.db'))
+    assert conn.execute('SELECT COUNT(*) FROM books').fetchone()[0] == 203
+    conn.close()
+
+def test_copy_finishes_while_writes_keep_restarting_it(setup_db, tmp_path):
+    for n in range(200):
+        insert_book(f"Book {n} " + "x" * 150, "Author", f"{n:013d}", 1, 1)
+    stop = threading.Event()
+
+    def writer():
+        n = 1000
+        while not stop.is_set():
+            insert_book(f"Book {n}", "Author", f"{n:013d}", 1, 1)
+            n += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        stats = copy_database(setup_db, str(tmp_path / 'copy.db'), pages=1, step_sleep=0.005, max_restarts=2)
+    finally:
+        stop.set()
+        thread.join()
+    assert stats['restarts'] <= 3
+    assert sqlite3.connect(str(tmp_path / 'copy.db')).execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+
+def test_snapshots_are_verified_rotated_and_restorable(tmp_path):
+    names = [create_snapshot(str(tmp_path), keep=2, step_sleep=0)['name'] for _ in range(3)]
+
+    snapshots = list_snapshots(str(tmp_path))
+    assert [snapshot['name'] for snapshot in snapshots] == names[1:]
+    assert all(snapshot['verified'] for snapshot in snapshots)
+    assert verify_snapshot(str(tmp_path / names[-1]))['ok']
+
+    borrow_book_by_patron("111111", 1)
+    assert get_book_by_id(1)['available_copies'] == 2
+    restore_snapshot(str(tmp_path / names[-1]))
+    assert get_book_by_id(1)['available_copies'] == 3
+
+def test_failed_snapshot_does_not_rotate_out_the_last_good_one(monkeypatch, tmp_path):
+    good = create_snapshot(str(tmp_path), keep=1, step_sleep=0)['name']
+    check_integrity = services.backup.check_integrity
+    monkeypatch.setattr("services.backup.check_integrity", lambda path: "page 2 is never used")
+
+    failed = create_snapshot(str(tmp_path), keep=1, step_sleep=0)
+
+    assert not failed['verified'] and failed['rotated_out'] == []
+    assert [snapshot['name'] for snapshot in list_snapshots(str(tmp_path))] == [good, failed['name']]
+
+    monkeypatch.setattr("services.backup.check_integrity", check_integrity)
+    newest = create_snapshot(str(tmp_path), keep=1, step_sleep=0)
+    assert newest['rotated_out'] == [good, failed['name']]
+
+def test_corrupt_snapshot_is_not_restored(tmp_path):
+    name = create_snapshot(str(tmp_path), step_sleep=0)['name']
+    path = tmp_path / name / 'library.db'
+    data = bytearray(path.read_bytes())
+    data[100:4096] = b'\xff' * (4096 - 100)
+    path.write_bytes(bytes(data))
+
+    assert not verify_snapshot(str(tmp_path / name))['ok']
+    with pytest.raises(ValueError):
+        restore_snapshot(str(tmp_path / name))
+
+def test_sharded_snapshot_includes_every_shard(monkeypatch, tmp_path):
+    monkeypatch.setattr("database.SHARD_COUNT", 2)
+    init_database()
+    try:
+        manifest = create_snapshot(str(tmp_path), step_sleep=0)
+        assert [entry['name'] for entry in manifest['files']] == ['library.db', 'shard0.db', 'shard1.db']
+        monkeypatch.setattr("database.SHARD_COUNT", 0)
+        with pytest.raises(ValueError):
+            restore_snapshot(str(tmp_path / manifest['name']))
+    finally:
+        monkeypatch.setattr("database.SHARD_COUNT", 2)
+        for index in range(2):
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(shard_path(index) + suffix):
+                    os.unlink(shard_path(index) + suffix)
+
+def test_sharded_snapshot_is_consistent_across_files_under_writes(monkeypatch, tmp_path):
+    monkeypatch.setattr("database.SHARD_COUNT", 2)
+    init_database()
+    insert_book("Busy", "Author", "9999999999999", 3, 3)
+    book_id = database.get_book_by_isbn("9999999999999")['id']
+    stop = threading.Event()
+
+    def circulate(patron_id):
+        while not stop.is_set():
+            if borrow_book_by_patron(patron_id, book_id)[0]:
+                return_book_by_patron(patron_id, book_id)
+
+    threads = [threading.Thread(target=circulate, args=(f"{100000 + n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        manifest = create_snapshot(str(tmp_path), pages=1, step_sleep=0.001)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        monkeypatch.setattr("database.SHARD_COUNT", 2)
+
+    try:
+        snapshot = tmp_path / manifest['name']
+        catalog = sqlite3.connect(str(snapshot / 'library.db'))
+        available = catalog.execute('SELECT available_copies FROM books WHERE id = ?', (book_id,)).fetchone()[0]
+        out = 0
+        for index in range(2):
+            shard = sqlite3.connect(str(snapshot / f'shard{index}.db'))
+            out += shard.execute('SELECT COUNT(*) FROM borrow_records WHERE book_id = ? AND return_date IS NULL',
+                                 (book_id,)).fetchone()[0]
+            out += shard.execute('SELECT COUNT(*) FROM pending_copy_releases WHERE book_id = ?',
+                                 (book_id,)).fetchone()[0]
+            shard.close()
+        catalog.close()
+        assert available + out == 3
+    finally:
+        for index in range(2):
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(shard_path(index) + suffix):
+                    os.unlink(shard_path(index) + suffix)
+
+def test_admin_backup_endpoints_report_rate_and_latency(tmp_path):
+    app = create_app({'RESPONSE_CACHE_ENABLED': False, 'BACKUP_ENABLED': True,
+                      'BACKUP_DIR': str(tmp_path), 'BACKUP_STEP_SLEEP_MS': 0})
+    client = app.test_client()
+    scheduler = app.extensions['backup_scheduler']
+    try:
+        client.get('/catalog')
+        assert client.post('/api/admin/backups').status_code == 202
+        deadline = time.monotonic() + 5
+        while scheduler.backups == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        status = client.get('/api/admin/backups').get_json()
+        assert status['backups'] == 1 and status['last_backup']['verified']
+        assert status['last_backup']['bytes_per_second'] > 0
+        assert status['requests_outside_backup'] >= 1
+        assert 'p95_ms_added' in status
+        assert len(status['snapshots']) == 1
+    finally:
+        scheduler.stop()
+
+def test_backup_endpoints_are_off_by_default():
+    client = create_app({'RESPONSE_CACHE_ENABLED': False}).test_client()
+    assert client.get('/api/admin/backups').status_code == 404
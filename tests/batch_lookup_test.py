@@ -0,0 +1,67 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import tempfile
+import pytest
+from datetime import datetime, timedelta
+from app import create_app
+from database import init_database, insert_book, insert_borrow_record
+from services.library_service import calculate_late_fees_batch, get_availability_batch
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp()
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    yield
+    os.close(db_fd)
+    os.unlink(temp_db)
+
+def test_late_fees_batch_in_request_order():
+    insert_book("Late Book", "Author", "1234567890999", 2, 2)
+    insert_book("On Time Book", "Author", "1234567890998", 1, 1)
+    borrow_date = datetime.now() - timedelta(days=20)
+    insert_borrow_record("123456", 1, borrow_date, borrow_date + timedelta(days=14))
+    insert_borrow_record("123456", 2, datetime.now(), datetime.now() + timedelta(days=14))
+
+    results = calculate_late_fees_batch([("123456", 2), ("123456", 1), ("12", 1), ("654321", 1)])
+
+    assert [r['book_id'] for r in results] == [2, 1, 1, 1]
+    assert results[0]['status'] == 'Book is not overdue'
+    assert results[1]['days_overdue'] == 6
+    assert results[1]['fee_amount'] == 3.00
+    assert results[2]['status'] == 'Invalid patron ID'
+    assert results[3]['status'] == 'Book not currently borrowed by this patron'
+
+def test_late_fees_batch_spans_multiple_chunks(monkeypatch):
+    monkeypatch.setattr("database.SQL_IN_CHUNK_SIZE", 4)
+    insert_book("Late Book", "Author", "1234567890999", 10, 10)
+    borrow_date = datetime.now() - timedelta(days=20)
+    patrons = [f"10000{i}" for i in range(5)]
+    for patron_id in patrons:
+        insert_borrow_record(patron_id, 1, borrow_date, borrow_date + timedelta(days=14))
+
+    results = calculate_late_fees_batch([(patron_id, 1) for patron_id in patrons])
+    assert all(r['days_overdue'] == 6 for r in results)
+
+def test_availability_batch_reports_missing_books():
+    insert_book("Available", "Author", "1234567890999", 2, 1)
+    results = get_availability_batch([1, 99])
+    assert results[0]['available_copies'] == 1
+    assert results[0]['is_available'] is True
+    assert results[1] == {'book_id': 99, 'error': 'Book not found.'}
+
+def test_batch_endpoints_report_per_item_errors():
+    client = create_app().test_client()
+    response = client.post('/api/late_fee/batch', json={'items': [{'patron_id': '123456', 'book_id': 3}, {'book_id': 'x'}]})
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert results[0]['status'] == 'Book is not overdue'
+    assert 'error' in results[1]
+
+    response = client.post('/api/availability/batch', json={'book_ids': [3, 'x']})
+    results = response.get_json()['results']
+    assert results[0]['available_copies'] == 0
+    assert results[1]['error'] == 'Invalid book ID.'
+
+    assert client.post('/api/availability/batch', json={}).status_code == 400
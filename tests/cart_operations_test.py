@@ -0,0 +1,68 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import tempfile
+import pytest
+from datetime import datetime, timedelta
+from app import create_app
+from database import init_database, insert_book, insert_borrow_record, get_book_by_id, get_patron_borrow_count
+from services.library_service import borrow_books_by_patron, return_books_by_patron
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp()
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    yield
+    os.close(db_fd)
+    os.unlink(temp_db)
+
+def test_cart_checkout_reports_partial_failures():
+    insert_book("Book A", "Author", "1234567890001", 1, 1)
+    insert_book("Book B", "Author", "1234567890002", 1, 0)
+
+    success, message, items = borrow_books_by_patron("123456", [1, 2, 99])
+
+    assert success is False
+    assert message == "Borrowed 1 of 3 book(s)."
+    assert [item['success'] for item in items] == [True, False, False]
+    assert "not available" in items[1]['message']
+    assert items[2]['message'] == "Book not found."
+    assert get_book_by_id(1)['available_copies'] == 0
+    assert get_patron_borrow_count("123456") == 1
+
+def test_cart_checkout_enforces_limit_across_cart():
+    insert_book("Popular", "Author", "1234567890001", 10, 10)
+    insert_borrow_record("123456", 1, datetime.now(), datetime.now() + timedelta(days=14))
+
+    success, message, items = borrow_books_by_patron("123456", [1] * 6)
+
+    assert [item['success'] for item in items] == [True] * 4 + [False] * 2
+    assert "maximum borrowing limit" in items[5]['message']
+    assert get_patron_borrow_count("123456") == 5
+
+def test_cart_return_releases_copies():
+    insert_book("Book A", "Author", "1234567890001", 2, 2)
+    borrow_books_by_patron("123456", [1, 1])
+
+    success, message, items = return_books_by_patron("123456", [1, 1, 1])
+
+    assert [item['success'] for item in items] == [True, True, False]
+    assert get_book_by_id(1)['available_copies'] == 2
+
+def test_cart_invalid_patron_rejected():
+    success, message, items = borrow_books_by_patron("12", [1])
+    assert success is False
+    assert "invalid patron id" in message.lower()
+    assert items == []
+
+def test_cart_route():
+    client = create_app().test_client()
+    response = client.post('/api/cart/borrow', json={'patron_id': '654321', 'book_ids': [1, 'x']})
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['items'][0]['success'] is True
+    assert body['items'][1] == {'book_id': 'x', 'success': False, 'message': 'Invalid book ID.'}
+
+    response = client.post('/api/cart/return', json={'patron_id': '654321', 'book_ids': [1]})
+    assert response.get_json()['success'] is True
@@ -0,0 +1,48 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import gzip
+import json
+import tempfile
+import pytest
+from app import create_app
+from database import insert_book
+
+@pytest.fixture
+def client(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp()
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    app = create_app()
+    yield app.test_client()
+    os.close(db_fd)
+    os.unlink(temp_db)
+
+def test_ndjson_export_streams_all_books(client):
+    response = client.get('/api/catalog/export.ndjson')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    records = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [record['id'] for record in records] == [1, 2, 3]
+    assert records[0]['title'] == 'The Great Gatsby'
+
+def test_sparse_fields_and_since_cursor(client):
+    insert_book("Export Book", "Author", "1234567890555", 2, 2)
+    response = client.get('/api/catalog/export.ndjson?fields=title,isbn&since=3')
+    records = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert records == [{'title': 'Export Book', 'isbn': '1234567890555'}]
+
+def test_csv_export_with_gzip(client):
+    response = client.get('/api/catalog/export.csv?fields=id,title', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    lines = gzip.decompress(response.data).decode().splitlines()
+    assert lines[0] == 'id,title'
+    assert lines[1] == '1,The Great Gatsby'
+    assert len(lines) == 4
+
+def test_unknown_field_rejected(client):
+    response = client.get('/api/catalog/export.csv?fields=title,password')
+    assert response.status_code == 400
+
+def test_malformed_since_rejected(client):
+    response = client.get('/api/catalog/export.ndjson?since=abc')
+    assert response.status_code == 400
@@ -0,0 +1,89 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import tempfile
+import pytest
+from database import init_database, add_sample_data, get_db_connection, insert_book
+from services.catalog_snapshot import CatalogSnapshot, SnapshotReader, snapshot_path
+from services.library_service import borrow_book_by_patron, search_books_in_catalog
+from app import create_app
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp(suffix='.db')
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    add_sample_data()
+    yield temp_db
+    os.close(db_fd)
+    for path in (temp_db, temp_db + '-wal', temp_db + '-shm', snapshot_path(temp_db)):
+        if os.path.exists(path):
+            os.unlink(path)
+
+@pytest.fixture
+def snapshot(setup_db):
+    return CatalogSnapshot(snapshot_path(setup_db))
+
+def test_snapshot_search_matches_database_search(snapshot):
+    insert_book("Great Expectations", "Charles Dickens", "9780141439563", 2, 2)
+    insert_book("Émile ou de l'éducation", "Jean-Jacques Rousseau", "9782080705570", 1, 1)
+    for term, search_type in [('great', 'title'), ('GREAT', 'title'), ('ÉDUC', 'title'), ('lee', 'author'),
+                              ('e', 'author'), ('9780141439563', 'isbn'), ('978014143956', 'isbn'),
+                              ('missing', 'title')]:
+        assert snapshot.search(term, search_type) == search_books_in_catalog(term, search_type)
+
+def test_term_repeated_in_a_title_matches_once(snapshot):
+    insert_book("Tick Tock Tick", "Author", "1111111111111", 1, 1)
+    assert [book['title'] for book in snapshot.search('tick', 'title')] == ["Tick Tock Tick"]
+
+def test_rebuilt_on_catalog_changes_only(snapshot):
+    snapshot.search('great', 'title')
+    assert snapshot.rebuilds == 1
+
+    borrow_book_by_patron("111111", 1)
+    results = snapshot.search('great', 'title')
+    assert snapshot.rebuilds == 1
+    assert results[0]['available_copies'] == 2
+
+    insert_book("Great Expectations", "Charles Dickens", "9780141439563", 1, 1)
+    assert len(snapshot.search('great', 'title')) == 2
+    assert snapshot.rebuilds == 2
+
+    conn = get_db_connection()
+    conn.execute("DELETE FROM books WHERE isbn = '9780141439563'")
+    conn.commit()
+    conn.close()
+    assert len(snapshot.search('great', 'title')) == 1
+    assert snapshot.rebuilds == 3
+
+def test_other_workers_reload_a_rebuilt_file(snapshot):
+    snapshot.search('great', 'title')
+    other = CatalogSnapshot(snapshot.path)
+    other.search('great', 'title')
+    assert (other.rebuilds, other.reloads) == (0, 1)
+
+def test_foreign_or_corrupt_file_is_rebuilt(snapshot):
+    with open(snapshot.path, 'wb') as f:
+        f.write(b'not a snapshot')
+    assert len(snapshot.search('great', 'title')) == 1
+    assert snapshot.rebuilds == 1
+
+def test_prefix_lookup_uses_sorted_keys(snapshot):
+    insert_book("The Hobbit", "J.R.R. Tolkien", "9780547928227", 1, 1)
+    reader = snapshot.current()
+    assert isinstance(reader, SnapshotReader)
+    titles = [reader.book(number)['title'] for number in reader.find_prefix('title', 'the ', 10)]
+    assert titles == ["The Great Gatsby", "The Hobbit"]
+    assert reader.find_prefix('title', 'the', 1) == reader.find_prefix('title', 'the', 10)[:1]
+    assert reader.find_prefix('author', 'zz', 10) == []
+
+def test_app_search_backend(setup_db):
+    app = create_app({'RESPONSE_CACHE_ENABLED': False, 'SEARCH_BACKEND': 'snapshot'})
+    client = app.test_client()
+    assert client.get('/search?q=gatsby&type=title').status_code == 200
+    status = client.get('/api/admin/catalog_snapshot').get_json()
+    assert status['rebuilds'] == 1 and status['books'] == 3
+
+    assert create_app({'RESPONSE_CACHE_ENABLED': False}).test_client().get('/api/admin/catalog_snapshot').status_code == 404
+    with pytest.raises(ValueError):
+        create_app({'SEARCH_BACKEND': 'elastic'})
@@ -0,0 +1,110 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import tempfile
+from datetime import datetime, timedelta
+import pytest
+from database import init_database, add_sample_data, get_db_connection, insert_book, shard_for_patron, shard_path
+from services.library_service import borrow_book_by_patron, return_book_by_patron
+from services.loan_archive import archive_returned_loans
+from services.change_feed import get_change_page, compact_change_log
+from app import create_app
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp()
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    add_sample_data()
+    yield
+    os.close(db_fd)
+    os.unlink(temp_db)
+
+def _age_changes(days):
+    conn = get_db_connection()
+    changed_at = (datetime.now() - timedelta(days=days)).isoformat(timespec='milliseconds')
+    conn.execute('UPDATE change_log SET changed_at = ?', (changed_at,))
+    conn.commit()
+    conn.close()
+
+def test_borrow_and_return_are_logged_in_order():
+    start = get_change_page()['latest_seq']
+    borrow_book_by_patron("111111", 1)
+    return_book_by_patron("111111", 1)
+
+    page = get_change_page(since=start)
+    assert [(change['table'], change['op']) for change in page['changes']] == [
+        ('books', 'update'), ('borrow_records', 'insert'),
+        ('borrow_records', 'update'), ('books', 'update'),
+    ]
+    assert page['changes'][0]['row']['available_copies'] == 2
+    assert page['changes'][2]['row']['return_date'] is not None
+    assert page['next_since'] == page['latest_seq'] and not page['has_more']
+
+def test_pages_follow_next_since():
+    for n in range(5):
+        insert_book(f"Book {n}", "Author", f"{n:013d}", 1, 1)
+    start = get_change_page()['latest_seq'] - 5
+
+    first = get_change_page(since=start, limit=3)
+    second = get_change_page(since=first['next_since'], limit=3)
+    assert first['has_more'] and not second['has_more']
+    assert [change['row']['title'] for change in first['changes'] + second['changes']] == [f"Book {n}" for n in range(5)]
+
+def test_archived_loans_are_not_logged_as_deletes():
+    return_book_by_patron("123456", 3)
+    conn = get_db_connection()
+    conn.execute("UPDATE borrow_records SET return_date = ?", ((datetime.now() - timedelta(days=200)).isoformat(),))
+    conn.commit()
+    conn.close()
+    latest = get_change_page()['latest_seq']
+
+    assert archive_returned_loans(older_than_days=90)['archived'] == 1
+    assert get_change_page(since=latest)['changes'] == []
+
+def test_compaction_drops_old_changes_and_flags_stale_consumers():
+    _age_changes(40)
+    borrow_book_by_patron("111111", 1)
+    before = get_change_page()
+
+    result = compact_change_log(retention_days=30, batch_size=2)
+    after = get_change_page()
+    assert result['removed'] > 0
+    assert after['oldest_seq'] > before['oldest_seq'] and after['latest_seq'] == before['latest_seq']
+    assert [change['table'] for change in get_change_page(since=after['oldest_seq'] - 1)['changes']] == \
+        ['books', 'borrow_records']
+
+    stale = get_change_page(since=0)
+    assert stale['resync_required'] and stale['changes'] == []
+
+def test_changes_endpoint():
+    client = create_app({'RESPONSE_CACHE_ENABLED': False}).test_client()
+    client.post('/borrow', data={'patron_id': '111111', 'book_id': 2})
+
+    page = client.get('/api/changes?limit=2').get_json()
+    assert page['count'] == 2 and page['has_more']
+    assert client.get('/api/changes?limit=0').status_code == 400
+    assert client.get('/api/changes?shard=one').status_code == 400
+
+    _age_changes(40)
+    compact_change_log(retention_days=30)
+    assert client.get('/api/changes?since=0').status_code == 410
+
+def test_sharded_loan_changes_are_logged_per_shard(monkeypatch):
+    monkeypatch.setattr("database.SHARD_COUNT", 2)
+    init_database()
+    try:
+        borrow_book_by_patron("111111", 1)
+        shard = shard_for_patron("111111")
+
+        loans = get_change_page(shard=shard)['changes']
+        assert [(change['table'], change['op']) for change in loans] == [('borrow_records', 'insert')]
+        assert [change['table'] for change in get_change_page(shard=1 - shard)['changes']] == []
+        assert get_change_page(since=get_change_page()['latest_seq'] - 1)['changes'][0]['table'] == 'books'
+        with pytest.raises(ValueError):
+            get_change_page(shard=2)
+    finally:
+        for index in range(2):
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(shard_path(index) + suffix):
+                    os.unlink(shard_path(index) + suffix)
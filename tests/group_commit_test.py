@@ -0,0 +1,96 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import sqlite3
+import tempfile
+import threading
+import time
+import pytest
+from database import init_database, insert_book, get_book_by_id, run_write, set_group_commit_writer
+from services.group_commit import GroupCommitWriter
+from services.library_service import borrow_book_by_patron
+
+@pytest.fixture
+def writer(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp()
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    writer = GroupCommitWriter(max_latency=0.02).start()
+    set_group_commit_writer(writer)
+    yield writer
+    set_group_commit_writer(None)
+    writer.stop()
+    os.close(db_fd)
+    os.unlink(temp_db)
+
+def test_concurrent_borrows_share_transactions(writer):
+    insert_book("Bestseller", "Author", "1234567890001", 5, 5)
+    barrier = threading.Barrier(10)
+    results = []
+
+    def borrow(patron_id):
+        barrier.wait()
+        results.append(borrow_book_by_patron(patron_id, 1))
+
+    threads = [threading.Thread(target=borrow, args=(f"{100000 + i}",)) for i in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(1 for success, _ in results if success) == 5
+    assert get_book_by_id(1)["available_copies"] == 0
+    stats = writer.stats()
+    assert stats["batches"] < stats["operations"]
+
+def test_failing_operation_rolled_back_alone(writer):
+    insert_book("Book", "Author", "1234567890001", 1, 1)
+
+    def bad_write(conn):
+        conn.execute("UPDATE books SET available_copies = 99 WHERE id = 1")
+        conn.execute("INSERT INTO books (title) VALUES ('missing columns')")
+
+    failing = writer.submit(bad_write)
+    passing = writer.submit(lambda conn: conn.execute("UPDATE books SET total_copies = 2 WHERE id = 1").rowcount)
+
+    with pytest.raises(sqlite3.IntegrityError):
+        failing.result()
+    assert passing.result() == 1
+    book = get_book_by_id(1)
+    assert book["available_copies"] == 1
+    assert book["total_copies"] == 2
+
+def test_run_write_bypasses_writer_for_other_databases(writer, monkeypatch):
+    other_fd, other_db = tempfile.mkstemp()
+    monkeypatch.setattr("database.DATABASE", other_db)
+    init_database()
+    run_write(lambda conn: conn.execute("INSERT INTO library_meta (key, value) VALUES ('x', 1)"))
+    assert writer.stats()["operations"] == 0
+    os.close(other_fd)
+    os.unlink(other_db)
+
+def test_writer_that_cannot_connect_fails_writes(writer, monkeypatch):
+    def refuse(*args, **kwargs):
+        raise sqlite3.OperationalError("unable to open database file")
+
+    monkeypatch.setattr("database.connect", refuse)
+    broken = GroupCommitWriter().start()
+    broken._thread.join(5)
+    set_group_commit_writer(broken)
+
+    with pytest.raises(RuntimeError, match="unable to open"):
+        run_write(lambda conn: None)
+    assert broken.stats()["error"] == "unable to open database file"
+
+def test_queued_writes_are_cancelled_after_the_timeout(writer, monkeypatch):
+    monkeypatch.setattr("database.GROUP_COMMIT_TIMEOUT_SECONDS", 0.05)
+    release = threading.Event()
+    blocker = writer.submit(lambda conn: release.wait(5))
+    while not blocker.running():
+        time.sleep(0.001)
+    try:
+        with pytest.raises(TimeoutError):
+            run_write(lambda conn: conn.execute("UPDATE books SET total_copies = 9"))
+    finally:
+        release.set()
+    assert blocker.result() is True
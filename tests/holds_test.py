@@ -0,0 +1,137 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import sqlite3
+import tempfile
+import json
+import time
+from datetime import datetime, timedelta
+import pytest
+from database import init_database, add_sample_data, get_book_by_id, get_pending_reminders, shard_path
+from services.library_service import borrow_book_by_patron, return_book_by_patron
+import services.holds
+from services.holds import (
+    HoldExpiryTimer, place_hold, cancel_patron_hold, get_holds_for_patron, get_hold_position, expire_holds
+)
+from app import create_app
+
+# Sample book 3 ("1984") has its only copy out with patron 123456
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp()
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    add_sample_data()
+    yield
+    os.close(db_fd)
+    os.unlink(temp_db)
+
+def test_holds_queue_in_order():
+    assert place_hold("100001", 3) == (True, 'Hold placed on "1984". Position in queue: 1.')
+    assert place_hold("100002", 3)[0]
+    assert get_hold_position("100002", 3) == 2
+
+    success, message = place_hold("100001", 3)
+    assert not success and "already have a hold" in message
+    success, message = place_hold("100003", 1)
+    assert not success and "borrow it instead" in message
+    success, message = place_hold("123456", 3)
+    assert not success and "already have this book borrowed" in message
+
+def test_return_sets_copy_aside_for_next_in_line():
+    place_hold("100001", 3)
+    place_hold("100002", 3)
+
+    assert return_book_by_patron("123456", 3)[0]
+
+    assert get_book_by_id(3)['available_copies'] == 0
+    assert get_holds_for_patron("100001")[0]['status'] == 'ready'
+    assert get_hold_position("100002", 3) == 1
+    success, _ = borrow_book_by_patron("100002", 3)
+    assert not success
+    notice = json.loads(get_pending_reminders(10, 5)[0]['payload'])
+    assert notice['kind'] == 'hold_ready' and notice['patron_id'] == "100001"
+
+    assert borrow_book_by_patron("100001", 3)[0]
+    assert get_holds_for_patron("100001") == []
+    assert get_hold_position("100002", 3) == 1
+
+def test_cancelled_ready_hold_passes_copy_on():
+    place_hold("100001", 3)
+    place_hold("100002", 3)
+    return_book_by_patron("123456", 3)
+
+    assert cancel_patron_hold("100001", 3) == (True, "Hold cancelled.")
+
+    assert get_holds_for_patron("100002")[0]['status'] == 'ready'
+    assert cancel_patron_hold("100001", 3)[0] is False
+
+def test_unclaimed_holds_expire_and_copy_returns_to_catalog():
+    place_hold("100001", 3)
+    return_book_by_patron("123456", 3)
+
+    assert expire_holds(datetime.now()) == 0
+    assert expire_holds(datetime.now() + timedelta(days=4)) == 1
+
+    assert get_holds_for_patron("100001") == []
+    assert get_book_by_id(3)['available_copies'] == 1
+
+def test_holds_with_sharded_loans(monkeypatch):
+    monkeypatch.setattr("database.SHARD_COUNT", 2)
+    init_database()
+    assert borrow_book_by_patron("100009", 1)[0]
+    assert borrow_book_by_patron("100008", 1)[0]
+    assert borrow_book_by_patron("100007", 1)[0]
+    place_hold("100001", 1)
+
+    return_book_by_patron("100009", 1)
+    assert get_holds_for_patron("100001")[0]['status'] == 'ready'
+    assert get_book_by_id(1)['available_copies'] == 0
+    assert borrow_book_by_patron("100001", 1)[0]
+    assert get_holds_for_patron("100001") == []
+
+    for index in range(2):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(shard_path(index) + suffix):
+                os.unlink(shard_path(index) + suffix)
+
+def test_holds_endpoints():
+    client = create_app({'RESPONSE_CACHE_ENABLED': False}).test_client()
+
+    response = client.post('/api/holds', json={'patron_id': "100001", 'book_id': 3})
+    assert response.status_code == 201
+    assert client.post('/api/holds', json={'patron_id': "100001", 'book_id': 3}).status_code == 400
+    assert client.post('/api/holds', json={'patron_id': "100001"}).status_code == 400
+
+    data = client.get('/api/holds/100001').get_json()
+    assert data['holds'][0]['book_id'] == 3 and data['holds'][0]['position'] == 1
+
+    assert client.delete('/api/holds/100001/3').status_code == 200
+    assert client.delete('/api/holds/100001/3').status_code == 404
+
+@pytest.mark.parametrize("error", [
+    sqlite3.OperationalError("database is locked"),
+    TimeoutError("database is locked"),
+    RuntimeError("database is locked")
+])
+def test_expiry_timer_retries_after_a_failed_run(monkeypatch, error):
+    calls = []
+
+    def flaky_expire():
+        calls.append(1)
+        if len(calls) == 1:
+            raise error
+        return expire_holds()
+
+    monkeypatch.setattr(services.holds, 'expire_holds', flaky_expire)
+    timer = HoldExpiryTimer(max_wait=0.01).start()
+    try:
+        deadline = time.monotonic() + 5
+        while len(calls) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        timer.stop()
+    stats = timer.stats()
+    assert stats['failures'] == 1 and stats['last_error'] == "database is locked"
+    assert stats['runs'] >= 2
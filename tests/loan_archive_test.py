@@ -0,0 +1,127 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import tempfile
+from datetime import datetime, timedelta
+import pytest
+from database import (
+    init_database, add_sample_data, get_db_connection, get_loan_table_stats,
+    get_patron_loan_history, get_open_loan, shard_path, transaction
+)
+from services.library_service import get_patron_status_report
+from services.loan_archive import archive_returned_loans
+from app import create_app
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp()
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    add_sample_data()
+    yield
+    os.close(db_fd)
+    os.unlink(temp_db)
+
+def _insert_returned_loans(count, patron_id="222222", days_ago=200):
+    returned = datetime.now() - timedelta(days=days_ago)
+    conn = get_db_connection()
+    conn.executemany('''
+        INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [
+        (patron_id, 1, (returned - timedelta(days=10)).isoformat(),
+         (returned + timedelta(days=4)).isoformat(), returned.isoformat())
+        for _ in range(count)
+    ])
+    conn.commit()
+    conn.close()
+
+def test_archives_old_returned_loans_in_batches():
+    _insert_returned_loans(25)
+
+    report = archive_returned_loans(older_than_days=90, batch_size=10)
+
+    assert report['archived'] == 25
+    assert report['batches'] == 4  # 10 + 10 + 5, then an empty pass
+    assert report['before']['hot_rows'] == 26
+    assert report['after']['hot_rows'] == 1
+    assert report['after']['history_rows'] == 25
+
+def test_open_and_recent_loans_stay_hot():
+    _insert_returned_loans(3, days_ago=5)
+
+    report = archive_returned_loans(older_than_days=90)
+
+    assert report['archived'] == 0
+    assert get_open_loan("123456", 3) is not None
+    assert get_loan_table_stats()['hot_rows'] == 4
+
+def test_history_reads_archive_transparently():
+    _insert_returned_loans(2, days_ago=200)
+    _insert_returned_loans(1, days_ago=5)
+    history_before = get_patron_loan_history("222222")
+
+    archive_returned_loans(older_than_days=90)
+
+    history_after = get_patron_loan_history("222222")
+    assert len(history_after) == 3
+    assert history_after == history_before
+    assert history_after[0]['return_date'] > history_after[-1]['return_date']
+
+def test_status_report_includes_borrowing_history():
+    _insert_returned_loans(1, patron_id="123456", days_ago=200)
+    archive_returned_loans(older_than_days=90)
+
+    report = get_patron_status_report("123456")
+
+    assert report['total_books_borrowed'] == 1
+    assert len(report['borrowing_history']) == 1
+    assert report['borrowing_history'][0]['title'] == "The Great Gatsby"
+
+def test_archives_every_shard(monkeypatch):
+    monkeypatch.setattr("database.SHARD_COUNT", 2)
+    init_database()
+    returned = datetime.now() - timedelta(days=200)
+    for patron_id in ("100000", "100001", "100002", "100003"):
+        with transaction(patron_id) as conn:
+            conn.execute('''
+                INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date)
+                VALUES (?, 1, ?, ?, ?)
+            ''', (patron_id, returned.isoformat(), returned.isoformat(), returned.isoformat()))
+
+    report = archive_returned_loans(older_than_days=90)
+
+    assert report['archived'] == 4
+    assert report['after']['history_rows'] == 4
+    assert len(get_patron_loan_history("100002")) == 1
+    for index in range(2):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(shard_path(index) + suffix):
+                os.unlink(shard_path(index) + suffix)
+
+def test_rejects_invalid_arguments():
+    with pytest.raises(ValueError):
+        archive_returned_loans(older_than_days=-1)
+    with pytest.raises(ValueError):
+        archive_returned_loans(batch_size=0)
+
+def test_status_report_lists_recent_history_and_the_rest_is_paged(monkeypatch):
+    monkeypatch.setattr("services.library_service.STATUS_HISTORY_LIMIT", 2)
+    _insert_returned_loans(3, patron_id="123456", days_ago=5)
+    _insert_returned_loans(2, patron_id="123456", days_ago=200)
+    archive_returned_loans(older_than_days=90)
+
+    assert len(get_patron_status_report("123456")['borrowing_history']) == 2
+
+    client = create_app({'RESPONSE_CACHE_ENABLED': False}).test_client()
+    pages, before = [], None
+    while True:
+        query = {'limit': 2, 'before': before} if before else {'limit': 2}
+        page = client.get("/api/patrons/123456/history", query_string=query).get_json()
+        pages.append(page['count'])
+        before = page['next_before']
+        if before is None:
+            break
+    assert pages == [2, 2, 1]
+    assert client.get("/api/patrons/123456/history?limit=0").status_code == 400
+    assert client.get("/api/patrons/123456/history?before=yesterday").status_code == 400
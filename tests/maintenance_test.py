@@ -0,0 +1,109 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+import pytest
+from database import init_database, add_sample_data, get_db_connection, insert_book
+from services.maintenance import (
+    MaintenanceScheduler, convert_to_incremental_vacuum, parse_window, run_maintenance, window_start
+)
+from app import create_app
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp(suffix='.db')
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    add_sample_data()
+    yield temp_db
+    os.close(db_fd)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(temp_db + suffix):
+            os.unlink(temp_db + suffix)
+
+def _churn(count=300):
+    for n in range(count):
+        insert_book(f"Book {n} " + "x" * 500, "Author", f"{n:013d}", 1, 1)
+    conn = get_db_connection()
+    conn.execute("DELETE FROM books WHERE title LIKE 'Book %'")
+    conn.commit()
+    conn.close()
+
+def test_new_databases_use_incremental_auto_vacuum():
+    conn = get_db_connection()
+    assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+    conn.close()
+
+def test_maintenance_frees_pages_and_records_metrics():
+    _churn()
+
+    result = run_maintenance(budget_seconds=30)
+
+    catalog = result['databases']['catalog']
+    assert catalog['before']['freelist_count'] > 0
+    assert catalog['after']['freelist_count'] == 0
+    assert catalog['after']['page_count'] < catalog['before']['page_count']
+    assert catalog['tasks']['incremental_vacuum']['pages_freed'] > 0
+    assert catalog['tasks']['optimize']['statement'] == 'ANALYZE'
+    assert catalog['tasks']['quick_check']['ok']
+    assert catalog['tasks']['checkpoint']['truncated']
+    assert all('seconds' in task for task in catalog['tasks'].values())
+
+    assert run_maintenance(budget_seconds=30)['databases']['catalog']['tasks']['optimize']['statement'] == 'PRAGMA optimize'
+
+def test_exhausted_budget_skips_remaining_tasks():
+    _churn()
+    tasks = run_maintenance(budget_seconds=1e-9)['databases']['catalog']['tasks']
+    assert all(task.get('skipped') == 'time budget exhausted' for task in tasks.values())
+
+def test_old_databases_are_converted_by_vacuum(monkeypatch, tmp_path):
+    legacy = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(legacy)
+    conn.execute('CREATE TABLE books (id INTEGER PRIMARY KEY)')
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr("database.DATABASE", legacy)
+
+    tasks = run_maintenance(budget_seconds=30)['databases']['catalog']['tasks']
+    assert 'skipped' in tasks['incremental_vacuum']
+    assert convert_to_incremental_vacuum() == ['catalog']
+    assert convert_to_incremental_vacuum() == []
+
+def test_windows_may_wrap_midnight():
+    night = parse_window('23:00-02:00')
+    assert window_start(datetime(2024, 5, 2, 1, 30), night) == datetime(2024, 5, 1, 23, 0)
+    assert window_start(datetime(2024, 5, 2, 23, 30), night) == datetime(2024, 5, 2, 23, 0)
+    assert window_start(datetime(2024, 5, 2, 12, 0), night) is None
+    with pytest.raises(ValueError):
+        parse_window('2am')
+
+def test_scheduler_waits_for_a_quiet_window():
+    scheduler = MaintenanceScheduler(window='02:00-05:00', max_requests_per_minute=2)
+    assert scheduler.due(datetime(2024, 5, 2, 3, 0))
+    assert not scheduler.due(datetime(2024, 5, 2, 12, 0))
+
+    for _ in range(3):
+        scheduler._count_request()
+    assert not scheduler.due(datetime(2024, 5, 2, 3, 0))
+
+def test_admin_maintenance_endpoints():
+    app = create_app({'RESPONSE_CACHE_ENABLED': False, 'MAINTENANCE_ENABLED': True,
+                      'MAINTENANCE_WINDOW': '00:00-00:01'})
+    client = app.test_client()
+    scheduler = app.extensions['maintenance_scheduler']
+    try:
+        assert client.post('/api/admin/maintenance').status_code == 202
+        deadline = time.monotonic() + 5
+        while scheduler.runs == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        status = client.get('/api/admin/maintenance').get_json()
+        assert status['runs'] == 1 and status['window'] == '00:00-00:01'
+        assert 'catalog' in status['history'][0]['databases']
+    finally:
+        scheduler.stop()
+
+    assert create_app({'RESPONSE_CACHE_ENABLED': False}).test_client().get('/api/admin/maintenance').status_code == 404
@@ -0,0 +1,102 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import tempfile
+import tracemalloc
+import pytest
+from database import init_database, insert_book
+from services.memory_diagnostics import ModuleResolver
+from app import create_app
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp()
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    yield
+    tracemalloc.stop()
+    os.close(db_fd)
+    os.unlink(temp_db)
+
+@pytest.fixture
+def client():
+    return create_app({'RESPONSE_CACHE_ENABLED': False, 'MEMORY_DIAGNOSTICS_ENABLED': True}).test_client()
+
+def test_start_and_stop_tracing(client):
+    assert client.get('/api/admin/memory').get_json()['tracing'] is False
+
+    status = client.post('/api/admin/memory/start', json={'frames': 5}).get_json()
+    assert status['tracing'] is True and status['frames'] == 5
+
+    assert client.post('/api/admin/memory/stop').get_json()['tracing'] is False
+    assert client.post('/api/admin/memory/start', json={'frames': 0}).status_code == 400
+
+def test_snapshots_are_grouped_by_module_and_diffed(client):
+    assert client.post('/api/admin/memory/snapshots').status_code == 409
+    client.post('/api/admin/memory/start')
+    before = client.post('/api/admin/memory/snapshots', json={'label': 'before'}).get_json()
+
+    for n in range(300):
+        insert_book(f"Book {n}", "Author", f"{n:013d}", 1, 1)
+    response = client.get('/catalog')
+    after = client.post('/api/admin/memory/snapshots', json={'label': 'after'}).get_json()
+
+    modules = client.get(f"/api/admin/memory/snapshots/{after['id']}?n=200").get_json()['modules']
+    assert all(module['bytes'] > 0 for module in modules)
+
+    diff = client.get(f"/api/admin/memory/diff?from={before['id']}&to={after['id']}&n=200").get_json()
+    assert diff['modules'] == sorted(diff['modules'], key=lambda m: abs(m['bytes_diff']), reverse=True)
+    assert response.status_code == 200
+
+    status = client.get('/api/admin/memory').get_json()
+    assert [s['label'] for s in status['snapshots']] == ['before', 'after']
+    assert client.get('/api/admin/memory/snapshots/999').status_code == 404
+    assert client.get('/api/admin/memory/diff?from=1').status_code == 400
+
+def test_request_peaks_are_recorded_per_endpoint(client):
+    for n in range(200):
+        insert_book(f"Book {n}", "Author", f"{n:013d}", 1, 1)
+    client.get('/catalog')
+    assert client.get('/api/admin/memory').get_json()['requests'] == {}
+
+    client.post('/api/admin/memory/start')
+    client.get('/catalog')
+    client.get('/catalog')
+
+    peaks = client.get('/api/admin/memory').get_json()['requests']
+    assert peaks['catalog.catalog']['requests'] == 2
+    assert peaks['catalog.catalog']['max_peak_bytes'] > 0
+
+    client.post('/api/admin/memory/reset_requests')
+    assert 'catalog.catalog' not in client.get('/api/admin/memory').get_json()['requests']
+
+def test_overlapping_requests_are_skipped_and_the_process_peak_is_kept(client):
+    diagnostics = client.application.extensions['memory_diagnostics']
+    client.post('/api/admin/memory/start')
+    block = bytearray(5_000_000)
+    del block
+
+    diagnostics._active.acquire()
+    try:
+        client.get('/catalog')
+    finally:
+        diagnostics._active.release()
+    client.get('/catalog')
+
+    status = client.get('/api/admin/memory').get_json()
+    assert status['skipped_requests'] == 1
+    assert status['requests']['catalog.catalog']['requests'] == 1
+    assert status['peak_traced_bytes'] >= 5_000_000
+
+def test_project_files_resolve_to_dotted_module_names():
+    resolve = ModuleResolver()
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+    assert resolve(os.path.join(root, 'database.py')) == 'database'
+    assert resolve(os.path.join(root, 'services', 'library_service.py')) == 'services.library_service'
+    assert resolve(os.path.join(root, 'routes', '__init__.py')) == 'routes'
+    assert resolve(pytest.__file__) == 'pytest'
+
+def test_memory_endpoints_are_off_by_default():
+    client = create_app({'RESPONSE_CACHE_ENABLED': False}).test_client()
+    assert client.get('/api/admin/memory').status_code == 404
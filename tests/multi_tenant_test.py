@@ -0,0 +1,97 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import sqlite3
+import tempfile
+import pytest
+import database
+from database import ConnectionPool, get_db_connection, current_database, is_read_only, resolve_database_uri
+from app import create_app
+
+@pytest.fixture(autouse=True)
+def unused_module_database(monkeypatch):
+    # Tenant apps must never touch the module-level database
+    monkeypatch.setattr("database.DATABASE", os.path.join(tempfile.gettempdir(), "must-not-exist.db"))
+    yield
+    assert not os.path.exists(database.DATABASE)
+
+def _add_book(client, isbn):
+    return client.post('/add_book', data={
+        'title': 'Tenant Book', 'author': 'Author', 'isbn': isbn, 'total_copies': '1'
+    })
+
+def test_in_memory_tenants_are_isolated():
+    first = create_app({'DATABASE': ':memory:'})
+    second = create_app({'DATABASE': ':memory:'})
+
+    _add_book(first.test_client(), '1111111111111')
+
+    assert b'Tenant Book' in first.test_client().get('/catalog').data
+    assert b'Tenant Book' not in second.test_client().get('/catalog').data
+
+def test_each_tenant_resolves_its_own_database():
+    first = create_app({'DATABASE': ':memory:'})
+    second = create_app({'DATABASE': ':memory:'})
+
+    with first.app_context():
+        first_uri = current_database()
+    with second.app_context():
+        second_uri = current_database()
+
+    assert first_uri != second_uri
+    assert first.extensions['db_pool'] is not second.extensions['db_pool']
+
+def test_file_tenant_and_read_only_uri():
+    db_fd, path = tempfile.mkstemp(suffix='.db')
+    try:
+        writer = create_app({'DATABASE': path, 'RESPONSE_CACHE_ENABLED': False})
+        _add_book(writer.test_client(), '2222222222222')
+
+        reader = create_app({'DATABASE': f'file:{path}?mode=ro', 'RESPONSE_CACHE_ENABLED': False})
+        assert b'Tenant Book' in reader.test_client().get('/catalog').data
+
+        with reader.app_context():
+            conn = get_db_connection()
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("DELETE FROM books")
+            conn.close()
+        writer.extensions['db_pool'].close()
+        reader.extensions['db_pool'].close()
+    finally:
+        os.close(db_fd)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+
+def test_pool_reuses_connections_and_keeps_memory_database_alive():
+    pool = ConnectionPool(resolve_database_uri(':memory:', 'pool-test'), max_idle=1)
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    conn.close()
+
+    again = pool.acquire()
+    extra = pool.acquire()
+    assert again is conn
+    assert again.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    extra.close()
+    again.close()
+    pool.close()
+
+def test_pool_rolls_back_abandoned_transactions():
+    pool = ConnectionPool(resolve_database_uri(':memory:', 'rollback-test'))
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    conn.execute("INSERT INTO t VALUES (1)")
+    conn.close()
+
+    conn = pool.acquire()
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    conn.close()
+    pool.close()
+
+def test_read_only_detection():
+    assert is_read_only('file:library.db?mode=ro')
+    assert not is_read_only('file:library.db?mode=rw')
+    assert not is_read_only('library.db')
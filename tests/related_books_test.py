@@ -0,0 +1,134 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import tempfile
+from datetime import datetime, timedelta
+import pytest
+from database import init_database, insert_book, insert_borrow_record, get_book_by_isbn, get_db_connection, shard_path
+from services.recommendations import build_related_index, refresh_related_index, get_related
+from services.loan_archive import archive_returned_loans
+from app import create_app
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp()
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    yield
+    os.close(db_fd)
+    os.unlink(temp_db)
+
+def _add_books(count):
+    ids = []
+    for n in range(count):
+        isbn = f"{n + 1:013d}"
+        insert_book(f"Book {n + 1}", "Author", isbn, 10, 10)
+        ids.append(get_book_by_isbn(isbn)['id'])
+    return ids
+
+def _borrow(patron_id, book_ids, days_ago=30):
+    borrowed = datetime.now() - timedelta(days=days_ago)
+    for offset, book_id in enumerate(book_ids):
+        when = borrowed + timedelta(minutes=offset)
+        insert_borrow_record(patron_id, book_id, when, when + timedelta(days=14))
+
+def test_build_ranks_books_by_shared_borrowers():
+    a, b, c, d = _add_books(4)
+    _borrow("100001", [a, b, c])
+    _borrow("100002", [a, b])
+    _borrow("100003", [a, b, d])
+    _borrow("100004", [c])
+
+    stats = build_related_index()
+    related = get_related(a, 10)
+
+    assert stats['patrons'] == 4
+    assert related[0]['book_id'] == b and related[0]['co_borrowers'] == 3
+    assert {book['book_id'] for book in related[1:]} == {c, d}
+    assert all(book['co_borrowers'] == 1 for book in related[1:])
+    assert b not in [book['book_id'] for book in get_related(b, 10)]
+
+def test_refresh_folds_in_new_loans_only():
+    a, b, c = _add_books(3)
+    _borrow("100001", [a, b])
+    build_related_index()
+
+    _borrow("100001", [c], days_ago=1)
+    _borrow("100002", [b, c], days_ago=1)
+    stats = refresh_related_index()
+
+    assert stats['new_loans'] == 3
+    assert [(book['book_id'], book['co_borrowers']) for book in get_related(c, 10)] == [(b, 2), (a, 1)]
+    assert [(book['book_id'], book['co_borrowers']) for book in get_related(a, 10)] == [(b, 1), (c, 1)]
+    assert refresh_related_index()['new_loans'] == 0
+
+def test_refresh_reads_loans_archived_since_the_last_refresh():
+    a, b = _add_books(2)
+    _borrow("100001", [a])
+    build_related_index()
+
+    returned = datetime.now() - timedelta(days=200)
+    conn = get_db_connection()
+    conn.execute('''
+        INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date)
+        VALUES ('100001', ?, ?, ?, ?)
+    ''', (b, returned.isoformat(), returned.isoformat(), returned.isoformat()))
+    conn.commit()
+    conn.close()
+    assert archive_returned_loans(older_than_days=90)['archived'] == 1
+
+    assert refresh_related_index()['new_loans'] == 1
+    assert [book['book_id'] for book in get_related(a, 10)] == [b]
+    assert refresh_related_index()['new_loans'] == 0
+
+def test_refresh_matches_full_build():
+    books = _add_books(5)
+    _borrow("100001", books[:3])
+    _borrow("100002", books[1:4])
+    build_related_index()
+    _borrow("100001", books[3:], days_ago=1)
+    _borrow("100003", books[::2], days_ago=1)
+    refresh_related_index()
+    refreshed = {book_id: get_related(book_id, 20) for book_id in books}
+
+    build_related_index()
+
+    for book_id in books:
+        assert sorted((r['book_id'], r['co_borrowers']) for r in refreshed[book_id]) == \
+            sorted((r['book_id'], r['co_borrowers']) for r in get_related(book_id, 20))
+
+def test_repeat_borrows_count_a_patron_once():
+    a, b = _add_books(2)
+    _borrow("100001", [a, b, a, b])
+    build_related_index()
+
+    assert get_related(a, 10)[0]['co_borrowers'] == 1
+
+def test_build_covers_every_shard(monkeypatch):
+    monkeypatch.setattr("database.SHARD_COUNT", 2)
+    init_database()
+    a, b = _add_books(2)
+    for patron_id in ("100001", "100002", "100003", "100004"):
+        _borrow(patron_id, [a, b])
+
+    build_related_index()
+
+    assert get_related(a, 10)[0]['co_borrowers'] == 4
+    for index in range(2):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(shard_path(index) + suffix):
+                os.unlink(shard_path(index) + suffix)
+
+def test_related_endpoint():
+    client = create_app({'RESPONSE_CACHE_ENABLED': False}).test_client()
+    _borrow("100001", [1, 2])
+    build_related_index()
+
+    response = client.get('/api/books/1/related?limit=5')
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['related'][0]['book_id'] == 2
+    assert data['related'][0]['title'] == "To Kill a Mockingbird"
+
+    assert client.get('/api/books/999/related').status_code == 404
+    assert client.get('/api/books/1/related?limit=0').status_code == 400
@@ -0,0 +1,176 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import sqlite3
+import tempfile
+import json
+import time
+from datetime import datetime, timedelta
+import pytest
+from database import init_database, add_sample_data, insert_borrow_record, get_pending_reminders, shard_path
+from services.library_service import return_book_by_patron
+import services.reminders
+from services.reminders import ReminderScheduler, deliver_reminders
+from app import create_app
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp()
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    add_sample_data()
+    yield
+    os.close(db_fd)
+    os.unlink(temp_db)
+
+def _loan(patron_id, book_id, due_in):
+    due = datetime.now() + due_in
+    insert_borrow_record(patron_id, book_id, due - timedelta(days=14), due)
+
+def _outbox():
+    messages = get_pending_reminders(100, 5)
+    for message in messages:
+        message['payload'] = json.loads(message['payload'])
+    return messages
+
+def test_overdue_and_due_soon_loans_are_batched_per_patron():
+    _loan("100001", 1, timedelta(days=-3))
+    _loan("100001", 2, timedelta(days=-1))
+    _loan("100002", 1, timedelta(days=1))
+    _loan("100003", 2, timedelta(days=10))
+
+    result = ReminderScheduler().tick()
+
+    messages = _outbox()
+    assert result['messages_queued'] == 2
+    assert [(m['patron_id'], m['kind'], len(m['payload']['loans'])) for m in messages] == \
+        [("100001", "overdue", 2), ("100002", "due_soon", 1)]
+    assert messages[0]['payload']['loans'][0]['title'] == "The Great Gatsby"
+
+def test_each_loan_is_reminded_once_per_kind():
+    _loan("100001", 1, timedelta(days=1))
+    scheduler = ReminderScheduler()
+    now = datetime.now()
+    scheduler.tick(now)
+    scheduler.tick(now + timedelta(minutes=1))
+    assert len(_outbox()) == 1
+
+    scheduler.tick(now + timedelta(days=2))
+    assert [m['kind'] for m in _outbox()] == ["due_soon", "overdue"]
+
+    # A fresh scheduler rescans the backlog but queues nothing new
+    assert ReminderScheduler().tick(now + timedelta(days=2))['messages_queued'] == 0
+
+def test_ticks_only_fire_reminders_that_are_due():
+    _loan("100001", 1, timedelta(days=2, hours=12))
+    scheduler = ReminderScheduler()
+    now = datetime.now()
+
+    assert scheduler.tick(now)['fired'] == 0
+    assert scheduler.stats()['queue_depth'] == 0
+    assert scheduler.tick(now + timedelta(hours=11))['fired'] == 0
+    assert scheduler.stats()['queue_depth'] == 1
+    assert scheduler.tick(now + timedelta(hours=13))['fired'] == 1
+    assert scheduler.stats()['queue_depth'] == 0
+
+def test_returned_loans_are_not_reminded():
+    _loan("100001", 1, timedelta(days=3))
+    scheduler = ReminderScheduler()
+    now = datetime.now()
+    scheduler.tick(now + timedelta(hours=23, minutes=30))
+    assert scheduler.stats()['queue_depth'] == 1
+    return_book_by_patron("100001", 1)
+
+    assert scheduler.tick(now + timedelta(days=1, hours=1))['fired'] == 1
+    assert _outbox() == []
+
+def test_delivery_marks_messages_and_retries_failures():
+    _loan("100001", 1, timedelta(days=-1))
+    _loan("100002", 2, timedelta(days=-1))
+    ReminderScheduler().tick()
+    sent = []
+
+    def send(message):
+        if message['patron_id'] == "100002":
+            raise ConnectionError("mail server down")
+        sent.append(message)
+
+    assert deliver_reminders(send) == {'delivered': 1, 'failed': 1}
+    assert [m['patron_id'] for m in sent] == ["100001"]
+    assert [m['attempts'] for m in _outbox()] == [1]
+    assert deliver_reminders(send, max_attempts=1) == {'delivered': 0, 'failed': 0}
+
+def test_scans_every_shard(monkeypatch):
+    monkeypatch.setattr("database.SHARD_COUNT", 2)
+    init_database()
+    for patron_id in ("100001", "100002", "100003", "100004"):
+        _loan(patron_id, 1, timedelta(days=-1))
+
+    ReminderScheduler().tick()
+
+    assert len(_outbox()) == 4
+    for index in range(2):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(shard_path(index) + suffix):
+                os.unlink(shard_path(index) + suffix)
+
+def test_reminder_stats_endpoint():
+    client = create_app({'RESPONSE_CACHE_ENABLED': False}).test_client()
+    response = client.get('/api/reminders/stats')
+    assert response.get_json() == {'enabled': False, 'outbox_depth': 0}
+
+    app = create_app({'RESPONSE_CACHE_ENABLED': False, 'REMINDER_SCHEDULER_ENABLED': True, 'REMINDER_TICK_SECONDS': 3600})
+    scheduler = app.extensions['reminder_scheduler']
+    try:
+        data = app.test_client().get('/api/reminders/stats').get_json()
+    finally:
+        scheduler.stop()
+    assert data['enabled'] is True
+    assert {'queue_depth', 'last_scan_seconds', 'outbox_depth'} <= set(data)
+
+def test_scheduler_survives_a_failing_tick(monkeypatch):
+    scheduler = ReminderScheduler(tick_seconds=0.01)
+    tick = scheduler.tick
+    calls = []
+
+    def flaky_tick():
+        calls.append(1)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return tick()
+
+    monkeypatch.setattr(scheduler, 'tick', flaky_tick)
+    scheduler.start()
+    try:
+        deadline = time.monotonic() + 5
+        while scheduler.ticks == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        scheduler.stop()
+    stats = scheduler.stats()
+    assert stats['failures'] == 1 and stats['last_error'] == "database is locked"
+    assert stats['ticks'] >= 1
+
+def test_reminders_of_a_failed_write_fire_on_the_next_tick(monkeypatch):
+    _loan("100001", 1, timedelta(days=-1))
+    scheduler = ReminderScheduler(tick_seconds=0.01)
+    run_write = services.reminders.run_write
+    calls = []
+
+    def flaky_run_write(operation):
+        calls.append(1)
+        if len(calls) == 1:
+            raise TimeoutError("Group-commit write did not finish within 30.0 seconds.")
+        return run_write(operation)
+
+    monkeypatch.setattr("services.reminders.run_write", flaky_run_write)
+    scheduler.start()
+    try:
+        deadline = time.monotonic() + 5
+        while scheduler.reminders_queued == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        scheduler.stop()
+    stats = scheduler.stats()
+    assert stats['failures'] == 1 and stats['last_error'].startswith("Group-commit write")
+    assert [(m['patron_id'], m['kind']) for m in _outbox()] == [("100001", "overdue")]
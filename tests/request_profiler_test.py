@@ -0,0 +1,93 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import tempfile
+import time
+import pytest
+from database import init_database
+from services.request_profiler import collapse_stacks
+from app import create_app
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp()
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    yield
+    os.close(db_fd)
+    os.unlink(temp_db)
+
+def _client(**config):
+    return create_app({'RESPONSE_CACHE_ENABLED': False, 'PROFILING_ENABLED': True,
+                       'PROFILE_SAMPLE_RATE': 0.0, **config}).test_client()
+
+def test_only_requests_with_header_are_profiled_at_zero_sample_rate():
+    client = _client()
+    client.get('/api/search?q=gatsby&type=title')
+    client.get('/api/search?q=gatsby&type=title', headers={'X-Profile': '1'})
+    client.get('/catalog', headers={'X-Profile': 'true'})
+
+    data = client.get('/api/admin/profile?n=5').get_json()
+    assert {name: endpoint['requests'] for name, endpoint in data['endpoints'].items()} == \
+        {'api.search_books_api': 1, 'catalog.catalog': 1}
+    assert len(data['top']) == 5
+    assert data['top'][0]['tottime_seconds'] >= data['top'][-1]['tottime_seconds']
+
+def test_profiles_are_aggregated_per_endpoint():
+    client = _client(PROFILE_SAMPLE_RATE=1.0)
+    for _ in range(3):
+        client.get('/api/search?q=gatsby&type=title')
+
+    summary = client.get('/api/admin/profile?endpoint=api.search_books_api&sort=cumtime').get_json()
+    assert summary['endpoints']['api.search_books_api']['requests'] == 3
+    assert any('search_books_in_catalog' in row['function'] for row in summary['top'])
+    assert summary['process_wide'] == (sys.version_info >= (3, 12))
+
+    client.post('/api/admin/profile/reset')
+    assert 'api.search_books_api' not in client.get('/api/admin/profile').get_json()['endpoints']
+
+def test_collapsed_stacks_endpoint_and_files(tmp_path):
+    client = _client(PROFILE_OUTPUT_DIR=str(tmp_path))
+    client.get('/api/search?q=gatsby&type=title', headers={'X-Profile': '1'})
+
+    text = client.get('/api/admin/profile/collapsed?endpoint=api.search_books_api').get_data(as_text=True)
+    lines = text.strip().splitlines()
+    assert lines
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+    assert any('search_books_in_catalog' in line and 'get_all_books' in line for line in lines)
+
+    files = client.post('/api/admin/profile/dump').get_json()['files']
+    assert [os.path.basename(path) for path in files] == ['api.search_books_api.collapsed']
+
+def test_collapse_spreads_own_time_over_callers():
+    a, b, c = ('m.py', 1, 'a'), ('m.py', 2, 'b'), ('m.py', 3, 'c')
+    stats = {
+        a: (1, 1, 0.1, 1.0, {}),
+        b: (1, 1, 0.2, 0.4, {a: (1, 1, 0.2, 0.4)}),
+        c: (2, 2, 0.5, 0.5, {a: (1, 1, 0.1, 0.3), b: (1, 1, 0.1, 0.2)}),
+    }
+
+    stacks = collapse_stacks(stats)
+
+    assert stacks['a (m.py:1)'] == pytest.approx(0.1)
+    assert stacks['a (m.py:1);c (m.py:3)'] == pytest.approx(0.3)
+    assert stacks['a (m.py:1);b (m.py:2);c (m.py:3)'] == pytest.approx(0.2)
+
+def test_collapse_is_bounded_on_highly_connected_call_graphs():
+    # Every function calls every later one: 2**39 root-to-leaf paths
+    functions = [('m.py', n, f'f{n}') for n in range(40)]
+    stats = {}
+    for n, function in enumerate(functions):
+        callers = {caller: (1, 1, 0.001, 0.001 * (40 - n)) for caller in functions[:n]}
+        stats[function] = (n + 1, n + 1, 0.001 * max(1, n), 0.001 * (40 - n) * max(1, n), callers)
+
+    start = time.perf_counter()
+    stacks = collapse_stacks(stats, min_seconds=0, max_paths=1000)
+
+    assert time.perf_counter() - start < 2.0
+    assert len(stacks) <= 2000
+    assert any(stack.endswith(';<truncated>') for stack in stacks)
+
+def test_admin_profile_endpoints_are_off_by_default():
+    client = create_app({'RESPONSE_CACHE_ENABLED': False}).test_client()
+    assert client.get('/api/admin/profile').status_code == 404
@@ -0,0 +1,60 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import gzip
+import tempfile
+import pytest
+from app import create_app
+from database import insert_book
+from services.library_service import borrow_book_by_patron
+from services.response_cache import ResponseCache
+
+@pytest.fixture
+def client(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp()
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    app = create_app({'RESPONSE_CACHE_MAX_ENTRIES': 4})
+    yield app.test_client()
+    os.close(db_fd)
+    os.unlink(temp_db)
+
+def test_catalog_served_from_cache(client):
+    cache = client.application.extensions['response_cache']
+    first = client.get('/catalog')
+    second = client.get('/catalog')
+    assert first.data == second.data
+    assert cache.stats()['hits'] == 1
+
+def test_cache_invalidated_by_insert_and_borrow(client):
+    client.get('/catalog')
+    insert_book("Cached Book", "Author", "1111111111111", 1, 1)
+    response = client.get('/catalog')
+    assert b"Cached Book" in response.data
+    assert b"1/1 Available" in response.data
+
+    borrow_book_by_patron("654321", 4)
+    response = client.get('/catalog')
+    assert b"1/1 Available" not in response.data
+
+def test_gzip_variant_served_when_accepted(client):
+    plain = client.get('/catalog')
+    compressed = client.get('/catalog', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == plain.data
+
+def test_flashed_messages_not_cached(client):
+    client.post('/borrow', data={'patron_id': '123456', 'book_id': 'abc'})
+    flashed = client.get('/catalog')
+    assert b"Invalid book ID." in flashed.data
+
+    other_user = client.application.test_client()
+    assert b"Invalid book ID." not in other_user.get('/catalog').data
+
+def test_lru_evicts_oldest_entry():
+    cache = ResponseCache(max_entries=2, gzip_enabled=False)
+    cache.put('a', b'1', 'text/html')
+    cache.put('b', b'2', 'text/html')
+    cache.get('a')
+    cache.put('c', b'3', 'text/html')
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
@@ -4,7 +4,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 import tempfile
 import pytest
 from datetime import datetime, timedelta
-from database import init_database, insert_book, insert_borrow_record, get_book_by_id, get_patron_borrowed_books
+from database import init_database, insert_book, insert_borrow_record, get_book_by_id, get_patron_borrowed_books, get_open_loan
 from services.library_service import return_book_by_patron
 
 @pytest.fixture(autouse=True)
@@ -31,3 +31,18 @@ def test_return_book_updates_availability():
     
     updated_book = get_book_by_id(book["id"])
     assert updated_book["available_copies"] == 1
+
+def test_return_closes_one_loan_per_call():
+    insert_book("Two Copies", "Author", "1234567890124", 2, 0)
+    borrow_date = datetime.now() - timedelta(days=5)
+    due_date = borrow_date + timedelta(days=14)
+    insert_borrow_record("123456", 1, borrow_date, due_date)
+    insert_borrow_record("123456", 1, borrow_date + timedelta(days=1), due_date + timedelta(days=1))
+
+    success, _ = return_book_by_patron("123456", 1)
+    assert success is True
+    assert get_book_by_id(1)["available_copies"] == 1
+
+    loan = get_open_loan("123456", 1)
+    assert loan["due_date"] == due_date + timedelta(days=1)
+    assert get_open_loan("654321", 1) is None
@@ -0,0 +1,188 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timedelta
+import pytest
+import database
+from database import (
+    init_database, insert_book, get_book_by_id, get_patron_borrowed_books,
+    get_patron_borrow_count, get_overdue_loans, shard_for_patron, shard_path,
+    run_write, checkout_copy
+)
+from services.library_service import (
+    borrow_book_by_patron, return_book_by_patron, borrow_books_by_patron,
+    calculate_late_fee_for_book, get_overdue_report
+)
+from app import create_app
+
+SHARDS = 4
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp(suffix='.db')
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    monkeypatch.setattr("database.SHARD_COUNT", SHARDS)
+    init_database()
+    yield
+    os.close(db_fd)
+    for path in [temp_db] + [shard_path(index) for index in range(SHARDS)]:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+
+def _patrons_on_distinct_shards():
+    patrons = {}
+    candidate = 100000
+    while len(patrons) < SHARDS:
+        patron_id = str(candidate)
+        patrons.setdefault(shard_for_patron(patron_id), patron_id)
+        candidate += 1
+    return [patrons[index] for index in range(SHARDS)]
+
+def _shard_loan_count(index):
+    conn = sqlite3.connect(shard_path(index))
+    count = conn.execute('SELECT COUNT(*) FROM borrow_records').fetchone()[0]
+    conn.close()
+    return count
+
+def _insert_overdue_loan(patron_id, book_id, days_overdue):
+    due_date = datetime.now() - timedelta(days=days_overdue)
+    run_write(
+        lambda conn: checkout_copy(conn, patron_id, book_id, due_date - timedelta(days=14), due_date),
+        patron_id=patron_id
+    )
+
+def test_shard_assignment_is_stable():
+    assert shard_for_patron("123456") == shard_for_patron("123456")
+    assert all(0 <= shard_for_patron(str(n)) < SHARDS for n in range(100000, 100100))
+
+def test_borrow_writes_loan_to_patron_shard_only():
+    insert_book("Sharded", "Author", "1111111111111", 2, 2)
+    book_id = database.get_book_by_isbn("1111111111111")['id']
+    patron_id = "222222"
+
+    success, _ = borrow_book_by_patron(patron_id, book_id)
+
+    assert success
+    assert get_book_by_id(book_id)['available_copies'] == 1
+    for index in range(SHARDS):
+        assert _shard_loan_count(index) == (1 if index == shard_for_patron(patron_id) else 0)
+    assert get_patron_borrow_count(patron_id) == 1
+    assert get_patron_borrowed_books(patron_id)[0]['title'] == "Sharded"
+
+def test_return_releases_copy_after_shard_commit():
+    insert_book("Sharded", "Author", "1111111111111", 1, 1)
+    book_id = database.get_book_by_isbn("1111111111111")['id']
+
+    borrow_book_by_patron("222222", book_id)
+    success, _ = return_book_by_patron("222222", book_id)
+
+    assert success
+    assert get_book_by_id(book_id)['available_copies'] == 1
+    assert get_patron_borrow_count("222222") == 0
+
+def test_failed_shard_transaction_gives_reserved_copy_back():
+    insert_book("Sharded", "Author", "1111111111111", 1, 1)
+    book_id = database.get_book_by_isbn("1111111111111")['id']
+    now = datetime.now()
+
+    def checkout_then_fail(conn):
+        assert checkout_copy(conn, "222222", book_id, now, now + timedelta(days=14))
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        run_write(checkout_then_fail, patron_id="222222")
+
+    assert get_book_by_id(book_id)['available_copies'] == 1
+    assert get_patron_borrow_count("222222") == 0
+
+def test_concurrent_borrows_across_shards_never_over_issue():
+    insert_book("Popular", "Author", "1111111111111", 2, 2)
+    book_id = database.get_book_by_isbn("1111111111111")['id']
+    patrons = _patrons_on_distinct_shards()
+    barrier = threading.Barrier(len(patrons))
+    results = {}
+
+    def borrow(patron_id):
+        barrier.wait()
+        results[patron_id] = borrow_book_by_patron(patron_id, book_id)[0]
+
+    threads = [threading.Thread(target=borrow, args=(patron_id,)) for patron_id in patrons]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(results.values()) == 2
+    assert get_book_by_id(book_id)['available_copies'] == 0
+    assert sum(_shard_loan_count(index) for index in range(SHARDS)) == 2
+
+def test_cart_borrow_and_late_fee_lookup_use_patron_shard():
+    insert_book("Book A", "Author", "1111111111111", 1, 1)
+    insert_book("Book B", "Author", "2222222222222", 1, 1)
+    ids = [database.get_book_by_isbn(isbn)['id'] for isbn in ("1111111111111", "2222222222222")]
+
+    success, _, items = borrow_books_by_patron("333333", ids)
+
+    assert success
+    assert all(item['success'] for item in items)
+    assert _shard_loan_count(shard_for_patron("333333")) == 2
+    assert calculate_late_fee_for_book("333333", ids[0])['fee_amount'] == 0.00
+
+def test_overdue_loans_are_gathered_from_all_shards_in_due_order():
+    insert_book("Overdue", "Author", "1111111111111", SHARDS, SHARDS)
+    book_id = database.get_book_by_isbn("1111111111111")['id']
+    patrons = _patrons_on_distinct_shards()
+    for days_overdue, patron_id in enumerate(patrons, start=1):
+        _insert_overdue_loan(patron_id, book_id, days_overdue)
+
+    loans = get_overdue_loans(datetime.now())
+
+    assert [loan['patron_id'] for loan in loans] == list(reversed(patrons))
+    assert [loan['due_date'] for loan in loans] == sorted(loan['due_date'] for loan in loans)
+
+def test_overdue_report_endpoint():
+    app = create_app({'RESPONSE_CACHE_ENABLED': False})
+    _insert_overdue_loan("222222", 1, 10)
+
+    response = app.test_client().get('/api/reports/overdue')
+
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['count'] == 1
+    assert data['overdue_loans'][0]['patron_id'] == "222222"
+    assert data['overdue_loans'][0]['days_overdue'] == 10
+    assert data['total_late_fees'] == 6.50
+
+def test_return_succeeds_and_queues_copy_when_catalog_release_fails(monkeypatch):
+    insert_book("Sharded", "Author", "1111111111111", 1, 1)
+    book_id = database.get_book_by_isbn("1111111111111")['id']
+    borrow_book_by_patron("222222", book_id)
+    release_pending_copies = database.release_pending_copies
+
+    def catalog_locked(shard):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr("database.release_pending_copies", catalog_locked)
+    success, _ = return_book_by_patron("222222", book_id)
+
+    assert success
+    assert get_patron_borrow_count("222222") == 0
+    assert get_book_by_id(book_id)['available_copies'] == 0
+
+    assert release_pending_copies(shard_for_patron("222222")) == 1
+    assert release_pending_copies(shard_for_patron("222222")) == 0
+    assert get_book_by_id(book_id)['available_copies'] == 1
+
+def test_shard_count_is_kept_per_app():
+    two_shards = create_app({'LOAN_SHARD_COUNT': 2, 'RESPONSE_CACHE_ENABLED': False})
+    default = create_app({'RESPONSE_CACHE_ENABLED': False})
+
+    with two_shards.app_context():
+        assert database.shard_count() == 2
+    with default.app_context():
+        assert database.shard_count() == SHARDS
+    assert database.SHARD_COUNT == SHARDS
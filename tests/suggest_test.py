@@ -0,0 +1,143 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import tempfile
+import threading
+import time
+import pytest
+import services.suggest
+from database import init_database, add_sample_data, get_db_connection, get_meta_value, insert_book
+from services.library_service import add_book_to_catalog, borrow_book_by_patron
+from services.suggest import PrefixIndex, SuggestIndex, normalize
+from app import create_app
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp(suffix='.db')
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    add_sample_data()
+    yield temp_db
+    os.close(db_fd)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(temp_db + suffix):
+            os.unlink(temp_db + suffix)
+
+@pytest.fixture
+def app():
+    return create_app({'RESPONSE_CACHE_ENABLED': False, 'SUGGEST_REFRESH_SECONDS': 3600})
+
+def _titles(suggestions):
+    return [suggestion['title'] for suggestion in suggestions]
+
+def test_prefixes_are_normalized():
+    assert normalize("  Émile   OU de ") == "emile ou de"
+    index = SuggestIndex(refresh_seconds=0)
+    insert_book("Émile ou de l'éducation", "Jean-Jacques Rousseau", "9782080705570", 1, 1)
+    assert _titles(index.suggest("the  GR")) == ["The Great Gatsby"]
+    assert _titles(index.suggest("emile")) == ["Émile ou de l'éducation"]
+    assert index.suggest("ha", 'author') == [{'author': 'Harper Lee', 'borrows': 0}]
+    assert index.suggest("   ") == [] and index.suggest("zz") == []
+
+def test_completions_are_ranked_by_circulation():
+    for n, isbn in enumerate(("1111111111111", "2222222222222", "3333333333333")):
+        insert_book(f"Tale {n}", f"Teller {n}", isbn, 3, 3)
+    book_ids = {row['title']: row['id'] for row in get_db_connection().execute('SELECT id, title FROM books')}
+    borrow_book_by_patron("111111", book_ids["Tale 2"])
+    borrow_book_by_patron("222222", book_ids["Tale 2"])
+    borrow_book_by_patron("111111", book_ids["Tale 1"])
+
+    index = SuggestIndex(refresh_seconds=0, rank_refresh_seconds=0)
+    suggestions = index.suggest("tale")
+    assert _titles(suggestions) == ["Tale 2", "Tale 1", "Tale 0"]
+    assert [suggestion['borrows'] for suggestion in suggestions] == [2, 1, 0]
+    assert _titles(index.suggest("tale", limit=2)) == ["Tale 2", "Tale 1"]
+    assert [suggestion['author'] for suggestion in index.suggest("tel", 'author')] == ["Teller 2", "Teller 1", "Teller 0"]
+
+def test_long_runs_merge_the_block_rankings(monkeypatch):
+    monkeypatch.setattr(services.suggest, 'BLOCK_SIZE', 4)
+    monkeypatch.setattr(services.suggest, 'GROUP_BLOCKS', 2)
+    monkeypatch.setattr(services.suggest, 'MAX_ADDED', 3)
+    index = PrefixIndex((f"title {n:03d}", n) for n in range(100))
+    index.set_scores({7: 5, 42: 9, 99: 1, 500: 100})
+
+    assert index.complete("title", 5) == [42, 7, 99, 0, 1]
+    assert index.complete("title 04", 3) == [42, 40, 41]
+    assert index.complete("title 01", 20) == list(range(10, 20))
+    assert index.complete("title 1", 5) == []
+
+    index.add("title 000a", 1000)
+    assert index.complete("title", 5) == [42, 7, 99, 0, 1000]
+    for n in range(101, 105):
+        index.add(f"title 001{n}", n)
+    assert len(index) == 105
+    assert index.complete("title 001", 3) == [1, 101, 102]
+
+def test_books_added_here_are_inserted_in_place(app):
+    index = app.extensions['suggest_index']
+    with app.app_context():
+        assert _titles(index.suggest("dune")) == []
+        success, _ = add_book_to_catalog("Dune", "Frank Herbert", "9780441172719", 2)
+        assert success
+        assert _titles(index.suggest("dune")) == ["Dune"]
+        assert index.suggest("frank", 'author')[0]['author'] == "Frank Herbert"
+    assert (index.rebuilds, index.inserts) == (1, 1)
+
+def test_changes_made_elsewhere_trigger_a_rebuild(app):
+    index = app.extensions['suggest_index']
+    with app.app_context():
+        index.suggest("dune")
+        insert_book("Dune", "Frank Herbert", "9780441172719", 2, 2)
+        index.refresh()
+        assert _titles(index.suggest("dune")) == ["Dune"]
+        conn = get_db_connection()
+        conn.execute("UPDATE books SET title = 'Dune Messiah' WHERE isbn = '9780441172719'")
+        conn.commit()
+        conn.close()
+        index.refresh()
+        assert _titles(index.suggest("dune")) == ["Dune Messiah"]
+        index.refresh()
+    stats = index.stats()
+    assert (stats['rebuilds'], stats['reloads']) == (3, 1)
+
+def test_rebuilds_run_in_the_background(monkeypatch):
+    app = create_app({'RESPONSE_CACHE_ENABLED': False, 'SUGGEST_REFRESH_SECONDS': 0})
+    index = app.extensions['suggest_index']
+    with app.app_context():
+        index.suggest("dune")
+        insert_book("Dune", "Frank Herbert", "9780441172719", 2, 2)
+
+        read = services.suggest.get_catalog_search_rows
+        reading = threading.Event()
+        release = threading.Event()
+
+        def slow_read():
+            reading.set()
+            release.wait(5)
+            return read()
+
+        monkeypatch.setattr(services.suggest, 'get_catalog_search_rows', slow_read)
+        assert _titles(index.suggest("dune")) == []
+        assert reading.wait(5)
+        # Lookups are answered from the old index while the rebuild runs
+        assert _titles(index.suggest("the great")) == ["The Great Gatsby"]
+        assert add_book_to_catalog("Dune Messiah", "Frank Herbert", "9780593098233", 1)[0]
+        release.set()
+
+        deadline = time.monotonic() + 5
+        while index.stats()['rebuilds'] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert sorted(_titles(index.suggest("dune"))) == ["Dune", "Dune Messiah"]
+        assert index.version == get_meta_value('catalog_search_version')
+
+def test_suggest_api(app):
+    client = app.test_client()
+    response = client.get('/api/suggest?q=The%20Gr')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['count'] == 1 and data['suggestions'][0]['title'] == "The Great Gatsby"
+    assert client.get('/api/suggest?q=geo&type=author').get_json()['suggestions'][0]['author'] == "George Orwell"
+    assert client.get('/api/suggest?q=').get_json()['suggestions'] == []
+    assert client.get('/api/suggest?q=a&type=isbn').status_code == 400
+    assert client.get('/api/suggest?q=a&limit=0').status_code == 400
+    assert client.get('/api/admin/suggest').get_json()['titles'] == 3
@@ -0,0 +1,94 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import sqlite3
+import tempfile
+import threading
+import time
+import pytest
+from database import (
+    init_database, insert_book, get_book_by_id, get_db_connection,
+    contention_counters, is_lock_error, retry_on_lock
+)
+from services.library_service import borrow_book_by_patron
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    db_fd, temp_db = tempfile.mkstemp()
+    monkeypatch.setattr("database.DATABASE", temp_db)
+    init_database()
+    contention_counters.reset()
+    yield
+    os.close(db_fd)
+    os.unlink(temp_db)
+
+def _borrow_concurrently(patron_ids, book_id):
+    barrier = threading.Barrier(len(patron_ids))
+    results = {}
+
+    def borrow(patron_id):
+        barrier.wait()
+        results[patron_id] = borrow_book_by_patron(patron_id, book_id)
+
+    threads = [threading.Thread(target=borrow, args=(patron_id,)) for patron_id in patron_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_concurrent_borrows_never_over_issue():
+    insert_book("Bestseller", "Author", "1234567890001", 5, 5)
+    patron_ids = [f"{100000 + i}" for i in range(20)]
+
+    results = _borrow_concurrently(patron_ids, 1)
+
+    successes = [message for success, message in results.values() if success]
+    failures = [message for success, message in results.values() if not success]
+    assert len(successes) == 5
+    assert all(message == "This book is currently not available." for message in failures)
+    assert get_book_by_id(1)["available_copies"] == 0
+    conn = get_db_connection()
+    assert conn.execute("SELECT COUNT(*) FROM borrow_records").fetchone()[0] == 5
+    conn.close()
+
+def test_borrows_retry_while_another_writer_holds_the_lock(monkeypatch):
+    monkeypatch.setattr("database.BUSY_TIMEOUT_SECONDS", 0.01)
+    insert_book("Bestseller", "Author", "1234567890001", 5, 5)
+
+    locked = threading.Event()
+
+    def hold_write_lock():
+        conn = get_db_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        locked.set()
+        time.sleep(0.3)
+        conn.commit()
+        conn.close()
+
+    blocker = threading.Thread(target=hold_write_lock)
+    blocker.start()
+    locked.wait()
+    results = _borrow_concurrently(["100001", "100002", "100003"], 1)
+    blocker.join()
+
+    assert all(success for success, _ in results.values())
+    counters = contention_counters.snapshot()
+    assert counters["lock_errors"] > 0
+    assert counters["recovered"] == 3
+    assert counters["exhausted"] == 0
+
+def test_retry_gives_up_after_deadline():
+    def always_locked():
+        raise sqlite3.OperationalError("database is locked")
+
+    start = time.monotonic()
+    with pytest.raises(sqlite3.OperationalError):
+        retry_on_lock(always_locked, deadline=0.1)
+    assert time.monotonic() - start < 1.0
+    assert contention_counters.snapshot()["exhausted"] == 1
+
+def test_only_lock_errors_are_retried():
+    assert is_lock_error(sqlite3.OperationalError("database is locked"))
+    assert not is_lock_error(sqlite3.OperationalError("no such table: books"))
+    assert not is_lock_error(sqlite3.IntegrityError("UNIQUE constraint failed"))